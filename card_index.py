@@ -0,0 +1,164 @@
+"""
+godfield_cards.json の起動時インデックス。
+
+名前の表記ゆれ（＜＞付きなど）を事前に解決し、ルール層が毎リクエスト
+説明文を走査しなくて済むよう派生属性を CardRecord に焼き込んでおく。
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+import json
+import re
+
+_bracket_re = re.compile(r"[＜＞<>]")
+
+# 未登録名の解決結果もメモするが、UI の誤読で無限に増えないよう上限を置く
+MISS_MEMO_MAX = 4096
+
+
+def normalize_card_name(name: str) -> str:
+    name = _bracket_re.sub("", name)
+    return name.strip()
+
+
+class CardRecord(NamedTuple):
+    cid: str              # 短いID（compact エンコード時に db の代わりに送る）
+    name: str
+    category: str
+    attack: int           # "MP×2" のような非数値は 0
+    defense: int
+    price: Optional[int]
+    element: str
+    hit_rate: float
+    mp_cost: int
+    attack_class: str     # "other" / "plus" / "prob" / "main"（"main" は overlay で再判定）
+    single_forbidden: bool
+    recovery: bool
+    solo_only: bool       # 「単体でのみ用いることができる」
+    forced_element: str   # 攻撃属性を無条件で染める武器（発火/魔水のワンド）なら その属性
+    self_risk: float      # 与ダメージに対する自傷の期待割合（キネ 0.5 / 邪神の大剣 1.0）
+    info: Dict[str, Any]  # 元の DB エントリ（LLM へそのまま渡す用）
+
+
+def _as_int(v, default: int = 0) -> int:
+    return int(v) if isinstance(v, (int, float)) else default
+
+
+def _db_attack_class(category: str, description: str, hit_rate: float) -> str:
+    # classify_attack_card の DB 依存部分
+    if category not in ("weapon", "miracle"):
+        return "other"
+    if "追加" in description:
+        return "plus"
+    if hit_rate < 1.0:
+        return "prob"
+    return "main"
+
+
+_forced_element_re = re.compile(r"無条件で(.)属性にする")
+
+
+def _self_risk(description: str) -> float:
+    if "1/2の確率で自分" in description:
+        return 0.5
+    if "カードの使用者にも" in description:
+        return 1.0
+    return 0.0
+
+
+def build_record(entry: Dict[str, Any], cid: str = "") -> CardRecord:
+    category = entry.get("category") or ""
+    description = entry.get("description") or ""
+    hit_rate = entry.get("hit_rate", 1.0)
+    if not isinstance(hit_rate, (int, float)):
+        hit_rate = 1.0
+    price = entry.get("price")
+    forced = _forced_element_re.search(description)
+    return CardRecord(
+        cid=cid,
+        name=entry.get("name", ""),
+        category=category,
+        attack=_as_int(entry.get("attack")),
+        defense=_as_int(entry.get("defense")),
+        price=int(price) if isinstance(price, (int, float)) else None,
+        element=entry.get("element") or "無",
+        hit_rate=float(hit_rate),
+        mp_cost=_as_int(entry.get("mp_cost")),
+        attack_class=_db_attack_class(category, description, hit_rate),
+        single_forbidden="単体不可" in description,
+        recovery=(category == "heal" or "回復" in description
+                  or "HP+" in description or "MP+" in description),
+        solo_only="単体でのみ" in description,
+        forced_element=forced.group(1) if forced else "",
+        self_risk=_self_risk(description),
+        info=entry,
+    )
+
+
+# DB に無いカード用（旧コードの `lookup_card_db(...) or {}` 相当）
+UNKNOWN_CARD = build_record({})
+
+
+class CardIndex:
+    def __init__(self, entries: list):
+        self.records: Dict[str, CardRecord] = {}
+        for entry in entries:
+            if isinstance(entry, dict) and "name" in entry:
+                # ID は DB の並び順で固定（プロンプト prefix をバイト安定にするため）
+                cid = f"c{len(self.records)}"
+                self.records[entry["name"]] = build_record(entry, cid)
+        # 別名 → レコード（None はDBに無いことが確定した名前）
+        self._aliases: Dict[str, Optional[CardRecord]] = {}
+        for name, rec in self.records.items():
+            self._aliases[name] = rec
+            for alias in (f"＜{name}＞", f"<{name}>", f" {name} "):
+                self._aliases.setdefault(alias, rec)
+        self._misses = 0
+
+    @classmethod
+    def load(cls, path: Path, strict: bool = False) -> "CardIndex":
+        """strict=True なら読めない/壊れた DB で例外を投げる（ホットリロードで古い版を使い続ける用）。"""
+        if not path.exists():
+            if strict:
+                raise FileNotFoundError(path)
+            print(f"[GF AI] {path.name} not found; CARD_DB will be empty")
+            return cls([])
+        try:
+            entries = json.loads(path.read_text(encoding="utf-8"))
+            if strict and not isinstance(entries, list):
+                raise ValueError(f"{path.name}: expected a JSON array")
+            return cls(entries)
+        except Exception as e:
+            if strict:
+                raise
+            print("[GF AI] failed to load card DB:", e)
+            return cls([])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def raw(self) -> Dict[str, Dict[str, Any]]:
+        return {name: rec.info for name, rec in self.records.items()}
+
+    def lookup(self, name: str) -> Optional[CardRecord]:
+        try:
+            return self._aliases[name]
+        except KeyError:
+            pass
+        rec = self.records.get(normalize_card_name(name))
+        if rec is not None or self._misses < MISS_MEMO_MAX:
+            if rec is None:
+                self._misses += 1
+            self._aliases[name] = rec
+        return rec
+
+    def card_table(self, records: Optional[Iterable[CardRecord]] = None) -> str:
+        """カードの静的情報を TSV で返す（compact エンコードの参照表）。records を渡すとその行だけ。"""
+        cols = ("attack", "defense", "price", "element", "hit_rate", "mp_cost", "description")
+        lines = ["id\tname\tcategory\t" + "\t".join(cols)]
+        recs = self.records.values() if records is None else {r.cid: r for r in records}.values()
+        for rec in recs:
+            info = rec.info
+            vals = ["" if info.get(k) is None else str(info.get(k)) for k in cols]
+            lines.append(f"{rec.cid}\t{rec.name}\t{rec.category}\t" + "\t".join(vals))
+        return "\n".join(lines)
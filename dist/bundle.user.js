@@ -38,8 +38,12 @@
     lastStateSig: "",
     lastProgressAt: 0,
     forgiveLastSeenAt: 0,
-    lastHoverEl: null
+    lastHoverEl: null,
     // last element we hovered for detail panel
+    // サーバ側の対戦セッションID（タブごとに1つ）
+    sessionId: `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`,
+    // ★ WebSocket で差分だけ送る（つながらなければ HTTP /decide）
+    useWebSocket: true
   };
 
   // src/utils/logger.js
@@ -1482,7 +1486,97 @@
     };
   }
 
+  // src/transport/wsClient.js
+  function createWsClient({ url, onMessage }) {
+    let ws = null;
+    let open = false;
+    let seq = 0;
+    let baseSeq = null;
+    let lastSent = null;
+    let retryMs = 1e3;
+    let retryAt = 0;
+    function connect() {
+      if (ws || Date.now() < retryAt) return;
+      try {
+        ws = new WebSocket(url);
+      } catch (e) {
+        error("[GF AI WS] connect failed", e);
+        ws = null;
+        retryAt = Date.now() + 3e4;
+        return;
+      }
+      ws.onopen = () => {
+        open = true;
+        retryMs = 1e3;
+        resync();
+        log("[GF AI WS] connected", url);
+      };
+      ws.onmessage = (ev) => {
+        let msg;
+        try {
+          msg = JSON.parse(ev.data);
+        } catch (e) {
+          error("[GF AI WS] bad message", e);
+          return;
+        }
+        if (msg.resync) resync();
+        onMessage(msg);
+      };
+      ws.onclose = () => {
+        if (open) log("[GF AI WS] closed");
+        ws = null;
+        open = false;
+        resync();
+        retryAt = Date.now() + retryMs;
+        retryMs = Math.min(retryMs * 2, 3e4);
+      };
+      ws.onerror = () => {
+      };
+    }
+    function resync() {
+      baseSeq = null;
+      lastSent = null;
+    }
+    function isOpen() {
+      connect();
+      return open;
+    }
+    function send(payload, act) {
+      if (!isOpen()) return null;
+      const cur = {};
+      for (const k of Object.keys(payload)) cur[k] = JSON.stringify(payload[k]);
+      seq += 1;
+      const msg = { seq, act };
+      if (lastSent === null || baseSeq === null) {
+        msg.full = payload;
+      } else {
+        const delta = {};
+        for (const k of Object.keys(cur)) {
+          if (cur[k] !== lastSent[k]) delta[k] = payload[k];
+        }
+        for (const k of Object.keys(lastSent)) {
+          if (!(k in cur)) delta[k] = null;
+        }
+        msg.base = baseSeq;
+        msg.delta = delta;
+      }
+      try {
+        ws.send(JSON.stringify(msg));
+      } catch (e) {
+        error("[GF AI WS] send failed", e);
+        resync();
+        return null;
+      }
+      baseSeq = seq;
+      lastSent = cur;
+      return seq;
+    }
+    return { send, isOpen };
+  }
+
   // src/transport/serverClient.js
+  var SERVER_HTTP = "http://127.0.0.1:8000";
+  var SERVER_WS = "ws://127.0.0.1:8000/ws";
   function stateSigForDefer(state) {
     if (!state) return "";
     if (state.phase === "buy_choice") {
@@ -1497,6 +1591,7 @@
     function buildServerState(state) {
       return {
         phase: state.phase,
+        sessionId: globals.sessionId,
         me: state.me,
         enemy: state.enemy,
         hand: (state.hand || []).map((c) => ({
@@ -1554,43 +1649,46 @@
           actions2.useCardIndices([], st.phase, target);
       };
     }
-    function sendStateToServer(state) {
+    function handleServerAction(ai, state) {
+      if (globals.isCheckingMiracles || globals.isDoingAction) {
+        const sig = stateSigForDefer(state);
+        globals.deferredAction = {
+          ai,
+          sig,
+          stateSnapshot: state,
+          createdAt: Date.now()
+        };
+        log("[GF AI] deferred server response", sig);
+        return;
+      }
+      log("[GF AI SERVER RESPONSE]", ai);
+      const type = ai.type;
+      const indices = ai.cardIndices || [];
+      const target = ai.target || void 0;
+      if (type === "attack") {
+        rememberLastAttackSig(indices, state.hand);
+      }
+      if (type === "buy_choice") actions2.handleBuyChoice(ai);
+      else if (type === "exchange")
+        actions2.performRyougae(indices, state, ai.exchange);
+      else if (type === "sell") actions2.performUru(indices, state);
+      else if (type === "buy") actions2.performKau(indices, state);
+      else if (type === "attack" || type === "defend" || type === "shield")
+        actions2.useCardIndices(indices, state.phase, target);
+      else if (type === "attack-pass" || type === "defense-pass")
+        actions2.useCardIndices([], state.phase, target);
+    }
+    function sendHttp(state) {
       const payload = buildServerState(state);
       GM_xmlhttpRequest({
         method: "POST",
-        url: "http://127.0.0.1:8000/decide",
+        url: `${SERVER_HTTP}/decide`,
         headers: { "Content-Type": "application/json" },
         data: JSON.stringify(payload),
         onload: (response) => {
           try {
             const ai = JSON.parse(response.responseText);
-            if (globals.isCheckingMiracles || globals.isDoingAction) {
-              const sig = stateSigForDefer(state);
-              globals.deferredAction = {
-                ai,
-                sig,
-                stateSnapshot: state,
-                createdAt: Date.now()
-              };
-              log("[GF AI] deferred server response", sig);
-              return;
-            }
-            log("[GF AI SERVER RESPONSE]", ai);
-            const type = ai.type;
-            const indices = ai.cardIndices || [];
-            const target = ai.target || void 0;
-            if (type === "attack") {
-              rememberLastAttackSig(indices, state.hand);
-            }
-            if (type === "buy_choice") actions2.handleBuyChoice(ai);
-            else if (type === "exchange")
-              actions2.performRyougae(indices, state, ai.exchange);
-            else if (type === "sell") actions2.performUru(indices, state);
-            else if (type === "buy") actions2.performKau(indices, state);
-            else if (type === "attack" || type === "defend" || type === "shield")
-              actions2.useCardIndices(indices, state.phase, target);
-            else if (type === "attack-pass" || type === "defense-pass")
-              actions2.useCardIndices([], state.phase, target);
+            handleServerAction(ai, state);
           } catch (e) {
             error("[GF AI CLIENT ERROR]", e);
           }
@@ -1600,7 +1698,38 @@
         }
       });
     }
-    return { sendStateToServer };
+    const wsPending = /* @__PURE__ */ new Map();
+    const WS_PENDING_MAX = 8;
+    function onWsMessage(msg) {
+      const state = wsPending.get(msg.seq);
+      if (!state) return;
+      wsPending.delete(msg.seq);
+      if (msg.action) {
+        handleServerAction(msg.action, state);
+      } else if (msg.resync && !msg.error) {
+        sendStateToServer(state);
+      } else {
+        error("[GF AI WS SERVER ERROR]", msg.error);
+        sendHttp(state);
+      }
+    }
+    const wsClient = createWsClient({ url: SERVER_WS, onMessage: onWsMessage });
+    function sendStateToServer(state) {
+      if (globals.useWebSocket) {
+        const seq = wsClient.send(buildServerState(state), true);
+        if (seq !== null) {
+          wsPending.set(seq, state);
+          if (wsPending.size > WS_PENDING_MAX)
+            wsPending.delete(wsPending.keys().next().value);
+          return;
+        }
+      }
+      sendHttp(state);
+    }
+    function observeState(state) {
+      if (globals.useWebSocket) wsClient.send(buildServerState(state), false);
+    }
+    return { sendStateToServer, observeState };
   }
 
   // src/transport/pollingLoop.js
@@ -1610,6 +1739,8 @@
     readState: readState2,
     shouldActNow,
     sendStateToServer,
+    observeState,
+    // ★追加（任意）：行動しない tick の状態変化を送る
     maybeCheckMiracles,
     escapeDefensePass
     // ★追加（任意）
@@ -1632,7 +1763,8 @@
         globals2.lastState = state;
         const now = Date.now();
         const sig = stateSig(state);
-        if (sig !== globals2.lastStateSig) {
+        const changed = sig !== globals2.lastStateSig;
+        if (changed) {
           globals2.lastStateSig = sig;
           globals2.lastProgressAt = now;
         }
@@ -1664,6 +1796,8 @@
         }
         if (shouldActNow(state)) {
           sendStateToServer(state);
+        } else if (changed && observeState) {
+          observeState(state);
         }
         maybeCheckMiracles(state);
         if (typeof globals2.flushDeferredAction === "function") {
@@ -1718,6 +1852,7 @@
     readState: stateReader.readState,
     shouldActNow: phaseGuards.shouldActNow,
     sendStateToServer: serverClient.sendStateToServer,
+    observeState: serverClient.observeState,
     maybeCheckMiracles: phaseGuards.maybeCheckMiracles,
     escapeDefensePass: () => actions.useCardIndices([], "defense")
   });
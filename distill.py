@@ -0,0 +1,204 @@
+"""
+判断トレースから (state の特徴, LLM の最終判断) の組を取り出し、policy.LocalPolicy を学習・評価する。
+
+  python distill.py train ai_trace.jsonl --out policy_model.json
+  python distill.py eval ai_trace.jsonl --model policy_model.json --min-conf 0.9
+
+使う record は kind=decision で LLM が答えたもの（フォールバック・エラー・先読みの仮定 state は除く）。
+ローテーション済みのファイル(.gz 可)やディレクトリも渡せる。held-out はセッション名のハッシュで
+分けるので、同じ対戦の判断が学習と評価に跨らず、同じトレースなら毎回同じ分け方になる。
+
+学習は候補上の softmax の負の対数尤度 + L2 を、全バッチの勾配法で固定回数まわすだけ
+（乱数なし・CPU のみ）。評価では held-out に対して
+  - acc         : 方策で表せる判断（covered）のうち、確率1位が LLM と一致した割合
+  - solver_acc  : 同じ判断をソルバーの1位で当てた割合（比較用）
+  - fired / agree : 確率が --min-conf 以上でサーバーが LLM を省く割合と、そのときの一致率
+を出す。
+"""
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import argparse
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from card_index import CardIndex
+from policy import Candidate, LocalPolicy, applicable, candidates, hidden_enemy, label_of
+from simulator import card_views
+from trace_log import git_rev, iter_records
+
+BASE_DIR = Path(__file__).resolve().parent
+CARD_DB_PATH = BASE_DIR / "godfield_cards.json"
+PHASES = ("attack", "defense")
+
+
+class Sample(NamedTuple):
+    session: str
+    phase: str
+    cands: List[Candidate]
+    X: np.ndarray
+    y: Optional[int]     # LLM の判断が何番目の候補か（候補に無い手なら None）
+    applicable: bool
+
+
+def iter_decisions(paths: Sequence[Path]):
+    for path in paths:
+        files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+        for f in files:
+            for rec in iter_records(f):
+                if (isinstance(rec, dict) and rec.get("kind") == "decision"
+                        and rec.get("llm") is not None and rec.get("final")
+                        and not rec.get("fallback") and not rec.get("error")
+                        and not rec.get("speculative") and isinstance(rec.get("state"), dict)):
+                    yield rec
+
+
+def extract(paths: Sequence[Path], index: CardIndex) -> List[Sample]:
+    out = []
+    for rec in iter_decisions(paths):
+        state = rec["state"]
+        phase = rec.get("prompt_key") or state.get("phase")
+        if phase not in PHASES:
+            continue
+        me, enemy = state["me"], state["enemy"]
+        hand = card_views(state.get("hand") or [])
+        hidden = hidden_enemy([s["name"] for s in me.get("statuses") or []])
+        cands, X = candidates(phase, hand, card_views(state.get("incomingCards") or []),
+                              me["hp"], me["mp"], enemy["hp"], index)
+        final = rec["final"]
+        out.append(Sample(str(rec.get("session")), phase, cands, X,
+                          label_of(cands, final.get("type"), final.get("cardIndices")),
+                          applicable(phase, hand, index, hidden)))
+    return out
+
+
+def is_holdout(session: str, frac: float) -> bool:
+    return zlib.crc32(session.encode("utf-8")) % 1000 < frac * 1000
+
+
+def fit(samples: Sequence[Sample], l2: float = 1e-3, iters: int = 500, lr: float = 0.5) -> tuple:
+    """(重み, 最終の平均負対数尤度)。候補が1つしか無い判断は勾配に効かないので使わない。"""
+    usable = [s for s in samples if s.applicable and s.y is not None and len(s.cands) > 1]
+    if not usable:
+        return None, None
+    X = np.vstack([s.X for s in usable])
+    counts = np.array([len(s.cands) for s in usable])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    picked = starts + np.array([s.y for s in usable])
+    target = X[picked].sum(axis=0)
+    w = np.zeros(X.shape[1])
+    n = len(usable)
+    nll = 0.0
+    for _ in range(iters):
+        z = X @ w
+        z = z - np.repeat(np.maximum.reduceat(z, starts), counts)
+        e = np.exp(z)
+        total = np.add.reduceat(e, starts)
+        p = e / np.repeat(total, counts)
+        nll = float((np.log(total) - z[picked]).mean())
+        w -= lr * ((X.T @ p - target) / n + l2 * w)
+    return w, nll
+
+
+def evaluate(policy: LocalPolicy, samples: Sequence[Sample], min_conf: float) -> Dict[str, dict]:
+    report = {}
+    for phase in PHASES + ("all",):
+        rows = [s for s in samples if phase in ("all", s.phase)]
+        r = dict.fromkeys(("n", "applicable", "covered", "correct", "solver_correct",
+                           "fired", "agree"), 0)
+        for s in rows:
+            r["n"] += 1
+            if not s.applicable or s.phase not in policy.weights:
+                continue
+            r["applicable"] += 1
+            p = policy.probs(s.phase, s.X)
+            best = int(p.argmax())
+            if s.y is not None:
+                r["covered"] += 1
+                r["correct"] += best == s.y
+                r["solver_correct"] += s.y == 0
+            if p[best] >= min_conf:
+                r["fired"] += 1
+                r["agree"] += best == s.y
+        r["acc"] = round(r["correct"] / r["covered"], 4) if r["covered"] else None
+        r["solver_acc"] = round(r["solver_correct"] / r["covered"], 4) if r["covered"] else None
+        r["fired_rate"] = round(r["fired"] / r["n"], 4) if r["n"] else None
+        r["agree_rate"] = round(r["agree"] / r["fired"], 4) if r["fired"] else None
+        report[phase] = r
+    return report
+
+
+def print_report(title: str, report: Dict[str, dict], min_conf: float):
+    print(f"[GF DISTILL] {title} (min_conf {min_conf})")
+    for phase, r in report.items():
+        if not r["n"]:
+            continue
+        print(f"  {phase:<8} n={r['n']:<6} covered {r['covered']:<6} acc {_pct(r['acc'])} "
+              f"(solver {_pct(r['solver_acc'])})  fired {_pct(r['fired_rate'])} "
+              f"agree {_pct(r['agree_rate'])}")
+
+
+def _pct(v: Optional[float]) -> str:
+    return "   -  " if v is None else f"{v:6.1%}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=("train", "eval"))
+    ap.add_argument("traces", nargs="*", type=Path, default=[BASE_DIR / "ai_trace.jsonl"],
+                    help="判断トレース（ファイル / ディレクトリ）")
+    ap.add_argument("--holdout", type=float, default=0.2, help="評価に回すセッションの割合")
+    ap.add_argument("--min-conf", type=float, default=0.9, help="サーバーが方策を使う確率の下限")
+    ap.add_argument("--l2", type=float, default=1e-3)
+    ap.add_argument("--iters", type=int, default=500)
+    ap.add_argument("--lr", type=float, default=0.5)
+    ap.add_argument("--out", type=Path, default=BASE_DIR / "policy_model.json", help="train の保存先")
+    ap.add_argument("--model", type=Path, default=BASE_DIR / "policy_model.json", help="eval するモデル")
+    ap.add_argument("--all", action="store_true", help="eval で held-out だけでなく全件を使う")
+    args = ap.parse_args(argv)
+
+    index = CardIndex.load(CARD_DB_PATH)
+    samples = extract(args.traces, index)
+    test = [s for s in samples if is_holdout(s.session, args.holdout)]
+    train = [s for s in samples if not is_holdout(s.session, args.holdout)]
+    print(f"[GF DISTILL] {len(samples)} decisions ({len(train)} train / {len(test)} held-out, "
+          f"{len({s.session for s in samples})} sessions)")
+
+    if args.command == "eval":
+        policy = LocalPolicy.load(args.model)
+        print_report("all" if args.all else "held-out", evaluate(policy, samples if args.all else test,
+                                                                args.min_conf), args.min_conf)
+        return 0
+
+    t = time.perf_counter()
+    weights, nll = {}, {}
+    for phase in PHASES:
+        w, loss = fit([s for s in train if s.phase == phase], args.l2, args.iters, args.lr)
+        if w is not None:
+            weights[phase], nll[phase] = w, round(loss, 4)
+    if not weights:
+        print("[GF DISTILL] no usable training decisions")
+        return 1
+    policy = LocalPolicy(weights)
+    train_report = evaluate(policy, train, args.min_conf)
+    test_report = evaluate(policy, test, args.min_conf)
+    print(f"[GF DISTILL] trained {sorted(weights)} in {time.perf_counter() - t:.2f}s, nll {nll}")
+    print_report("train", train_report, args.min_conf)
+    print_report("held-out", test_report, args.min_conf)
+    policy.meta = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": git_rev(),
+        "traces": [str(p) for p in args.traces],
+        "params": {"holdout": args.holdout, "l2": args.l2, "iters": args.iters, "lr": args.lr},
+        "nll": nll,
+        "held_out": test_report,
+    }
+    policy.save(args.out)
+    print(f"[GF DISTILL] saved {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+/decide の LLM 以外の処理（1リクエストぶん）を段階ごとに測るマイクロベンチマーク。
+
+10枚の手札 + 相手の攻撃カード2枚 + 自分に霧、の defense state を固定で使い、
+各段階を --iters 回まわして 1回あたりの CPU 時間(us)と、tracemalloc で測った
+一時確保のピーク(KiB)を出す。LLM は呼ばない（応答は固定文字列）。
+
+変更前後の比較は replay_bench と同じく結果 JSON を保存して突き合わせる:
+  git stash && python hotpath_bench.py --out bench/hot_before.json && git stash pop
+  python hotpath_bench.py --baseline bench/hot_before.json
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from trace_log import git_rev
+
+HAND = ["銅のこん棒", "硬いつち", "エルボーサック", "火の玉", "氷", "革の帽子",
+        "スカイブーツ", "アクアシューズ", "虹のカーテン", "売る"]
+INCOMING = ["ジェットヨーヨー", "硬いつち"]
+LLM_ANSWER = '{"type":"defend","cardIndices":[8,5,6,7],"reason":"虹で無属性化して防具を重ねる"}'
+
+
+def bench_state(session_id: str = "hotpath") -> Dict[str, Any]:
+    def player(name, statuses=()):
+        return {"name": name, "hp": 24, "mp": 12, "gold": 18,
+                "statuses": [{"name": s, "raw_text": f"{s}（残り2ターン）"} for s in statuses]}
+
+    def card(i, name, usable=True):
+        return {"index": i, "name": name, "overlay": "", "usable": usable,
+                "raw_text": f"{name} のカード説明テキスト。ホバー時に表示される文章をそのまま送ってくる。"}
+
+    return {
+        "phase": "defense",
+        "sessionId": session_id,
+        "gf": {"current": 3, "max": 10},
+        "me": player("me", ["霧"]),
+        "enemy": player("enemy"),
+        "hand": [card(i, n, usable=n not in ("銅のこん棒", "火の玉", "氷")) for i, n in enumerate(HAND)],
+        "incomingCards": [{k: v for k, v in card(i, n).items() if k != "usable"}
+                          for i, n in enumerate(INCOMING)],
+        "seenMiracles": {"me": ["火の玉"], "enemy": ["氷", "火の玉"]},
+    }
+
+
+def stages(server, body: bytes) -> List[tuple]:
+    """(名前, 引数なし関数) のリスト。順に実行すると1リクエストぶんになる。"""
+    ctx: Dict[str, Any] = {}
+    session = server.SESSIONS.get("hotpath")
+
+    def parse():
+        ctx["state"] = server.GFState(**json.loads(body))
+
+    def history():
+        server.update_history(session, ctx["state"])
+
+    def signature():
+        server.state_signature(ctx["state"])
+
+    def encode():
+        ctx["text"], ctx["size"] = server.encode_llm_state(ctx["state"], session)
+
+    def llm_parse():
+        ctx["llm"] = server.parse_llm_json(LLM_ANSWER)
+
+    def sanitize():
+        d = ctx["llm"]
+        ctx["final"] = server.sanitize_strict_rules(d["type"], d["cardIndices"], ctx["state"])
+
+    def trace():
+        t, idx, _ = ctx["final"]
+        action = server.Action(type=t, cardIndices=idx, reason=ctx["llm"]["reason"])
+        ctx["action"] = action
+        server.trace_decision(ctx["state"], session, {"llm": 0.0}, payload=ctx["size"],
+                              raw_txt=LLM_ANSWER, llm=ctx["llm"], action=action)
+
+    def response():
+        ctx["action"].model_dump_json()
+
+    return [("parse", parse), ("update_history", history), ("signature", signature),
+            ("encode_llm_state", encode), ("llm_parse", llm_parse),
+            ("sanitize_strict_rules", sanitize), ("trace_decision", trace), ("response", response)]
+
+
+def measure(steps: List[tuple], iters: int) -> Dict[str, Dict[str, float]]:
+    cpu = {name: 0.0 for name, _ in steps}
+    for _ in range(max(1, iters // 10)):  # 暖機
+        for _, fn in steps:
+            fn()
+    for _ in range(iters):
+        for name, fn in steps:
+            t = time.process_time()
+            fn()
+            cpu[name] += time.process_time() - t
+
+    # 確保量は別パス（tracemalloc 自体が遅いので CPU 計測とは分ける）。
+    # 段階の開始時点からのピーク増分 = その段階が一時的に抱えたメモリ量
+    alloc_iters = max(1, iters // 10)
+    peak = {name: 0 for name, _ in steps}
+    tracemalloc.start()
+    for _ in range(alloc_iters):
+        for name, fn in steps:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn()
+            peak[name] += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    out = {name: {"cpu_us": round(cpu[name] / iters * 1e6, 2),
+                  "peak_kib": round(peak[name] / alloc_iters / 1024, 2)}
+           for name, _ in steps}
+    out["total"] = {k: round(sum(v[k] for v in out.values()), 2) for k in ("cpu_us", "peak_kib")}
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iters", type=int, default=2000)
+    ap.add_argument("--out", type=Path, default=None, help="結果 JSON の保存先")
+    ap.add_argument("--baseline", type=Path, default=None, help="比較する過去の結果 JSON")
+    args = ap.parse_args(argv)
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="gf-hotpath-")
+    os.environ["GF_TRACE_PATH"] = str(Path(tmpdir.name) / "trace.jsonl")
+    sys.path.insert(0, str(Path(__file__).parent))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import server
+
+    body = json.dumps(bench_state(), ensure_ascii=False).encode("utf-8")
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        result_stages = measure(stages(server, body), args.iters)
+    server.TRACE.close()
+
+    result = {
+        "meta": {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": git_rev(),
+            "python": sys.version.split()[0],
+            "encoding": server.STATE_ENCODING,
+            "json": "orjson" if getattr(server, "orjson", None) else "json",
+            "iters": args.iters,
+        },
+        "stages": result_stages,
+    }
+    before = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    print(f"[GF HOTPATH] {len(HAND)}-card hand, {len(INCOMING)} incoming, "
+          f"{args.iters} iters, json={result['meta']['json']}")
+    for name, row in result_stages.items():
+        line = f"  {name:<22} cpu {row['cpu_us']:>9.2f} us   peak {row['peak_kib']:>8.2f} KiB"
+        b = (before or {}).get("stages", {}).get(name)
+        if b:
+            line += f"   ({_delta(b['cpu_us'], row['cpu_us'])} cpu, {_delta(b['peak_kib'], row['peak_kib'])} mem)"
+        print(line)
+    if before:
+        print(f"[GF HOTPATH] vs baseline {before.get('meta', {}).get('git')}")
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[GF HOTPATH] saved {args.out}")
+    tmpdir.cleanup()
+    return 0
+
+
+def _delta(a: float, b: float) -> str:
+    return f"{(b - a) / a * 100:+.1f}%" if a else "-"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
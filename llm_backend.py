@@ -0,0 +1,275 @@
+"""
+LLM バックエンドの差し替え口と、その手前に置く再試行 / サーキットブレーカー。
+
+バックエンドは create(messages, stream) で OpenAI の chat.completions と同じ形の応答
+（stream=True なら chunk の async iterator と close()）を返せばよい。
+  - OpenAIBackend : 接続プール付きの AsyncOpenAI（SDK 側の再試行は切って RetryPolicy に任せる）
+  - StubBackend   : ネットワーク無しで動く決定的スタブ。失敗/ハングを混ぜてブレーカーを試せる
+
+RetryPolicy は「つながらない・5xx・429」のような一時的な失敗だけを、
+上限付きの指数バックオフ（full jitter）で呼び直す。
+CircuitBreaker は連続失敗が threshold 回に達したら cooldown 秒間 LLM を呼ばせず、
+その後は1件だけ試しに通して（half-open）成功すれば元に戻す。
+"""
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import random
+import time
+import types
+
+
+class LLMBackend:
+    name = "base"
+
+    async def create(self, messages: List[dict], stream: bool = False) -> Any:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model: str, max_connections: int = 20, keepalive: int = 10,
+                 keepalive_expiry: float = 60.0):
+        self.model = model
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self._client = None
+
+    def client(self):
+        # openai / httpx の import は重いので最初の呼び出し（か warmup）まで遅らせる
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.keepalive,
+                                  keepalive_expiry=self.keepalive_expiry)
+            self._client = AsyncOpenAI(max_retries=0,
+                                       http_client=DefaultAsyncHttpxClient(limits=limits))
+        return self._client
+
+    async def create(self, messages: List[dict], stream: bool = False) -> Any:
+        if stream:
+            return await self.client().chat.completions.create(
+                model=self.model, messages=messages,
+                stream=True, stream_options={"include_usage": True})
+        return await self.client().chat.completions.create(model=self.model, messages=messages)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+
+
+# ================== スタブ ==================
+
+def _unit(text: str) -> float:
+    h = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") / 2 ** 64
+
+
+def stub_answer(user_content: str, reason_chars: int) -> str:
+    """payload の attack_candidates / defense_plan の先頭案をそのまま返す。"""
+    try:
+        s = json.loads(user_content)
+    except ValueError:
+        s = {}
+    phase = s.get("phase", "")
+    out: Dict[str, Any] = {"type": "none", "cardIndices": []}
+    if phase == "attack":
+        cands = s.get("attack_candidates") or []
+        out = {"type": "attack", "cardIndices": cands[0]["cardIndices"]} if cands \
+            else {"type": "attack-pass", "cardIndices": []}
+    elif phase == "defense":
+        opts = (s.get("defense_plan") or {}).get("options") or []
+        out = {"type": "defend", "cardIndices": opts[0]["cardIndices"]} if opts \
+            else {"type": "defense-pass", "cardIndices": []}
+    elif phase in ("buy_choice", "buy-choice"):
+        out = {"type": "buy_choice", "cardIndices": [], "buy": 0}
+    out["reason"] = "r" * reason_chars
+    return json.dumps(out, ensure_ascii=False)
+
+
+class StubBackendError(Exception):
+    """StubBackend が注入する失敗（status_code 付きで、一時的な失敗として扱われる）。"""
+
+    def __init__(self, status_code: int = 503):
+        super().__init__(f"stub backend error {status_code}")
+        self.status_code = status_code
+
+
+class _StubStream:
+    def __init__(self, parts: List[str], delay: float, ttft_ratio: float, usage):
+        self._parts = parts
+        self._first = delay * ttft_ratio
+        self._per = (delay - self._first) / max(1, len(parts) - 1)
+        self._usage = usage
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for n, part in enumerate(self._parts):
+            await asyncio.sleep(self._first if n == 0 else self._per)
+            yield types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=part))],
+                usage=None)
+        yield types.SimpleNamespace(choices=[], usage=self._usage)
+
+    async def close(self):
+        pass
+
+
+class StubBackend(LLMBackend):
+    """
+    決定的なスタブ。遅延は llm_ms + jitter_ms * (入力ハッシュ由来の 0〜1)。
+    fail_rate の割合の呼び出しを fail_mode で失敗させる（"error" は 503、"hang" は返らない）。
+    """
+    name = "stub"
+
+    def __init__(self, llm_ms: float = 50.0, jitter_ms: float = 0.0, ttft_ratio: float = 0.5,
+                 reason_chars: int = 120, chunk_chars: int = 8, fail_rate: float = 0.0,
+                 fail_mode: str = "error", seed: int = 0):
+        self.llm_ms = llm_ms
+        self.jitter_ms = jitter_ms
+        self.ttft_ratio = ttft_ratio
+        self.reason_chars = reason_chars
+        self.chunk_chars = chunk_chars
+        self.fail_rate = fail_rate
+        self.fail_mode = fail_mode
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+
+    async def create(self, messages: List[dict], stream: bool = False) -> Any:
+        self.calls += 1
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            self.failures += 1
+            if self.fail_mode == "hang":
+                await asyncio.Event().wait()
+            await asyncio.sleep(self.llm_ms / 1000.0 * 0.1)
+            raise StubBackendError()
+        user = messages[-1]["content"]
+        text = stub_answer(user, self.reason_chars)
+        delay = (self.llm_ms + self.jitter_ms * _unit(user)) / 1000.0
+        prefix_len = sum(len(m["content"]) for m in messages[:-1])
+        usage = types.SimpleNamespace(
+            prompt_tokens=(prefix_len + len(user)) // 3,
+            completion_tokens=len(text) // 3,
+            prompt_tokens_details=types.SimpleNamespace(cached_tokens=prefix_len // 3))
+        if stream:
+            parts = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+            return _StubStream(parts, delay, self.ttft_ratio, usage)
+        await asyncio.sleep(delay)
+        msg = types.SimpleNamespace(content=text)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)], usage=usage)
+
+
+# ================== 再試行 / ブレーカー ==================
+
+_RETRYABLE_NAMES = ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout",
+                    "RemoteProtocolError")
+
+
+def retryable(e: BaseException) -> bool:
+    """つながらない・タイムアウト・429/5xx だけを一時的な失敗とみなす（400/401 などは呼び直さない）。"""
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(e, (ConnectionError, TimeoutError)) or type(e).__name__ in _RETRYABLE_NAMES
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, base: float = 0.2, cap: float = 2.0,
+                 rng: Optional[random.Random] = None):
+        self.attempts = max(1, attempts)
+        self.base = base
+        self.cap = cap
+        self.retries = 0
+        self._rng = rng or random.Random()
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter: 0〜min(cap, base * 2^attempt) から一様に選ぶ
+        return self._rng.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+    async def run(self, fn: Callable[[], Any], on_retry: Optional[Callable] = None) -> Any:
+        for attempt in range(self.attempts):
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt + 1 >= self.attempts or not retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                self.retries += 1
+                if on_retry:
+                    on_retry(attempt + 1, delay, e)
+                await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.on_change = on_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_at: Optional[float] = None
+
+    def _set(self, state: str):
+        if state != self.state:
+            self.state = state
+            if self.on_change:
+                self.on_change(state)
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._set(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            now = time.monotonic()
+            # 試しに1件だけ通す（結果が返ってこないまま cooldown が過ぎたらもう1件）
+            if self._probe_at is None or now - self._probe_at >= self.cooldown:
+                self._probe_at = now
+                return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """allow() で通したが呼び出さなかったとき、半開の試行枠を返す。"""
+        self._probe_at = None
+
+    def success(self):
+        self.failures = 0
+        self._probe_at = None
+        self._set(self.CLOSED)
+
+    def failure(self):
+        self.failures += 1
+        self._probe_at = None
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set(self.OPEN)
+
+    def stats(self) -> dict:
+        out = {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+        if self.state == self.OPEN:
+            out["retry_in_sec"] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 2)
+        return out
+
+
+def make_backend(kind: str, model: str, **kw) -> LLMBackend:
+    if kind == "stub":
+        return StubBackend(**kw)
+    if kind == "openai":
+        return OpenAIBackend(model, **kw)
+    raise ValueError(f"unknown LLM backend: {kind}")
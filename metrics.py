@@ -0,0 +1,113 @@
+"""
+Prometheus テキスト形式のカウンタ / ヒストグラム。
+
+記録側はバケット探索と加算だけで、文字列化はスクレイプ時(/metrics)にしか行わない。
+更新はイベントループのスレッドからのみ行う前提でロックは取らない。
+"""
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+# 秒。ルール層(～ms)から LLM(～数十秒)までを一本でカバーする
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), enabled: bool = True):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.enabled = enabled
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, n: float = 1):
+        if not self.enabled:
+            return
+        self._values[labels] = self._values.get(labels, 0) + n
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_num(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, enabled: bool = True):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.enabled = enabled
+        # labels -> [バケットごとの件数(累積ではない)..., +Inf], 合計, 件数
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not self.enabled:
+            return
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        s[0][bisect_left(self.buckets, value)] += 1
+        s[1] += value
+        s[2] += 1
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return s[2] if s else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, n) in sorted(self._series.items()):
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                bucket = _labels(self.label_names, labels, 'le="%s"' % _num(le))
+                lines.append(f"{self.name}_bucket{bucket} {acc}")
+            bucket = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: list = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        m = Counter(name, help, labels, enabled=self.enabled)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labels, buckets, enabled=self.enabled)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,137 @@
+"""
+確率カードを使う攻撃を NumPy でまとめてサンプリングする評価器。
+
+期待ダメージ1つに潰すと「50%攻10」と「確定の攻5」の差が消えるが、
+相手HPが5のときは勝負を分ける。ここでは候補ごとに数千回ぶんの
+命中/外れ・キネの向き・相手の防御を一括で引き、撃破率とダメージ分布を返す。
+
+相手の防御は手札が見えないので、DB から引いた ENEMY_HAND 枚の手札で
+「その属性に相性の合う防具を全部重ねた守備力」の分布を起動時に作っておき、
+そこから引く（虹のカーテンがあれば無属性化、スーパーミラー/壁は完全防御扱い）。
+乱数の種は固定なので、同じ state には同じ結果（= 同じ payload）を返す。
+防御側は「当たれば loss、外れれば0」の1回の命中判定だけなので、solvers.defense_options が
+期待値と致死率を厳密に出しており、ここでは扱わない。
+"""
+from typing import Dict, NamedTuple, Optional, Sequence
+import numpy as np
+
+from card_index import CardIndex
+from solvers import ELEMENTS, AttackOption, armor_blocks
+
+ENEMY_HAND = 8
+PRIOR_SAMPLES = 20000
+BLOCKED = 999  # ミラー/壁で止まった攻撃の守備力
+
+
+class Outcome(NamedTuple):
+    kill_prob: float        # 相手のHPが0以下になる確率
+    self_kill_prob: float   # 攻撃側が自滅する確率（キネ/邪神の大剣）
+    mean: float             # 与ダメージの平均
+    quantiles: tuple        # 与ダメージの (p10, p50, p90)
+    dist: Dict[int, float]  # 与ダメージ -> 確率
+
+    def as_dict(self) -> dict:
+        return {
+            "kill_prob": round(self.kill_prob, 3),
+            "self_kill_prob": round(self.self_kill_prob, 3),
+            "damage_p10": self.quantiles[0],
+            "damage_p50": self.quantiles[1],
+            "damage_p90": self.quantiles[2],
+        }
+
+
+def _quantiles(samples: np.ndarray) -> list[tuple]:
+    """行ごとの (p10, p50, p90)。"""
+    s = np.sort(samples, axis=1)
+    n = s.shape[1]
+    cols = s[:, [n // 10, n // 2, (n * 9) // 10]]
+    return [tuple(int(v) for v in row) for row in cols]
+
+
+def _dist(row: np.ndarray) -> Dict[int, float]:
+    counts = np.bincount(row)
+    nz = np.flatnonzero(counts)
+    return {int(v): float(counts[v]) / row.size for v in nz}
+
+
+class MonteCarlo:
+    def __init__(self, index: CardIndex, samples: int = 2048, seed: int = 0,
+                 enemy_hand: int = ENEMY_HAND):
+        self.samples = samples
+        self.seed = seed
+        self._prior = self._shield_prior(index, enemy_hand, np.random.default_rng(seed))
+
+    @staticmethod
+    def _shield_prior(index: CardIndex, hand_size: int, rng) -> Dict[str, np.ndarray]:
+        deck = [r for r in index.records.values()
+                if r.category in ("weapon", "armor", "miracle", "heal", "trade")]
+        if not deck:
+            return {e: np.zeros(PRIOR_SAMPLES, dtype=np.int32) for e in ELEMENTS}
+        names = [r.name for r in deck]
+        shield = np.array([r.defense if r.category in ("armor", "weapon") else 0 for r in deck])
+        rainbow = np.array([n == "虹のカーテン" for n in names])
+        mirror = np.array([n == "スーパーミラー" for n in names])
+        wall = np.array([n == "壁" for n in names])
+        hands = rng.integers(0, len(deck), (PRIOR_SAMPLES, hand_size))
+        has_rainbow = rainbow[hands].any(axis=1)
+        has_mirror = mirror[hands].any(axis=1)
+        has_wall = wall[hands].any(axis=1)
+        all_armor = shield[hands].sum(axis=1)
+        prior = {}
+        for e in ELEMENTS:
+            compat = np.array([armor_blocks(e, r.element) for r in deck])
+            s = np.where(has_rainbow, all_armor, (shield * compat)[hands].sum(axis=1))
+            blocked = has_mirror | (has_wall & (has_rainbow | (e == "無")))
+            prior[e] = np.where(blocked, BLOCKED, s).astype(np.int32)
+        return prior
+
+    def shield_prior(self, element: str) -> np.ndarray:
+        return self._prior.get(element, self._prior["無"])
+
+    def evaluate_attacks(self, options: Sequence[AttackOption], enemy_hp: int,
+                         my_hp: Optional[int] = None, with_dist: bool = False) -> list[Outcome]:
+        """攻撃候補をまとめて評価する（全候補で同じ乱数列を使うので比較がぶれない）。"""
+        if not options:
+            return []
+        n = self.samples
+        rng = np.random.default_rng(self.seed)
+        dmg = np.array([o.damage for o in options], dtype=np.int32)[:, None]
+        hit = np.array([o.hit_rate for o in options])[:, None]
+        # AttackOption は self_damage = damage * hit * risk を持っている
+        risk = np.array([o.self_damage / (o.damage * o.hit_rate) if o.damage * o.hit_rate > 0 else 0.0
+                         for o in options])[:, None]
+
+        pick = rng.integers(0, PRIOR_SAMPLES, n)
+        shield = np.stack([self.shield_prior(o.element)[pick] for o in options])
+        u_hit = rng.random(n)
+        u_dir = rng.random(n)
+
+        hits = u_hit < hit
+        dealt = dmg - shield
+        np.maximum(dealt, 0, out=dealt)
+        for i, o in enumerate(options):
+            if o.element == "闇":
+                # 闇は1点でも通れば即死
+                row = dealt[i]
+                np.maximum(row, enemy_hp, out=row, where=row > 0)
+        self_hit = None
+        if (risk > 0).any():
+            to_self_dir = (risk > 0) & (risk < 1) & (u_dir < risk)
+            self_hit = dmg * (hits & to_self_dir)
+            hits &= ~to_self_dir
+        dealt *= hits
+        if self_hit is not None:
+            self_hit += dealt * (risk >= 1)
+
+        kill = (dealt >= max(1, enemy_hp)).mean(axis=1)
+        if my_hp is not None and self_hit is not None:
+            self_kill = (self_hit >= max(1, my_hp)).mean(axis=1)
+        else:
+            self_kill = np.zeros(len(options))
+        q = _quantiles(dealt)
+        mean = dealt.mean(axis=1)
+        return [
+            Outcome(float(kill[i]), float(self_kill[i]), float(mean[i]), q[i],
+                    _dist(dealt[i]) if with_dist else {})
+            for i in range(len(options))
+        ]
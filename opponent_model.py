@@ -0,0 +1,210 @@
+"""
+相手の手の内の逐次推定。
+
+state が届くたびに「前回から増えた分」だけを見て更新する（履歴の再走査はしない）:
+  - defense フェーズの incomingCards … 相手が出したカード（種別・攻撃力・属性）
+  - seenMiracles.enemy の増えた末尾 … 相手が持ち続ける奇跡
+  - buy_choice の候補 / こちらが売ったカード … 相手の手札にあると分かっているカード
+  - 相手の HP/MP/gold の減少 … MP・お金の使い方（霧で見えない間は最後の値を保持）
+features() は LLM に渡す小さな dict、threat() は次の相手ターンの被ダメージ目安で、
+防御案の検証で「今は耐えても次で落ちる」受け方を避けるのに使う。
+likely_attacks() は相手ターン中の先読み（次の防御の仮定）に使う。
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional
+import weakref
+
+from card_index import CardIndex, UNKNOWN_CARD
+from solvers import incoming_attack
+
+CLASSES = ("weapon", "armor", "miracle", "heal", "trade", "other")
+PRIOR_WEIGHT = 10.0   # 山札の構成比を何枚ぶんの観測とみなすか
+EWMA_ALPHA = 0.3
+KNOWN_MAX = 8
+
+# CardIndex ごとの山札の構成比。リロードで捨てられた index の分は GC と一緒に消える
+# （id() をキーにすると、再利用された id で古い構成比を返しうる）
+_PRIORS: "weakref.WeakKeyDictionary[CardIndex, Dict[str, float]]" = weakref.WeakKeyDictionary()
+
+
+def _class_prior(index: CardIndex) -> Dict[str, float]:
+    prior = _PRIORS.get(index)
+    if prior is None:
+        counts = dict.fromkeys(CLASSES, 0)
+        for rec in index.records.values():
+            counts[rec.category if rec.category in counts else "other"] += 1
+        total = sum(counts.values()) or 1
+        prior = _PRIORS[index] = {k: v / total for k, v in counts.items()}
+    return prior
+
+
+class OpponentModel:
+    __slots__ = ("index", "class_counts", "plays", "attacks", "avg_attack", "max_attack",
+                 "element_counts", "miracles", "_miracles_n", "known_cards", "gold_spent",
+                 "mp_spent", "last_seen", "turns_hidden", "_incoming_sig", "last_attack")
+
+    def __init__(self, index: CardIndex):
+        self.index = index
+        self.class_counts = dict.fromkeys(CLASSES, 0)
+        self.plays = 0
+        self.attacks = 0
+        self.avg_attack = 0.0
+        self.max_attack = 0
+        self.element_counts: Dict[str, int] = {}
+        self.miracles: Dict[str, int] = {}       # 奇跡名 -> 攻撃力（手札に残り続ける）
+        self._miracles_n = 0
+        self.known_cards: deque = deque(maxlen=KNOWN_MAX)
+        self.gold_spent = 0
+        self.mp_spent = 0
+        self.last_seen: Optional[tuple] = None   # (hp, mp, gold)
+        self.turns_hidden = 0
+        self._incoming_sig: Optional[tuple] = None
+        self.last_attack: Optional[tuple] = None   # 最後に受けた攻撃のカード名
+
+    # ---------- 更新 ----------
+
+    def observe(self, prev, state, last_action=None):
+        """
+        update_history から毎リクエスト呼ばれる。prev は前回の state（初回は None）、
+        last_action は prev に対してこちらが返した Action。同じ state の再送では何も増えない。
+        """
+        hidden = any(st.name == "霧" for st in state.me.statuses)
+        if hidden:
+            if prev is not None and prev.phase != state.phase:
+                self.turns_hidden += 1
+        else:
+            e = state.enemy
+            if self.last_seen is not None and prev is not None:
+                _, mp0, gold0 = self.last_seen
+                self.mp_spent += max(0, mp0 - e.mp)
+                # こちらが売ったターンの gold 減少は相手の出費ではない
+                if not (last_action and last_action.type == "sell"):
+                    self.gold_spent += max(0, gold0 - e.gold)
+            self.last_seen = (e.hp, e.mp, e.gold)
+            self.turns_hidden = 0
+
+        if state.phase == "defense" and state.incomingCards:
+            sig = tuple(c.name for c in state.incomingCards)
+            if sig != self._incoming_sig:
+                self._incoming_sig = sig
+                self._observe_play(state.incomingCards)
+        elif state.phase != "defense":
+            self._incoming_sig = None
+
+        sm = state.seenMiracles
+        if sm is not None:
+            seen = sm.enemy
+            if len(seen) < self._miracles_n:
+                self._miracles_n = 0  # UI 側でリセットされた
+            for name in seen[self._miracles_n:]:
+                self.miracles.setdefault(name, (self.index.lookup(name) or UNKNOWN_CARD).attack)
+            self._miracles_n = len(seen)
+
+        if state.phase in ("buy_choice", "buy-choice") and state.buyCandidate:
+            self._know(state.buyCandidate.name)
+        if last_action is not None and prev is not None:
+            self._observe_own_action(prev, last_action)
+
+    def _observe_play(self, cards):
+        for c in cards:
+            rec = self.index.lookup(c.name) or UNKNOWN_CARD
+            cls = rec.category if rec.category in self.class_counts else "other"
+            self.class_counts[cls] += 1
+            self.plays += 1
+            try:
+                self.known_cards.remove(c.name)
+            except ValueError:
+                pass
+        if cards and cards[0].name == "売る":
+            return
+        atk = incoming_attack(cards, self.index)
+        if atk.damage > 0:
+            self.last_attack = tuple(c.name for c in cards)
+            self.attacks += 1
+            self.avg_attack = (atk.damage if self.attacks == 1
+                               else (1 - EWMA_ALPHA) * self.avg_attack + EWMA_ALPHA * atk.damage)
+            self.max_attack = max(self.max_attack, atk.damage)
+            self.element_counts[atk.element] = self.element_counts.get(atk.element, 0) + 1
+
+    def _observe_own_action(self, prev, action):
+        by_index = {c.index: c.name for c in prev.hand}
+        if action.type == "sell" and len(action.cardIndices) >= 2:
+            name = by_index.get(action.cardIndices[1])
+            if name:
+                self._know(name)  # 売ったカードは相手の手札に入る
+        elif action.type == "buy_choice" and action.buy == 1 and prev.buyCandidate:
+            try:
+                self.known_cards.remove(prev.buyCandidate.name)
+            except ValueError:
+                pass
+
+    def _know(self, name: str):
+        if name not in self.known_cards:
+            self.known_cards.append(name)
+
+    # ---------- 参照 ----------
+
+    def miracle_threat(self) -> int:
+        """見えている奇跡のうち、最後に見えた MP で撃てる最大攻撃力。"""
+        mp = self.last_seen[1] if self.last_seen else None
+        best = 0
+        for name, atk in self.miracles.items():
+            rec = self.index.lookup(name)
+            if atk > best and (mp is None or rec is None or rec.mp_cost <= mp):
+                best = atk
+        return best
+
+    def threat(self) -> int:
+        """次の相手ターンに受けうるダメージの目安（観測した最大攻撃 / 撃てる奇跡）。"""
+        return max(self.max_attack, self.miracle_threat())
+
+    def likely_attacks(self, n: int = 3) -> List[tuple]:
+        """
+        次に飛んできそうな攻撃（カード名のタプル）を n 件まで。先読み用。
+        撃てる奇跡（攻撃力順）→ 相手の手札にあると分かっている武器 → 前回と同じ攻撃、の順。
+        """
+        mp = self.last_seen[1] if self.last_seen else None
+        out: List[tuple] = []
+        for name, atk in sorted(self.miracles.items(), key=lambda kv: -kv[1]):
+            rec = self.index.lookup(name)
+            if atk > 0 and (mp is None or rec is None or rec.mp_cost <= mp):
+                out.append((name,))
+        for name in reversed(self.known_cards):
+            rec = self.index.lookup(name)
+            if rec is not None and rec.category == "weapon" and rec.attack > 0:
+                out.append((name,))
+        if self.last_attack:
+            out.append(self.last_attack)
+        seen, uniq = set(), []
+        for names in out:
+            if names not in seen:
+                seen.add(names)
+                uniq.append(names)
+        return uniq[:n]
+
+    def class_mix(self) -> Dict[str, float]:
+        prior = _class_prior(self.index)
+        total = PRIOR_WEIGHT + self.plays
+        return {k: round((PRIOR_WEIGHT * prior[k] + self.class_counts[k]) / total, 2)
+                for k in CLASSES}
+
+    def features(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "attacks_seen": self.attacks,
+            "avg_attack": round(self.avg_attack, 1),
+            "max_attack": self.max_attack,
+            "threat": self.threat(),
+            "class_mix": self.class_mix(),
+        }
+        if self.element_counts:
+            out["main_element"] = max(self.element_counts.items(), key=lambda kv: kv[1])[0]
+        if self.miracles:
+            out["miracle_threat"] = self.miracle_threat()
+        if self.known_cards:
+            out["known_cards"] = list(self.known_cards)
+        if self.gold_spent or self.mp_spent:
+            out["spent"] = {"gold": self.gold_spent, "mp": self.mp_spent}
+        if self.turns_hidden and self.last_seen:
+            hp, mp, gold = self.last_seen
+            out["last_seen"] = {"hp": hp, "mp": mp, "gold": gold, "turns_ago": self.turns_hidden}
+        return out
@@ -0,0 +1,176 @@
+"""
+過去の LLM の判断（判断トレース）から蒸留した軽量な方策。
+
+候補手はソルバーが列挙する合法手（攻撃コンボ + パス / 防御集合 + パス）で、各候補を
+  - 数値特徴: ダメージ・命中率・MP・被害などを相手/自分の HP で割ったもの、ソルバーでの順位
+  - カード特徴: 使うカード名をハッシュしたバケツ（LLM が温存しがちなカードを覚える）
+で表し、フェーズごとの線形スコアの softmax（候補の中から1つ選ぶ条件付きロジット）で選ぶ。
+学習と評価は distill.py（NumPy だけ、乱数なしで同じトレースなら同じ重み）。
+
+ソルバーの候補に無い手（両替・売る・買う・回復）は表せないので、それらが使える攻撃フェーズと、
+霧で相手の値が見えない攻撃フェーズでは使わない（applicable が False）。
+"""
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import json
+import zlib
+
+import numpy as np
+
+from card_index import CardIndex, UNKNOWN_CARD
+from solvers import ELEMENTS, attack_options, defense_options
+
+POLICY_VERSION = 1
+CARD_BUCKETS = 32
+OFF_POLICY_CATEGORIES = ("trade", "heal")  # 候補に出せないカードの種類
+RATIO_MAX = 2.0
+
+ATTACK_FEATURES = ("pass", "damage", "expected", "hit_rate", "self_damage", "mp_share", "cards",
+                   "kill", "solver_rank", "solver_top") + tuple(f"elem:{e}" for e in ELEMENTS)
+DEFENSE_FEATURES = ("pass", "loss", "expected_loss", "lethal_prob", "mp_share", "cards",
+                    "full_block", "solver_rank", "solver_top")
+PHASE_FEATURES = {"attack": ATTACK_FEATURES, "defense": DEFENSE_FEATURES}
+
+
+class Candidate(NamedTuple):
+    type: str
+    indices: tuple
+
+
+def _ratio(v: float, base: float) -> float:
+    return min(RATIO_MAX, max(0.0, v / max(base, 1)))
+
+
+def _card_bucket(name: str, index: CardIndex) -> int:
+    rec = index.lookup(name) or UNKNOWN_CARD
+    key = rec.name if rec is not UNKNOWN_CARD else name
+    return zlib.crc32(key.encode("utf-8")) % CARD_BUCKETS
+
+
+def _add_cards(row: np.ndarray, offset: int, indices: Sequence[int], names: Dict[int, str],
+               index: CardIndex):
+    for i in indices:
+        row[offset + _card_bucket(names.get(i, ""), index)] += 1.0
+
+
+def hidden_enemy(me_statuses: Sequence[str]) -> bool:
+    return "霧" in me_statuses
+
+
+def applicable(phase: str, hand: Sequence, index: CardIndex, enemy_hidden: bool = False) -> bool:
+    """この state の判断を方策に任せてよいか（LLM が候補外の手を選びうるなら False）。"""
+    if phase == "defense":
+        return True
+    if phase != "attack" or enemy_hidden:
+        return False
+    for c in hand:
+        if c.usable is not False and (index.lookup(c.name) or UNKNOWN_CARD).category in OFF_POLICY_CATEGORIES:
+            return False
+    return True
+
+
+def candidates(phase: str, hand: Sequence, incoming: Sequence, me_hp: int, me_mp: int,
+               enemy_hp: int, index: CardIndex) -> Tuple[List[Candidate], np.ndarray]:
+    """(候補, 候補ごとの特徴行列)。並びはソルバーの良い順（攻撃はパスが最後）。"""
+    names = {c.index: c.name for c in hand}
+    if phase == "attack":
+        feats = ATTACK_FEATURES
+        opts = attack_options(hand, me_mp, index)
+        cands = [Candidate("attack", tuple(o.indices)) for o in opts] + [Candidate("attack-pass", ())]
+        X = np.zeros((len(cands), len(feats) + CARD_BUCKETS))
+        elem0 = feats.index("elem:無")
+        for r, o in enumerate(opts):
+            row = X[r]
+            row[1] = _ratio(o.damage, enemy_hp)
+            row[2] = _ratio(o.expected, enemy_hp)
+            row[3] = o.hit_rate
+            row[4] = _ratio(o.self_damage, me_hp)
+            row[5] = _ratio(o.mp_cost, me_mp)
+            row[6] = len(o.indices) / 5
+            row[7] = 1.0 if o.damage >= enemy_hp else 0.0
+            row[8] = 1.0 / (1 + r)
+            row[9] = 1.0 if r == 0 else 0.0
+            if o.element in ELEMENTS:
+                row[elem0 + ELEMENTS.index(o.element)] = 1.0
+            _add_cards(row, len(feats), o.indices, names, index)
+        X[-1, 0] = 1.0
+        return cands, X
+    if phase == "defense":
+        feats = DEFENSE_FEATURES
+        opts = defense_options(hand, incoming, me_hp, me_mp, index)
+        cands = [Candidate("defend" if o.indices else "defense-pass", tuple(o.indices)) for o in opts]
+        X = np.zeros((len(cands), len(feats) + CARD_BUCKETS))
+        for r, o in enumerate(opts):
+            row = X[r]
+            row[0] = 0.0 if o.indices else 1.0
+            row[1] = _ratio(o.loss, me_hp)
+            row[2] = _ratio(o.expected_loss, me_hp)
+            row[3] = o.lethal_prob
+            row[4] = _ratio(o.mp_cost, me_mp)
+            row[5] = len(o.indices) / 5
+            row[6] = 1.0 if o.loss == 0 else 0.0
+            row[7] = 1.0 / (1 + r)
+            row[8] = 1.0 if r == 0 else 0.0
+            _add_cards(row, len(feats), o.indices, names, index)
+        return cands, X
+    return [], np.zeros((0, 0))
+
+
+def label_of(cands: Sequence[Candidate], action_type: str, indices: Sequence[int]) -> Optional[int]:
+    """実際の判断が候補の何番目か（候補に無い手なら None）。"""
+    key = sorted(indices or [])
+    for n, c in enumerate(cands):
+        if c.type == action_type and sorted(c.indices) == key:
+            return n
+    return None
+
+
+def softmax(scores: np.ndarray) -> np.ndarray:
+    e = np.exp(scores - scores.max())
+    return e / e.sum()
+
+
+class LocalPolicy:
+    def __init__(self, weights: Dict[str, np.ndarray], meta: Optional[dict] = None):
+        self.weights = weights
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalPolicy":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("version") != POLICY_VERSION or data.get("buckets") != CARD_BUCKETS:
+            raise ValueError(f"policy version mismatch: {data.get('version')}/{data.get('buckets')}")
+        weights = {}
+        for phase, w in data["weights"].items():
+            # 特徴の並びが今のコードと違うモデルは読まない（黙って別の意味の重みを掛けない）
+            if list(data["features"].get(phase, ())) != list(PHASE_FEATURES.get(phase, ())):
+                raise ValueError(f"policy features for {phase} do not match this version")
+            weights[phase] = np.asarray(w, dtype=float)
+        return cls(weights, data.get("meta"))
+
+    def save(self, path: Path):
+        data = {
+            "version": POLICY_VERSION,
+            "buckets": CARD_BUCKETS,
+            "features": {p: list(PHASE_FEATURES[p]) for p in self.weights},
+            "weights": {p: [round(float(v), 6) for v in w] for p, w in self.weights.items()},
+            "meta": self.meta,
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    def probs(self, phase: str, X: np.ndarray) -> np.ndarray:
+        return softmax(X @ self.weights[phase])
+
+    def decide(self, phase: str, hand: Sequence, incoming: Sequence, me_hp: int, me_mp: int,
+               enemy_hp: int, index: CardIndex) -> Optional[Tuple[Candidate, float]]:
+        """(一番確率の高い候補, その確率)。このフェーズの重みが無いか候補が無ければ None。"""
+        if phase not in self.weights:
+            return None
+        cands, X = candidates(phase, hand, incoming, me_hp, me_mp, enemy_hp, index)
+        if not cands:
+            return None
+        p = self.probs(phase, X)
+        best = int(p.argmax())
+        return cands[best], float(p[best])
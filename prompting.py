@@ -0,0 +1,116 @@
+"""
+プロンプト組み立てとトークン計上。
+
+プロバイダのプロンプトキャッシュを効かせるため、フェーズごとの静的 prefix
+（カード表の説明 → 共通ルール → フェーズ指示）を起動時に一度だけ組み立てて使い回し、
+可変部分の state は必ず最後の user メッセージに置く。
+"""
+from typing import Any, Dict, Optional
+import hashlib
+import threading
+
+
+def approx_tokens(text: str) -> int:
+    # tokenizer を持ち込まない概算: ASCII は約4文字、それ以外(日本語)は約1文字で1トークン
+    n_ascii = len(text.encode("ascii", "ignore"))
+    return n_ascii // 4 + (len(text) - n_ascii)
+
+
+class PromptAssembler:
+    def __init__(self, core: str, phase_prompts: Dict[str, str], card_table: Optional[str] = None):
+        self._core = core
+        self._card_table = card_table
+        self._prefixes: Dict[str, tuple] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._tokens: Dict[str, int] = {}
+        for key, text in phase_prompts.items():
+            self._add(key, text)
+        self._add("", "")  # 未知フェーズ用（旧コードの PHASE_PROMPTS.get(key, "") 相当）
+
+    def _add(self, key: str, phase_text: str):
+        parts = []
+        if self._card_table:
+            parts.append(self._card_table)
+        parts.append(self._core)
+        parts.append(phase_text)
+        prefix = tuple({"role": "system", "content": p} for p in parts)
+        h = hashlib.blake2b(digest_size=8)
+        for p in parts:
+            h.update(p.encode("utf-8"))
+            h.update(b"\0")
+        self._prefixes[key] = prefix
+        self._fingerprints[key] = h.hexdigest()
+        self._tokens[key] = sum(approx_tokens(p) for p in parts)
+
+    def prefix(self, key: str) -> tuple:
+        return self._prefixes.get(key) or self._prefixes[""]
+
+    def fingerprint(self, key: str) -> str:
+        return self._fingerprints.get(key) or self._fingerprints[""]
+
+    def prefix_tokens(self, key: str) -> int:
+        """静的 prefix の概算トークン数（キャッシュが外れた回はこれも毎回課金される）。"""
+        return self._tokens[key] if key in self._tokens else self._tokens[""]
+
+    def messages(self, key: str, user_content: str) -> list:
+        msgs = list(self.prefix(key))
+        msgs.append({"role": "user", "content": user_content})
+        return msgs
+
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """OpenAI の usage から prompt / cached / completion トークン数を取り出す。"""
+    if usage is None:
+        return {"prompt": 0, "cached": 0, "completion": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        "completion": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+class UsageStats:
+    """フェーズごとのトークン数・レイテンシの累計。"""
+
+    _FIELDS = ("requests", "prompt_tokens", "cached_tokens", "completion_tokens",
+               "latency_sec", "ttft_sec", "ttft_count")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_phase: Dict[str, Dict[str, float]] = {}
+
+    def record(self, key: str, counts: Dict[str, int], latency: float,
+               ttft: Optional[float] = None, prefix: str = "", prefix_tokens: int = 0):
+        with self._lock:
+            row = self._by_phase.get(key)
+            if row is None:
+                row = dict.fromkeys(self._FIELDS, 0)
+                row["prefix"] = prefix
+                self._by_phase[key] = row
+            row["requests"] += 1
+            row["prompt_tokens"] += counts["prompt"]
+            row["cached_tokens"] += counts["cached"]
+            row["completion_tokens"] += counts["completion"]
+            row["latency_sec"] += latency
+            if ttft is not None:
+                row["ttft_sec"] += ttft
+                row["ttft_count"] += 1
+            # prefix が変わった(プロンプト編集)ことが分かるように最新を持つ
+            row["prefix"] = prefix
+            row["prefix_tokens"] = prefix_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        with self._lock:
+            for key, row in self._by_phase.items():
+                n = row["requests"] or 1
+                out[key] = {
+                    **row,
+                    "cached_ratio": round(row["cached_tokens"] / row["prompt_tokens"], 4)
+                    if row["prompt_tokens"] else 0.0,
+                    "avg_latency_sec": round(row["latency_sec"] / n, 4),
+                    "avg_ttft_sec": round(row["ttft_sec"] / row["ttft_count"], 4)
+                    if row["ttft_count"] else None,
+                }
+        return out
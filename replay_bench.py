@@ -0,0 +1,329 @@
+"""
+記録済みの GFState をまとめて /decide のパイプラインに流し、
+スループットと段階別レイテンシを測るオフラインベンチマーク。
+
+LLM は llm_backend.StubBackend に差し替える（課金なし・ネットワーク不要）。
+スタブは payload の attack_candidates / defense_plan の先頭案を返し、
+遅延は --llm-ms / --llm-jitter-ms で指定する（ジッタは入力内容のハッシュから決めるので
+同じ入力なら毎回同じ遅延になる）。
+
+入力:
+  - ai_trace.jsonl(.gz) などの判断トレース（kind="decision" の state を使う）
+  - GFState をそのまま 1 行ずつ並べた JSONL / GFState の配列を持つ JSON
+  - 何も指定しなければ godfield_cards.json から合成した state
+
+例:
+  python replay_bench.py ai_trace.jsonl --llm-ms 300 --concurrency 8 --out bench/after.json
+  python replay_bench.py --synthetic 500 --baseline bench/before.json
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from llm_backend import StubBackend
+from trace_log import git_rev, iter_records
+
+STAGES = ("update_history", "build_llm_state", "serialize", "llm",
+          "sanitize_strict_rules", "logging")
+
+
+# ================== 入力 ==================
+
+def load_states(paths: List[Path]) -> List[Dict[str, Any]]:
+    states = []
+    for path in paths:
+        files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+        for f in files:
+            for rec in iter_records(f):
+                if not isinstance(rec, dict):
+                    continue
+                if rec.get("kind", "decision") == "decision" and isinstance(rec.get("state"), dict):
+                    state = dict(rec["state"])
+                    # sessionId を state に持たない古いトレースは record の session で補う
+                    state.setdefault("sessionId", rec.get("session"))
+                    states.append(state)
+                elif "phase" in rec and "me" in rec:
+                    states.append(rec)
+    return states
+
+
+def synthetic_states(n: int, sessions: int, seed: int, cards_path: Path) -> List[Dict[str, Any]]:
+    """カードDBから適当な手札を組んだ state を作る（トレースが無い環境用）。"""
+    rng = random.Random(seed)
+    cards = json.loads(cards_path.read_text(encoding="utf-8"))
+    attackers = [c for c in cards if c.get("category") in ("weapon", "miracle")]
+    phases = ("attack", "attack", "defense", "defense", "buy_choice")
+
+    def card(c, i):
+        return {"index": i, "name": c["name"], "overlay": "", "raw_text": c["name"], "usable": True}
+
+    def player(name):
+        return {"name": name, "hp": rng.randint(5, 60), "mp": rng.randint(0, 40),
+                "gold": rng.randint(0, 60), "statuses": []}
+
+    out = []
+    for i in range(n):
+        hand = [card(rng.choice(cards), j) for j in range(rng.randint(5, 10))]
+        phase = rng.choice(phases)
+        state = {
+            "phase": phase,
+            "sessionId": f"replay-{i % max(1, sessions)}",
+            "me": player("me"),
+            "enemy": player("enemy"),
+            "hand": hand,
+            "seenMiracles": {"me": [], "enemy": []},
+        }
+        if phase == "defense":
+            state["incomingCards"] = [
+                {**card(rng.choice(attackers), j), "usable": None}
+                for j in range(rng.randint(1, 3))]
+        if phase == "buy_choice":
+            state["buyCandidate"] = card(rng.choice(cards), 0)
+        out.append(state)
+    return out
+
+
+# ================== 計測 ==================
+
+class StageTimer:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {k: [] for k in STAGES}
+        self._last_build = 0.0
+
+    def add(self, stage: str, sec: float):
+        self.samples[stage].append(sec)
+
+    def wrap(self, mod, name: str, stage: str):
+        orig = getattr(mod, name)
+
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return orig(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t)
+        setattr(mod, name, timed)
+
+    def wrap_async(self, mod, name: str, stage: str):
+        orig = getattr(mod, name)
+
+        async def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return await orig(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t)
+        setattr(mod, name, timed)
+
+    def install(self, server):
+        self.wrap(server, "update_history", "update_history")
+        self.wrap(server, "sanitize_strict_rules", "sanitize_strict_rules")
+        self.wrap(server, "trace_decision", "logging")
+        self.wrap_async(server, "hedged_completion", "llm")
+
+        # encode_llm_state = build_llm_state + (compact化) + json.dumps なので、
+        # 差分をシリアライズ時間とする（同期関数なので入れ子の計測が混ざらない）
+        build = server.build_llm_state
+        encode = server.encode_llm_state
+
+        def timed_build(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return build(*args, **kwargs)
+            finally:
+                self._last_build = time.perf_counter() - t
+                self.add("build_llm_state", self._last_build)
+
+        def timed_encode(*args, **kwargs):
+            self._last_build = 0.0
+            t = time.perf_counter()
+            try:
+                return encode(*args, **kwargs)
+            finally:
+                self.add("serialize", time.perf_counter() - t - self._last_build)
+
+        server.build_llm_state = timed_build
+        server.encode_llm_state = timed_encode
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    xs = sorted(samples)
+
+    def pct(q):
+        # nearest-rank
+        return xs[min(len(xs) - 1, max(0, math.ceil(q * len(xs)) - 1))] * 1000
+
+    return {
+        "count": len(xs),
+        "mean": round(statistics.fmean(xs) * 1000, 4),
+        "p50": round(pct(0.50), 4),
+        "p95": round(pct(0.95), 4),
+        "p99": round(pct(0.99), 4),
+        "max": round(xs[-1] * 1000, 4),
+        "total": round(sum(xs) * 1000, 3),
+    }
+
+
+# ================== 実行 ==================
+
+async def replay(server, states: List[Dict[str, Any]], concurrency: int, timer: StageTimer):
+    # 同じセッションの state は記録順に流す（履歴が順序に依存するため）
+    by_session: Dict[Any, List[Dict[str, Any]]] = {}
+    for s in states:
+        by_session.setdefault(s.get("sessionId"), []).append(s)
+    queue: asyncio.Queue = asyncio.Queue()
+    for seq in by_session.values():
+        queue.put_nowait(seq)
+
+    latencies: List[float] = []
+    actions: Dict[str, int] = {}
+    errors: List[str] = []
+
+    async def worker():
+        while not queue.empty():
+            seq = queue.get_nowait()
+            for raw in seq:
+                try:
+                    state = server.GFState(**raw)
+                except Exception as e:
+                    errors.append(f"invalid state: {e}")
+                    continue
+                t = time.perf_counter()
+                try:
+                    action = await server.decide(state)
+                except Exception as e:
+                    errors.append(repr(e))
+                    continue
+                latencies.append(time.perf_counter() - t)
+                actions[action.type] = actions.get(action.type, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    wall = time.perf_counter() - t0
+    return wall, latencies, actions, errors
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="*", type=Path, help="trace / GFState JSON(L) files or directories")
+    ap.add_argument("--synthetic", type=int, default=200, help="inputs が無いときに合成する state 数")
+    ap.add_argument("--sessions", type=int, default=8, help="合成 state のセッション数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1, help="入力を何周流すか")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--llm-ms", type=float, default=200.0, help="スタブLLMの基本遅延")
+    ap.add_argument("--llm-jitter-ms", type=float, default=0.0, help="入力ハッシュから決まる追加遅延の最大値")
+    ap.add_argument("--ttft-ratio", type=float, default=0.5, help="ストリーミング時、遅延のうち最初のチャンクまでの割合")
+    ap.add_argument("--reason-chars", type=int, default=120, help="スタブが返す reason の長さ")
+    ap.add_argument("--cache", action="store_true", help="判断キャッシュを有効にする（既定は無効）")
+    ap.add_argument("--trace", type=Path, default=None, help="トレース出力先（既定は一時ファイル）")
+    ap.add_argument("--out", type=Path, default=None, help="結果 JSON の保存先")
+    ap.add_argument("--baseline", type=Path, default=None, help="比較する過去の結果 JSON")
+    ap.add_argument("--verbose", action="store_true", help="server の print を抑制しない")
+    args = ap.parse_args(argv)
+
+    # server は import 時に環境変数を読むので先に決めておく
+    tmpdir = tempfile.TemporaryDirectory(prefix="gf-replay-")
+    os.environ["USE_LLM"] = "true"
+    os.environ["GF_DECISION_CACHE"] = "true" if args.cache else "false"
+    os.environ["GF_TRACE_PATH"] = str(args.trace or Path(tmpdir.name) / "trace.jsonl")
+    sys.path.insert(0, str(Path(__file__).parent))
+    import server
+
+    if args.inputs:
+        states = load_states(args.inputs)
+        source = [str(p) for p in args.inputs]
+    else:
+        states = synthetic_states(args.synthetic, args.sessions, args.seed, server.CARD_DB_PATH)
+        source = f"synthetic:{args.synthetic}:seed={args.seed}"
+    if not states:
+        print("[GF REPLAY] no states to replay")
+        return 1
+    states = states * max(1, args.repeat)
+
+    stub = StubBackend(args.llm_ms, args.llm_jitter_ms, args.ttft_ratio, args.reason_chars)
+    server.BACKEND = stub
+    server.get_mc()  # 遅延初期化ぶんを計測に混ぜない
+    timer = StageTimer()
+    timer.install(server)
+
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with sink:
+        wall, latencies, actions, errors = asyncio.run(
+            replay(server, states, args.concurrency, timer))
+    server.TRACE.close()
+
+    result = {
+        "meta": {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": git_rev(),
+            "python": sys.version.split()[0],
+            "source": source,
+            "encoding": server.STATE_ENCODING,
+            "stream": server.STREAM_ENABLED,
+            "hedge": server.HEDGE_ENABLED,
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "decisions": len(latencies),
+        "errors": len(errors),
+        "llm_calls": stub.calls,
+        "wall_sec": round(wall, 4),
+        "throughput_per_sec": round(len(latencies) / wall, 2) if wall > 0 else None,
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {k: percentiles(v) for k, v in timer.samples.items()},
+        "actions": actions,
+    }
+    if errors:
+        result["error_samples"] = errors[:10]
+
+    print(f"[GF REPLAY] {result['decisions']} decisions in {result['wall_sec']}s "
+          f"({result['throughput_per_sec']}/s), llm calls {stub.calls}, errors {len(errors)}")
+    lat = result["latency_ms"]
+    print(f"  latency ms  p50 {lat.get('p50')}  p95 {lat.get('p95')}  p99 {lat.get('p99')}")
+    for stage, row in result["stages_ms"].items():
+        if row["count"]:
+            print(f"  {stage:<22} n={row['count']:<6} p50 {row['p50']:<10} "
+                  f"p95 {row['p95']:<10} p99 {row['p99']}")
+
+    if args.baseline:
+        compare(json.loads(args.baseline.read_text(encoding="utf-8")), result)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[GF REPLAY] saved {args.out}")
+    tmpdir.cleanup()
+    return 0
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]):
+    def delta(a, b):
+        if not a or b is None:
+            return "-"
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    print(f"[GF REPLAY] vs baseline {before.get('meta', {}).get('git')}")
+    print(f"  throughput {before.get('throughput_per_sec')} -> {after.get('throughput_per_sec')} "
+          f"({delta(before.get('throughput_per_sec'), after.get('throughput_per_sec'))})")
+    rows = [("latency", before.get("latency_ms", {}), after["latency_ms"])]
+    rows += [(k, before.get("stages_ms", {}).get(k, {}), v) for k, v in after["stages_ms"].items()]
+    for name, b, a in rows:
+        if not a.get("count"):
+            continue
+        print(f"  {name:<22} p50 {delta(b.get('p50'), a.get('p50')):>8}  "
+              f"p95 {delta(b.get('p95'), a.get('p95')):>8}  p99 {delta(b.get('p99'), a.get('p99')):>8}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,72 @@
-from fastapi import FastAPI
+import time
+_T_START = time.perf_counter()  # 起動時間の計測（import を含む）
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Literal
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Optional, Dict, Any, Callable, Literal
 from pathlib import Path
-from copy import deepcopy
+from collections import OrderedDict, deque
+from itertools import islice
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import hashlib
 import json
 import re
 import os
+import uuid
+
+
+from card_index import CardIndex, CardRecord, UNKNOWN_CARD
+from llm_backend import CircuitBreaker, LLMBackend, RetryPolicy, make_backend
+from metrics import Registry
+from opponent_model import OpponentModel
+from prompting import PromptAssembler, UsageStats, approx_tokens, usage_counts
+from stream_parse import IncrementalJSONObject
+from solvers import (AttackOption, DefenseOption, attack_options, classify_attack_card,
+                     defense_options, dominant_option, evaluate_defense, incoming_attack,
+                     EXCHANGE_HP_HARD_MIN, ExchangeTarget, best_exchange, exchange_problems)
+from speculate import Speculator
+from trace_log import TraceWriter
+
+# orjson があれば state の直列化と LLM 応答の解析に使う（出力はどちらも区切り空白なしの UTF-8）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumpb(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
-from openai import OpenAI
+def json_loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
 
 # ================== FastAPI setup ==================
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    print(f"[GF AI] ready in {(time.perf_counter() - _T_START) * 1000:.0f} ms")
+    tasks = []
+    if RELOAD_INTERVAL > 0:
+        tasks.append(asyncio.create_task(reload_loop()))
+    if WARMUP:
+        # 重い import (openai / numpy) は起動後に裏で済ませ、最初の判断を待たせない
+        tasks.append(asyncio.create_task(asyncio.to_thread(warmup)))
+    yield
+    for t in tasks:
+        t.cancel()
+    if BACKEND is not None:
+        await BACKEND.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -20,22 +74,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ================== Metrics ==================
+
+# 記録は加算だけ、文字列化は /metrics を叩かれた時だけ
+METRICS = Registry(enabled=os.getenv("GF_METRICS", "true").lower() == "true")
+STAGE_SECONDS = METRICS.histogram(
+    "gf_stage_seconds", "Time spent per decide pipeline stage", ["stage"])
+DECISIONS = METRICS.counter(
+    "gf_decisions_total", "Decisions returned by source", ["source"])
+FALLBACKS = METRICS.counter(
+    "gf_fallbacks_total", "LLM answers replaced by a local decision", ["reason"])
+LLM_ERRORS = METRICS.counter(
+    "gf_llm_errors_total", "Failed LLM calls", ["kind"])
+CORRECTIONS = METRICS.counter(
+    "gf_corrections_total", "Corrections applied by sanitize_strict_rules", ["phase"])
+LETHAL_OVERRIDES = METRICS.counter(
+    "gf_lethal_overrides_total", "Sell targets replaced by adjust_sell_for_lethal")
+
+_REQUEST_START: ContextVar[Optional[float]] = ContextVar("gf_request_start", default=None)
+
+
+class RequestTimer:
+    """/decide の受信時刻を記録する（body 読み込み + GFState 検証 = parse を測るため）。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("path") == "/decide":
+            _REQUEST_START.set(time.perf_counter())
+        await self.app(scope, receive, send)
+
+
+if METRICS.enabled:
+    app.add_middleware(RequestTimer)
+
 # ================== Card DB ==================
 
 BASE_DIR = Path(__file__).resolve().parent
-CARD_DB_PATH = BASE_DIR / "godfield_cards.json"
+CARD_DB_PATH = Path(os.getenv("GF_CARD_DB", BASE_DIR / "godfield_cards.json"))
 
-CARD_DB: Dict[str, Dict[str, Any]] = {}
-if CARD_DB_PATH.exists():
-    try:
-        raw = json.loads(CARD_DB_PATH.read_text(encoding="utf-8"))
-        for entry in raw:
-            if isinstance(entry, dict) and "name" in entry:
-                CARD_DB[entry["name"]] = entry
-    except Exception as e:
-        print("[GF AI] failed to load card DB:", e)
-else:
-    print("[GF AI] godfield_cards.json not found; CARD_DB will be empty")
+# 別名解決と派生属性(攻撃種別/単体不可/回復/価格/MP)は起動時（とホットリロード時）に一度だけ計算する
+CARD_INDEX = CardIndex.load(CARD_DB_PATH)
+CARD_DB: Dict[str, Dict[str, Any]] = CARD_INDEX.raw
 
 # ================== Models ==================
 
@@ -87,6 +168,7 @@ class SeenMiracles(BaseModel):
 
 class GFState(BaseModel):
     phase: str
+    sessionId: Optional[str] = None  # ★対戦ごとのID（未指定なら共有セッション）
     gf: Optional[GFInfo] = None
     me: Player
     enemy: Player
@@ -94,6 +176,13 @@ class GFState(BaseModel):
     incomingCards: List[IncomingCard] = []
     buyCandidate: Optional[BuyCandidate] = None
     seenMiracles: Optional[SeenMiracles] = None
+    _hand_map: Optional[Dict[int, Card]] = PrivateAttr(default=None)
+
+    def hand_map(self) -> Dict[int, Card]:
+        """index -> Card。1リクエスト中は同じ dict を使い回す（手札の線形探索をしない）。"""
+        if self._hand_map is None:
+            self._hand_map = {c.index: c for c in self.hand}
+        return self._hand_map
 
 
 class ExchangePlan(BaseModel):
@@ -113,121 +202,81 @@ class Action(BaseModel):
 # ================== Logging Helpers ==================
 
 
-LOG_FILE_PATH = BASE_DIR / "ai_thinking.log"
-
-
-def write_debug_log(text: str):
-    try:
-        with open(LOG_FILE_PATH, "a", encoding="utf-8") as f:
-            f.write(text + "\n")
-    except Exception as e:
-        print(f"[LOG ERROR] {e}")
+# 1判断 = 1行の JSONL。書き込みはバックグラウンドスレッドが行う。
+TRACE_PATH = Path(os.getenv("GF_TRACE_PATH", BASE_DIR / "ai_trace.jsonl"))
+TRACE = TraceWriter(
+    TRACE_PATH,
+    max_bytes=int(os.getenv("GF_TRACE_MAX_BYTES", str(20 * 1024 * 1024))),
+    rotate_sec=float(os.getenv("GF_TRACE_ROTATE_SEC", "0")),
+    backups=int(os.getenv("GF_TRACE_BACKUPS", "10")),
+    compress=os.getenv("GF_TRACE_COMPRESS", "false").lower() == "true",
+)
 
 
-def get_card_name(indices: list[int], hand: list[Card]) -> list[str]:
+def get_card_name(indices: list[int], by_index: Dict[int, Card]) -> list[str]:
     names = []
     for i in indices:
-        c = next((x for x in hand if x.index == i), None)
+        c = by_index.get(i)
         names.append(f"{c.name}({c.overlay})" if c else f"Unknown({i})")
     return names
 
 
-def format_state_for_log(state: GFState, history: list) -> str:
-    lines = []
-    me_st = ",".join([s.name for s in state.me.statuses]) or "None"
-    en_st = ",".join([s.name for s in state.enemy.statuses]) or "None"
-    lines.append(
-        f"ME   : HP{state.me.hp} MP{state.me.mp} ¥{state.me.gold} | Status: [{me_st}]")
-    lines.append(
-        f"ENEMY: HP{state.enemy.hp} MP{state.enemy.mp} ¥{state.enemy.gold} | Status: [{en_st}]")
-    # ★ ここを追加
-    if state.seenMiracles is None:
-        lines.append("SEEN MIRACLES: (missing in state)")
-    else:
-        me = state.seenMiracles.me or []
-        en = state.seenMiracles.enemy or []
-
-        def tail(xs, n=6):
-            return ", ".join(xs[-n:]) if xs else "None"
-
-        lines.append(
-            f"SEEN MIRACLES: me({len(me)}): {tail(me)} | enemy({len(en)}): {tail(en)}"
-        )
-
-    if state.incomingCards:
-        lines.append("INCOMING:")
-        for c in state.incomingCards:
-            lines.append(f"   [{c.index}] {c.name} ({c.overlay})")
-
-    lines.append("HAND:")
-    for c in (state.hand or []):
-        mark = " " if c.usable is not False else "x"
-        info = lookup_card_db(c.name) or {}
-        cost = info.get("mp_cost", 0)
-        lines.append(
-            f" {mark} [{c.index:2}] {c.name:<12} ({c.overlay}) Cost:{cost}")
-
-    lines.append("HISTORY (Last 3):")
-    for h in history[-3:]:
-        act = h.get('action')
-        cards = h.get('card_indices', [])
-        lines.append(
-            f"   T{h.get('turn')}: {act} {cards} -> Dmg(Me:{h.get('damage_to_me')} En:{h.get('damage_to_enemy')})")
-
-    return "\n".join(lines)
+def trace_decision(state: "GFState", session: "GameSession", timings: dict, *,
+                   payload: Optional[dict] = None, usage: Optional[dict] = None,
+                   decision_id: Optional[str] = None,
+                   raw_txt: Optional[str] = None, llm: Optional[dict] = None,
+                   corrections: Optional[list] = None, fallback: str = "",
+                   action: Optional["Action"] = None, error: Optional[str] = None,
+                   speculative: bool = False):
+    t_log = time.perf_counter()
+    record = {
+        "kind": "decision",
+        "id": decision_id,
+        "ts": time.time(),
+        "session": session.session_id,
+        "turn": session.turn_counter,
+        "phase": state.phase,
+        "prompt_key": phase_key(state.phase),
+        "state": state.dict(),
+        "history": list(session.history)[-3:],
+        "llm_raw": raw_txt,
+        "llm": llm,
+        "corrections": corrections or [],
+        "fallback": fallback or None,
+        "final": action.dict() if action else None,
+        "error": error,
+        "payload": payload,
+        "usage": usage,
+        "timings_ms": {k: round(v * 1000, 3) for k, v in timings.items()},
+    }
+    if speculative:
+        record["speculative"] = True  # 先読みで仮定した state に対する判断
+    if llm is not None and action is not None:
+        record["llm_names"] = get_card_name(llm.get("cardIndices") or [], state.hand_map())
+        record["final_names"] = get_card_name(action.cardIndices, state.hand_map())
+    TRACE.write(record)
+    # 判断1件ごとの段階別時間は trace と同じ timings から取る（全体は decide 側で測る）
+    for stage, sec in timings.items():
+        if stage != "total":
+            STAGE_SECONDS.observe(sec, stage)
+    STAGE_SECONDS.observe(time.perf_counter() - t_log, "logging")
+
 
 # ================== Regex & Logic Helpers ==================
 
 
 _main_atk_re = re.compile(r"^攻(\d+)")
 _prob_atk_re = re.compile(r"(\d+)%攻(\d+)")
-_plus_atk_re = re.compile(r"^\+攻|攻\+")
-_shield_re = re.compile(r"守(\d+)")
 _price_re = re.compile(r"¥\s*(\d+)")
 
 
-def normalize_card_name(name: str) -> str:
-    name = re.sub(r"[＜＞<>]", "", name)
-    return name.strip()
+def lookup_card(name: str) -> CardRecord:
+    return CARD_INDEX.lookup(name) or UNKNOWN_CARD
 
 
 def lookup_card_db(name: str) -> dict | None:
-    info = CARD_DB.get(name)
-    if info:
-        return info
-    base = normalize_card_name(name)
-    return CARD_DB.get(base)
-
-
-def classify_attack_card(overlay: str, info: dict) -> str:
-    """
-    攻撃カードの種類判定 (DB優先版)
-    ★DBが武器/奇跡でなければ強制的にother（攻撃不可）扱いにする
-    """
-    category = info.get("category", "")
-    description = info.get("description") or ""
-
-    # 武器でも奇跡でもないなら攻撃計算には入れない
-    if category not in ["weapon", "miracle"]:
-        return "other"
-
-    if "追加" in description:
-        return "plus"
-
-    hit_rate = info.get("hit_rate", 1.0)
-    if hit_rate < 1.0:
-        return "prob"
-
-    if not overlay:
-        return "main"
-    if _prob_atk_re.search(overlay):
-        return "prob"
-    if _plus_atk_re.search(overlay):
-        return "plus"
-    if _main_atk_re.search(overlay):
-        return "main"
-
-    return "main"
+    rec = CARD_INDEX.lookup(name)
+    return rec.info if rec else None
 
 
 def approx_card_attack(card: Card) -> int:
@@ -247,12 +296,6 @@ def approx_card_attack(card: Card) -> int:
     return 0
 
 
-def approx_card_shield(card: Card) -> int:
-    text = f"{card.overlay or ''} {card.raw_text or ''}"
-    m = _shield_re.search(text)
-    return int(m.group(1)) if m else 0
-
-
 def approx_incoming_attack(card: IncomingCard) -> int:
     text = f"{card.overlay or ''} {card.raw_text or ''}"
     m = _prob_atk_re.search(text)
@@ -266,10 +309,9 @@ def approx_incoming_attack(card: IncomingCard) -> int:
 
 
 def approx_card_price(card: Card) -> Optional[int]:
-    info = lookup_card_db(card.name) or {}
-    price = info.get("price")
-    if isinstance(price, (int, float)):
-        return int(price)
+    price = lookup_card(card.name).price
+    if price is not None:
+        return price
     for text in (card.raw_text or "", card.overlay or ""):
         v = _price_re.search(text)
         if v:
@@ -277,16 +319,16 @@ def approx_card_price(card: Card) -> Optional[int]:
     return None
 
 
-def is_single_forbidden(card: Card, info: dict) -> bool:
-    text = f"{info.get('description', '')} {card.raw_text} {card.name}"
-    keywords = ["単体不可"]
-    return any(k in text for k in keywords)
+def is_single_forbidden(card: Card, rec: CardRecord) -> bool:
+    if rec.single_forbidden:
+        return True
+    return "単体不可" in card.raw_text or "単体不可" in card.name
 
 
-def is_recovery_item(card: Card, info: dict) -> bool:
-    if info.get("category") == "heal":
+def is_recovery_item(card: Card, rec: CardRecord) -> bool:
+    if rec.recovery:
         return True
-    text = f"{info.get('description', '')} {card.raw_text} {card.name}"
+    text = f"{card.raw_text} {card.name}"
     return "回復" in text or "HP+" in text or "MP+" in text
 
 
@@ -321,8 +363,8 @@ def normalize_exchange_plan(plan: "ExchangePlan", me: "Player") -> "ExchangePlan
     return ExchangePlan(hp=hp, mp=mp, gold=gold)
 
 
-def mask_enemy_if_me_is_kiri(state: dict) -> dict:
-    s = deepcopy(state)
+def mask_enemy_if_me_is_kiri(s: dict) -> dict:
+    # build_llm_state が作った使い捨ての dict をその場で書き換える（コピーしない）
     statuses = [st.get("name") for st in s.get("me", {}).get("statuses", [])]
     if "霧" in statuses and "enemy" in s:
         s["enemy"]["hp"] = None
@@ -336,14 +378,15 @@ def mask_enemy_if_me_is_kiri(state: dict) -> dict:
 
 def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState) -> tuple[str, list[int], list[str]]:
     hand = state.hand or []
+    by_index = state.hand_map()
     me = state.me
     logs = []
 
     selected = []
     for i in indices:
-        c = next((x for x in hand if x.index == i), None)
+        c = by_index.get(i)
         if c:
-            selected.append((i, c, lookup_card_db(c.name) or {}))
+            selected.append((i, c, lookup_card(c.name)))
 
     if not selected:
         return action_type, [], logs
@@ -390,7 +433,7 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
                 logs.append(f"[{c.name}] 単体不可カードだが攻撃コンボ候補として暫定的に許可")
 
             # 2) 防御フェーズで虹のカーテンが一緒に選ばれているときは、防具カードも許可
-            elif action_type == "defense" and has_rainbow:
+            elif action_type in ("defend", "defense") and has_rainbow:
                 # ちゃんと「防御として意味があるカード」だけ通したいので、
                 # シールド値があるかどうかでざっくり判定する
                 allow = True
@@ -401,7 +444,7 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
                 logs.append(f"[{c.name}] usable:falseにより除外")
                 continue
 
-        cost = info.get("mp_cost", 0)
+        cost = info.mp_cost
         if cost <= mp_now:
             mp_now -= cost
             valid_step.append((i, c, info))
@@ -414,7 +457,7 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
     if action_type == "attack":
         mains, probs, pluses, others = [], [], [], []
         for item in valid_step:
-            # ★修正: item[2]=info を渡してDBベースで判定
+            # ★修正: item[2]=CardRecord を渡してDBベースで判定
             cat = classify_attack_card(item[1].overlay, item[2])
 
             if cat == "main":
@@ -447,8 +490,8 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
             final_ids.extend([x[0] for x in pluses])
         final_ids.extend([x[0] for x in others])
 
-        final_objs = [next(x for x in valid_step if x[0] == fid)
-                      for fid in final_ids]
+        step_by_id = {x[0]: x for x in valid_step}
+        final_objs = [step_by_id[fid] for fid in final_ids]
         has_standalone = any(not is_single_forbidden(
             obj[1], obj[2]) for obj in final_objs)
         if not has_standalone and final_ids:
@@ -464,7 +507,7 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
         # final_ids は index のリストなので、そこから名前を引く
         kine_indices = []
         for idx in final_ids:
-            c_obj = next((x for x in valid_step if x[0] == idx), None)
+            c_obj = step_by_id.get(idx)
             if c_obj and c_obj[1].name == "あぶないキネ":
                 kine_indices.append(idx)
 
@@ -493,6 +536,21 @@ def sanitize_strict_rules(action_type: str, indices: list[int], state: GFState)
     return action_type, [x[0] for x in valid_step], logs
 
 
+def lethal_sell_targets(state: GFState) -> list[tuple[int, Card]]:
+    """売りつければ相手の HP+MP+gold を払いきれなくなるカード（安い順）。"""
+    enemy = state.enemy
+    enemy_total = max(0, enemy.hp) + max(0, enemy.mp) + max(0, enemy.gold)
+    out = []
+    for c in state.hand:
+        if c.name == "売る":
+            continue
+        price = approx_card_price(c)
+        if price is not None and price >= enemy_total:
+            out.append((price, c))
+    out.sort(key=lambda x: x[0])
+    return out
+
+
 def adjust_sell_for_lethal(action_type: str, indices: list[int], state: GFState) -> list[int]:
     if action_type != "attack":
         return indices
@@ -506,49 +564,145 @@ def adjust_sell_for_lethal(action_type: str, indices: list[int], state: GFState)
         return indices
 
     enemy_total = max(0, enemy.hp) + max(0, enemy.mp) + max(0, enemy.gold)
-    lethal_candidates = []
-    for c in hand:
-        if c.name == "売る":
-            continue
-        price = approx_card_price(c)
-        if price is not None and price >= enemy_total:
-            lethal_candidates.append((price, c))
-
+    lethal_candidates = lethal_sell_targets(state)
     if not lethal_candidates:
         return indices
-    lethal_candidates.sort(key=lambda x: x[0])
     target_card = lethal_candidates[0][1]
     sell_idx = next(
         (c.index for c in sell_cards if c.index in indices), sell_cards[0].index)
 
     print(
         f"[LETHAL OVERRIDE] Selling {target_card.name}({approx_card_price(target_card)}) to kill enemy({enemy_total})")
+    LETHAL_OVERRIDES.inc()
     return [sell_idx, target_card.index]
 
 
+def attack_options_for(state: GFState, top_k: Optional[int] = None) -> list[AttackOption]:
+    return attack_options(state.hand or [], state.me.mp, CARD_INDEX, top_k=top_k)
+
+
+def enemy_hidden(state: GFState) -> bool:
+    return any(st.name == "霧" for st in state.me.statuses)
+
+
+def ranked_attack_options(state: GFState, top_k: Optional[int] = None) -> list[tuple]:
+    """
+    (AttackOption, Outcome | None) を良い順に返す。
+    上位 MC_POOL 件はモンテカルロで撃破率を出し、撃破が現実的(MC_KILL_MIN 以上)なら
+    期待ダメージより「撃破率 - 自滅率」を優先して並べ替える。
+    """
+    opts = attack_options_for(state)
+    mc = get_mc() if opts and not enemy_hidden(state) else None
+    if mc is None:
+        return [(o, None) for o in (opts[:top_k] if top_k else opts)]
+    pool = opts[:MC_POOL]
+    outs = mc.evaluate_attacks(pool, state.enemy.hp, state.me.hp)
+    ranked = list(zip(pool, outs))
+    if max(out.kill_prob - out.self_kill_prob for out in outs) >= MC_KILL_MIN:
+        ranked.sort(key=lambda p: (-(p[1].kill_prob - p[1].self_kill_prob), -p[0].score))
+    ranked += [(o, None) for o in opts[MC_POOL:]]
+    return ranked[:top_k] if top_k else ranked
+
+
 def choose_attack_capable_weapon(state: GFState) -> list[int]:
-    cands = []
-    mp = state.me.mp
-    for c in (state.hand or []):
-        if c.usable is False:
-            continue
-        info = lookup_card_db(c.name) or {}
-        if info.get("category") != "weapon":
-            continue
-        if info.get("mp_cost", 0) > mp:
-            continue
-        if is_single_forbidden(c, info):
-            continue
-        atk = approx_card_attack(c)
-        cands.append((atk, c.index))
-    if not cands:
-        return []
-    cands.sort(key=lambda x: x[0], reverse=True)
-    return [cands[0][1]]
+    # 単体最強武器ではなく、合法コンボ全列挙の1位（撃破圏ならモンテカルロの撃破率順）を使う
+    opts = ranked_attack_options(state, top_k=1)
+    return list(opts[0][0].indices) if opts else []
+
+
+# --- attack solver ---
+# LLM に上位コンボを候補として渡す。GF_ATTACK_SKIP_LLM=true なら、
+# 攻撃以外の選択肢(売買/両替/回復)が無く1位が圧倒的なときは LLM を呼ばない。
+ATTACK_CANDIDATES = int(os.getenv("GF_ATTACK_CANDIDATES", "3"))
+ATTACK_SKIP_LLM = os.getenv("GF_ATTACK_SKIP_LLM", "false").lower() == "true"
+ATTACK_DOMINANCE = float(os.getenv("GF_ATTACK_DOMINANCE", "2.0"))
+
+# --- Monte Carlo ---
+# 確率武器を期待値1つに潰さず、撃破率とダメージ分布で比べる（numpy が無ければ無効）。
+# numpy の import と事前分布の構築は重いので、初回の攻撃評価（か起動後の warmup）まで遅らせる。
+MC_ENABLED = os.getenv("GF_MONTE_CARLO", "true").lower() == "true"
+MC_SAMPLES = int(os.getenv("GF_MC_SAMPLES", "2048"))
+MC_POOL = int(os.getenv("GF_MC_POOL", "8"))
+MC_KILL_MIN = float(os.getenv("GF_MC_KILL_MIN", "0.1"))
+MC = None
+
+
+def build_mc(index: CardIndex):
+    try:
+        from montecarlo import MonteCarlo
+    except ImportError:
+        return None
+    return MonteCarlo(index, samples=MC_SAMPLES)
+
+
+def get_mc():
+    global MC, MC_ENABLED
+    if MC is None and MC_ENABLED:
+        MC = build_mc(CARD_INDEX)
+        if MC is None:
+            MC_ENABLED = False
+            print("[GF AI] numpy not installed; Monte Carlo evaluation disabled")
+    return MC
+
+
+# --- defense solver ---
+DEFENSE_CANDIDATES = int(os.getenv("GF_DEFENSE_CANDIDATES", "3"))
+
+
+def defense_options_for(state: GFState, top_k: Optional[int] = None) -> list[DefenseOption]:
+    return defense_options(state.hand or [], state.incomingCards or [], state.me.hp,
+                           state.me.mp, CARD_INDEX, top_k=top_k)
+
+
+def verify_defense(indices: list[int], state: GFState, logs: list[str]) -> list[int]:
+    # LLM の防御案で死ぬのに、生き残れる組み合わせがあるなら差し替える
+    opts = defense_options_for(state)
+    if not opts:
+        return indices
+    best = opts[0]
+    chosen = evaluate_defense(indices, opts)
+    if chosen is None:
+        return indices  # ソルバーが扱わないカード(指輪など)を含む案はそのまま通す
+    if chosen.lethal_prob > best.lethal_prob:
+        logs.append(
+            f"【防御検証】案{indices}は致死率{chosen.lethal_prob:.2f} -> "
+            f"{list(best.indices)}(致死率{best.lethal_prob:.2f}, 期待被害{best.expected_loss:.1f})に差し替え")
+        return list(best.indices)
+    # 今は耐えても、残りHPが相手の次の一撃(threat)圏内に落ちるなら、圏外に残れる案へ
+    threat = opponent_threat(state)
+    hp = state.me.hp
+    if below_threat(chosen, hp, threat) and not below_threat(best, hp, threat):
+        logs.append(
+            f"【防御検証】案{indices}は残りHP{hp - chosen.loss}(相手の脅威{threat}以下) -> "
+            f"{list(best.indices)}(残りHP{hp - best.loss})に差し替え")
+        return list(best.indices)
+    return indices
+
+
+def decide_local_attack(state: GFState) -> Optional[Action]:
+    if not ATTACK_SKIP_LLM or phase_key(state.phase) != "attack":
+        return None
+    for c in state.hand:
+        if c.usable is not False and lookup_card(c.name).category in ("trade", "heal"):
+            return None
+    best = dominant_option([o for o, _ in ranked_attack_options(state)], ATTACK_DOMINANCE)
+    if best is None:
+        return None
+    return Action(
+        type="attack",
+        cardIndices=list(best.indices),
+        reason=f"Solver: expected {best.expected:.1f} dmg ({best.element}) dominates",
+    )
 
 
 def decide_rule_based(state: GFState) -> Action:
     if state.phase == "attack":
+        lethal = find_lethal(state)
+        if lethal is not None:
+            return lethal
+        ex = decide_local_exchange(state)
+        if ex is not None:
+            return ex
         idxs = choose_attack_capable_weapon(state)
         if idxs:
             return Action(type="attack", cardIndices=idxs, reason="Fallback Attack")
@@ -556,43 +710,426 @@ def decide_rule_based(state: GFState) -> Action:
     if state.phase == "defense":
         if not state.incomingCards:
             return Action(type="defense-pass", reason="Fallback")
-        best = (0, None)
-        for c in state.hand:
-            s = approx_card_shield(c)
-            if c.usable and s > best[0]:
-                best = (s, c.index)
-        if best[1] is not None:
-            return Action(type="defend", cardIndices=[best[1]], reason="Fallback Defend")
+        opts = defense_options_for(state, top_k=1)
+        if opts and opts[0].indices:
+            return Action(type="defend", cardIndices=list(opts[0].indices), reason="Fallback Defend")
         return Action(type="defense-pass", reason="Fallback No Shield")
     return Action(type="none", reason="Fallback")
 
 # ================== Execution Core ==================
 
 
-GAME_HISTORY = []
-_LAST_STATE = None
-_LAST_ACTION = None
-_TURN_COUNTER = 0
+# --- sessions ---
+# 対戦ごとに履歴を分離する。履歴はリングバッファで上限付き、
+# 一定時間アクセスのないセッションや上限超過分は古い順(LRU)に捨てる。
+DEFAULT_SESSION_ID = "default"
+SESSION_MAX = int(os.getenv("GF_SESSION_MAX", "256"))
+SESSION_TTL_SEC = float(os.getenv("GF_SESSION_TTL", "1800"))
+SESSION_HISTORY_LEN = int(os.getenv("GF_SESSION_HISTORY", "32"))
+
+
+class GameSession:
+    __slots__ = ("session_id", "history", "last_state",
+                 "last_action", "turn_counter", "last_seen", "opponent")
+
+    def __init__(self, session_id: str, history_len: int):
+        self.session_id = session_id
+        self.history: deque = deque(maxlen=history_len)
+        self.last_state: Optional[GFState] = None
+        self.last_action: Optional[Action] = None
+        self.turn_counter = 0
+        self.last_seen = time.monotonic()
+        self.opponent = OpponentModel(CARD_INDEX)
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL_SEC,
+                 history_len: int = SESSION_HISTORY_LEN):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.history_len = history_len
+        self._sessions: "OrderedDict[str, GameSession]" = OrderedDict()
+        # セッションが LRU/TTL で消えたときに呼ぶ（セッション単位の状態を外に持つ部品の後始末用）
+        self.on_evict: Optional[Callable[[str], Any]] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str]) -> GameSession:
+        sid = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        self.evict_idle(now)
+        sess = self._sessions.get(sid)
+        if sess is None:
+            sess = GameSession(sid, self.history_len)
+            self._sessions[sid] = sess
+            while len(self._sessions) > self.max_sessions:
+                self._evict_oldest()
+        else:
+            self._sessions.move_to_end(sid)
+        sess.last_seen = now
+        return sess
+
+    def peek(self, session_id: Optional[str]) -> Optional[GameSession]:
+        """作成も LRU 更新もせずに参照する（ソルバーから相手モデルを読む用）。"""
+        return self._sessions.get(session_id or DEFAULT_SESSION_ID)
+
+    def evict_idle(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        # OrderedDict はアクセス順なので先頭から期限切れを落とすだけでよい
+        while self._sessions:
+            sess = next(iter(self._sessions.values()))
+            if now - sess.last_seen <= self.ttl:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        sid, _ = self._sessions.popitem(last=False)
+        if self.on_evict is not None:
+            self.on_evict(sid)
+
+
+SESSIONS = SessionStore()
+
+# --- opponent model ---
+# 相手の出したカード・見えた奇跡・お金/MPの減り方をセッションごとに逐次集計し、
+# 脅威の目安を LLM の state(opponent) と防御ソルバーに渡す。
+OPPONENT_MODEL = os.getenv("GF_OPPONENT_MODEL", "true").lower() == "true"
+
+
+def opponent_threat(state: GFState) -> int:
+    if not OPPONENT_MODEL:
+        return 0
+    sess = SESSIONS.peek(state.sessionId)
+    return sess.opponent.threat() if sess else 0
+
+
+def below_threat(opt: DefenseOption, hp: int, threat: int) -> bool:
+    """受けた後のHPが相手の次の一撃の目安以下になるか（被弾しない案は False）。"""
+    return threat > 0 and opt.loss > 0 and hp - opt.loss <= threat
+
+# --- lethal detector ---
+# LLM に聞く前に「このターンで確実に倒せる手」を探し、あればそのまま返す:
+#   - 攻撃/奇跡: 合法コンボ全列挙のうち、光属性（防具で止まらない）・命中100%
+#     （相手が暗雲なら確率攻撃も必ず当たる）・自爆なしで、ダメージが相手HP以上
+#   - 売る: 価格が相手の HP+MP+gold 以上のカードを売りつける
+# 光も売るも止められる虹のカーテン / スーパーミラーを相手が持っていると分かっている時と、
+# 自分が霧で相手の値が見えない時は確定としない。
+LETHAL_ENABLED = os.getenv("GF_LETHAL", "true").lower() == "true"
+LETHAL_COUNTERS = frozenset(("虹のカーテン", "スーパーミラー"))
+LETHAL_DECISIONS = METRICS.counter(
+    "gf_lethal_decisions_total", "Guaranteed kills answered without the LLM", ["kind"])
+
+
+def enemy_may_counter(state: GFState) -> bool:
+    if not OPPONENT_MODEL:
+        return False
+    sess = SESSIONS.peek(state.sessionId)
+    return sess is not None and any(n in LETHAL_COUNTERS for n in sess.opponent.known_cards)
+
+
+def find_lethal(state: GFState) -> Optional[Action]:
+    if (not LETHAL_ENABLED or phase_key(state.phase) != "attack" or enemy_hidden(state)
+            or enemy_may_counter(state)):
+        return None
+    hp = state.enemy.hp
+    always_hit = any(st.name == "暗雲" for st in state.enemy.statuses)
+    best = None
+    for o in attack_options_for(state):
+        if o.element != "光" or o.damage < hp or o.self_damage > 0:
+            continue
+        if o.hit_rate < 1.0 and not always_hit:
+            continue
+        # どれでも勝ちなので、使うカードと MP が少ない手を選ぶ
+        if best is None or (len(o.indices), o.mp_cost) < (len(best.indices), best.mp_cost):
+            best = o
+    if best is not None:
+        action = Action(type="attack", cardIndices=list(best.indices),
+                        reason=f"Lethal: 光{best.damage} (hit {best.hit_rate:.0%}"
+                               f"{', 暗雲' if always_hit and best.hit_rate < 1.0 else ''}) >= enemy HP {hp}")
+    else:
+        sell = next((c for c in state.hand if c.name == "売る" and c.usable is not False), None)
+        targets = lethal_sell_targets(state) if sell is not None else []
+        if not targets:
+            return None
+        price, target = targets[0]
+        e = state.enemy
+        action = Action(type="sell", cardIndices=[sell.index, target.index],
+                        reason=f"Lethal: sell {target.name}(¥{price}) >= enemy HP+MP+gold "
+                               f"{max(0, e.hp) + max(0, e.mp) + max(0, e.gold)}")
+    # 念のため通常と同じルールを通し、削られる手なら確定扱いしない
+    t, idx, _ = sanitize_strict_rules(action.type, action.cardIndices, state)
+    if t != action.type or sorted(idx) != sorted(action.cardIndices):
+        return None
+    action.cardIndices = idx
+    return action
+
+# --- exchange solver ---
+# 両替後の hp/mp/gold は solvers.best_exchange で決定的に出す（同じ state なら同じ配分）。
+#   validate: LLM の案を合計合わせしたうえで制約（HP下限・必要MP・gold上限）を検査し、破っていれば差し替え
+#   local   : 配分は常にソルバー。HP が危険ラインを割っていて回復手段が両替しかない時は LLM も呼ばない
+#   off     : 従来どおり LLM の案を normalize_exchange_plan に通すだけ
+EXCHANGE_SOLVER = os.getenv("GF_EXCHANGE_SOLVER", "validate").lower()
+EXCHANGE_PLANS = METRICS.counter(
+    "gf_exchange_plans_total", "Exchange plans by origin", ["source"])
+
+
+def exchange_target(state: GFState) -> ExchangeTarget:
+    me = state.me
+    return best_exchange(me.hp, me.mp, me.gold, state.hand, CARD_INDEX,
+                         threat=opponent_threat(state))
+
+
+def plan_exchange(raw: Optional[dict], state: GFState, logs: list[str]) -> ExchangePlan:
+    me = state.me
+    plan = None
+    if raw:
+        try:
+            plan = normalize_exchange_plan(ExchangePlan(**raw), me)
+        except Exception:
+            plan = None
+    if EXCHANGE_SOLVER == "off":
+        EXCHANGE_PLANS.inc("llm" if plan else "current")
+        return plan or ExchangePlan(hp=me.hp, mp=me.mp, gold=me.gold)
+    target = exchange_target(state)
+    if plan is not None and EXCHANGE_SOLVER != "local":
+        problems = exchange_problems(plan.hp, plan.mp, plan.gold, target)
+        if not problems:
+            EXCHANGE_PLANS.inc("llm")
+            return plan
+        logs.append(f"【両替検証】案{plan.dict()}は {', '.join(problems)} -> "
+                    f"hp={target.hp} mp={target.mp} gold={target.gold} に差し替え")
+        EXCHANGE_PLANS.inc("replaced")
+    else:
+        EXCHANGE_PLANS.inc("solver")
+    return ExchangePlan(hp=target.hp, mp=target.mp, gold=target.gold)
+
+
+def decide_local_exchange(state: GFState) -> Optional[Action]:
+    """HP が危険ラインを割り、回復手段が両替しかない時の緊急両替（local モードのみ）。"""
+    if EXCHANGE_SOLVER != "local" or phase_key(state.phase) != "attack":
+        return None
+    card = None
+    for c in state.hand:
+        if c.usable is False:
+            continue
+        if c.name == "両替":
+            card = c
+        elif is_recovery_item(c, lookup_card(c.name)):
+            return None
+    if card is None:
+        return None
+    me = state.me
+    threat = opponent_threat(state)
+    if me.hp >= max(EXCHANGE_HP_HARD_MIN, threat + 1):
+        return None
+    target = best_exchange(me.hp, me.mp, me.gold, state.hand, CARD_INDEX, threat=threat)
+    if target.hp <= me.hp:
+        return None
+    EXCHANGE_PLANS.inc("solver")
+    return Action(type="exchange", cardIndices=[card.index],
+                  exchange=ExchangePlan(hp=target.hp, mp=target.mp, gold=target.gold),
+                  reason=f"Solver: HP {me.hp} -> {target.hp} by exchange")
+
+# --- distilled policy ---
+# distill.py で判断トレースから学習した線形方策（policy.py）。ソルバーの候補の中で
+# 一番確率の高い手が GF_POLICY_MIN_CONF 以上なら LLM を呼ばずにそれを返す。
+# モデルファイルが無ければ何もしない（numpy もそのときは読み込まない）。
+POLICY_PATH = Path(os.getenv("GF_POLICY", BASE_DIR / "policy_model.json"))
+POLICY_MIN_CONF = float(os.getenv("GF_POLICY_MIN_CONF", "0.9"))
+POLICY_DECISIONS = METRICS.counter(
+    "gf_policy_decisions_total", "Distilled policy lookups", ["result"])
+
+
+def load_local_policy():
+    if not POLICY_PATH.exists():
+        return None
+    from policy import LocalPolicy
+    return LocalPolicy.load(POLICY_PATH)
+
+
+try:
+    POLICY = load_local_policy()
+except Exception as e:
+    POLICY = None
+    print(f"[GF AI] policy model not loaded ({e!r})")
+
+
+def policy_action(state: GFState) -> tuple[Optional[Action], str]:
+    """(方策の答え, 結果) を返す。答えが無いときの結果は skip / low_confidence / rejected。"""
+    policy = POLICY
+    phase = phase_key(state.phase)
+    if policy is None or phase not in policy.weights:
+        return None, "skip"
+    from policy import applicable
+    if not applicable(phase, state.hand, CARD_INDEX, enemy_hidden(state)) \
+            or (phase == "defense" and not state.incomingCards):
+        return None, "skip"
+    pick = policy.decide(phase, state.hand, state.incomingCards, state.me.hp, state.me.mp,
+                         state.enemy.hp, CARD_INDEX)
+    if pick is None:
+        return None, "skip"
+    cand, conf = pick
+    if conf < POLICY_MIN_CONF:
+        return None, "low_confidence"
+    # 通常と同じルールと防御検証を通し、少しでも直される手なら使わない
+    t, idx, _ = sanitize_strict_rules(cand.type, list(cand.indices), state)
+    if t != cand.type or sorted(idx) != sorted(cand.indices):
+        return None, "rejected"
+    if t in ("defend", "defense-pass") and verify_defense(idx, state, []) != idx:
+        return None, "rejected"
+    return Action(type=t, cardIndices=idx, reason=f"Policy: p={conf:.2f}"), "hit"
+
+# --- decision cache ---
+# クライアントは実質同じ状態を何度も送ってくるので、判断に効くフィールドだけで
+# 署名を作り、LLMの最終Actionを短時間キャッシュする。raw_text はホバー由来で
+# 揺れやすいので署名に含めない（クライアント側 stateSig と同じ方針）。
+# LLM には history_rounds / opponent も渡していて、これはセッションごとに違うので
+# セッションIDも署名に入れる（別の対戦の答えを使い回さない）。
+DECISION_CACHE_ENABLED = os.getenv("GF_DECISION_CACHE", "true").lower() == "true"
+DECISION_CACHE_MAX = int(os.getenv("GF_DECISION_CACHE_MAX", "1024"))
+DECISION_CACHE_TTL_SEC = float(os.getenv("GF_DECISION_CACHE_TTL", "60"))
+
+
+def state_signature(state: GFState) -> str:
+    def player(p: Player):
+        return [p.hp, p.mp, p.gold, sorted(st.name for st in p.statuses)]
+
+    sm = state.seenMiracles
+    bc = state.buyCandidate
+    canon = [
+        state.sessionId or DEFAULT_SESSION_ID,
+        phase_key(state.phase),
+        player(state.me),
+        player(state.enemy),
+        [[c.index, c.name, c.overlay, c.usable] for c in state.hand],
+        [[c.index, c.name, c.overlay] for c in state.incomingCards],
+        [bc.name, bc.overlay] if bc else None,
+        [sm.me, sm.enemy] if sm else None,
+        [state.gf.current, state.gf.max] if state.gf else None,
+    ]
+    return hashlib.blake2b(json_dumpb(canon), digest_size=16).hexdigest()
+
+
+class DecisionCache:
+    def __init__(self, max_size: int = DECISION_CACHE_MAX, ttl: float = DECISION_CACHE_TTL_SEC,
+                 enabled: bool = DECISION_CACHE_ENABLED):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, tuple[float, Action]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, sig: str) -> Optional[Action]:
+        if not self.enabled:
+            return None
+        item = self._items.get(sig)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            if item is not None:
+                del self._items[sig]
+            self.misses += 1
+            return None
+        self._items.move_to_end(sig)
+        self.hits += 1
+        return item[1]
+
+    def put(self, sig: str, action: Action):
+        if not self.enabled:
+            return
+        self._items[sig] = (time.monotonic(), action)
+        self._items.move_to_end(sig)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+DECISION_CACHE = DecisionCache()
+
+# --- single-flight ---
+# バースト中のポーリングで同じ状態が LLM 応答前に再送されても、
+# 同一 (session, 署名) の判断は1本だけ走らせて全員に同じ Action を返す。
+
+
+class SingleFlight:
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def __contains__(self, key) -> bool:
+        return key in self._inflight
+
+    async def do(self, key, factory):
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(factory())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f, k=key: self._inflight.pop(k, None))
+        else:
+            self.coalesced += 1
+        # 呼び出し元が切断されても共有中の判断はキャンセルしない
+        return await asyncio.shield(fut)
+
+
+DECISION_FLIGHTS = SingleFlight()
 
 # --- prompts ---
 PROMPT_DIR = Path(os.getenv("GF_PROMPT_DIR", BASE_DIR / "prompts"))
 
 
-def read_prompt(p: Path, fallback: str = "") -> str:
+PROMPT_FILES = {
+    "": "system_core.txt",
+    "attack": "user_attack.txt",
+    "defense": "user_defense.txt",
+    "buy_choice": "user_buy_choice.txt",
+}
+
+
+def read_prompt(p: Path, fallback: str = "", strict: bool = False) -> str:
+    """strict=True なら読めない/空のファイルで例外を投げる（ホットリロードで古い版を使い続ける用）。"""
     try:
-        return p.read_text(encoding="utf-8")
-    except:
+        text = p.read_text(encoding="utf-8")
+    except Exception:
+        if strict:
+            raise
         return fallback
+    if strict and not text.strip():
+        # 書き込み途中で切り詰められたファイルを空のプロンプトとして差し替えない
+        raise ValueError(f"{p.name}: empty prompt")
+    return text
 
 
-SYSTEM_CORE = read_prompt(PROMPT_DIR / "system_core.txt",
-                          fallback="You are Godfield AI. Output JSON only.")
+def load_prompts(strict: bool = False) -> tuple[str, Dict[str, str]]:
+    core = read_prompt(PROMPT_DIR / PROMPT_FILES[""],
+                       fallback="You are Godfield AI. Output JSON only.", strict=strict)
+    phases = {k: read_prompt(PROMPT_DIR / f, fallback="", strict=strict)
+              for k, f in PROMPT_FILES.items() if k}
+    return core, phases
+
+
+def reload_prompts() -> tuple[str, Dict[str, str]]:
+    return load_prompts(strict=True)
 
-PHASE_PROMPTS = {
-    "attack": read_prompt(PROMPT_DIR / "user_attack.txt", fallback=""),
-    "defense": read_prompt(PROMPT_DIR / "user_defense.txt", fallback=""),
-    "buy_choice": read_prompt(PROMPT_DIR / "user_buy_choice.txt", fallback=""),
-}
+
+SYSTEM_CORE, PHASE_PROMPTS = load_prompts()
 
 
 def phase_key(phase: str) -> str:
@@ -601,38 +1138,326 @@ def phase_key(phase: str) -> str:
     return phase
 
 
-client = OpenAI()
+# --- LLM backend ---
+# GF_LLM_BACKEND=openai | stub。バックエンドは最初の呼び出しで作る（openai の import が重いのと、
+# API キー無しでもルール/シミュレータ/ベンチ用に server を import できるように）。
+# ベンチなどは BACKEND に直接 LLMBackend を入れてよい。
+LLM_BACKEND = os.getenv("GF_LLM_BACKEND", "openai").lower()
+LLM_MODEL = os.getenv("GF_MODEL", "gpt-5.1")
+BACKEND: Optional[LLMBackend] = None
+
+
+def get_backend() -> LLMBackend:
+    global BACKEND
+    if BACKEND is None:
+        if LLM_BACKEND == "stub":
+            kw = {
+                "llm_ms": float(os.getenv("GF_STUB_LLM_MS", "50")),
+                "fail_rate": float(os.getenv("GF_STUB_FAIL_RATE", "0")),
+                "fail_mode": os.getenv("GF_STUB_FAIL_MODE", "error"),
+            }
+        else:
+            kw = {
+                "max_connections": int(os.getenv("GF_LLM_MAX_CONNECTIONS", "20")),
+                "keepalive": int(os.getenv("GF_LLM_KEEPALIVE", "10")),
+            }
+        BACKEND = make_backend(LLM_BACKEND, LLM_MODEL, **kw)
+    return BACKEND
+
+
+# 一時的な失敗（接続/429/5xx）だけ、期限内で上限付きの再試行をする。
+# 連続で GF_BREAKER_THRESHOLD 回失敗（エラー/期限切れ）したら GF_BREAKER_COOLDOWN 秒は
+# LLM を呼ばずにルール/ソルバーの判断を即返す。
+LLM_RETRIES = METRICS.counter("gf_llm_retries_total", "Retried LLM calls", ["kind"])
+BREAKER_TRANSITIONS = METRICS.counter(
+    "gf_breaker_transitions_total", "LLM circuit breaker state changes", ["state"])
+
+
+def _on_breaker_change(state: str):
+    BREAKER_TRANSITIONS.inc(state)
+    print(f"[GF BREAKER] {state}")
+
+
+RETRY = RetryPolicy(
+    attempts=1 + int(os.getenv("GF_LLM_RETRIES", "2")),
+    base=float(os.getenv("GF_LLM_BACKOFF", "0.2")),
+    cap=float(os.getenv("GF_LLM_BACKOFF_MAX", "2.0")),
+)
+BREAKER = CircuitBreaker(
+    threshold=int(os.getenv("GF_BREAKER_THRESHOLD", "3")),
+    cooldown=float(os.getenv("GF_BREAKER_COOLDOWN", "30")),
+    on_change=_on_breaker_change,
+)
+
+
+def _on_llm_retry(attempt: int, delay: float, e: BaseException):
+    LLM_RETRIES.inc(type(e).__name__)
+    print(f"[GF LLM RETRY] #{attempt} in {delay * 1000:.0f}ms after {e!r}")
+
+
+async def llm_create(messages: list, stream: bool):
+    return await RETRY.run(lambda: get_backend().create(messages, stream=stream), _on_llm_retry)
+
+# --- LLM deadline (秒) ---
+# フェーズごとのターン制限に収まるように LLM 待ちを打ち切る。
+# 期限切れの呼び出しはキャンセルして decide_rule_based にフォールバックする。
+PHASE_DEADLINES = {
+    "attack": float(os.getenv("GF_DEADLINE_ATTACK", "20")),
+    "defense": float(os.getenv("GF_DEADLINE_DEFENSE", "10")),
+    "buy_choice": float(os.getenv("GF_DEADLINE_BUY_CHOICE", "8")),
+}
+DEFAULT_DEADLINE = float(os.getenv("GF_DEADLINE_DEFAULT", "10"))
+
+
+def phase_deadline(phase: str) -> float:
+    return PHASE_DEADLINES.get(phase_key(phase), DEFAULT_DEADLINE)
+
+
+# --- hedged requests ---
+# GF_HEDGE=true のとき、1本目が直近の p95 レイテンシを超えても返らなければ
+# 同じリクエストをもう1本投げ、先に届いた有効な応答を採用する（残りはキャンセル）。
+HEDGE_ENABLED = os.getenv("GF_HEDGE", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("GF_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("GF_HEDGE_MIN_SAMPLES", "20"))
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self.size = size
+        self.hedged = 0
+        self._by_phase: Dict[str, deque] = {}
+
+    def record(self, key: str, seconds: float):
+        win = self._by_phase.get(key)
+        if win is None:
+            win = self._by_phase[key] = deque(maxlen=self.size)
+        win.append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        win = self._by_phase.get(key)
+        if not win or len(win) < min_samples:
+            return None
+        xs = sorted(win)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
 
 
-def update_history(new_state: GFState):
-    global _LAST_STATE, _LAST_ACTION, _TURN_COUNTER, GAME_HISTORY
-    if _LAST_STATE is None:
-        _LAST_STATE = new_state
+LLM_LATENCY = LatencyWindow()
+
+
+def parse_llm_json(raw_txt: str) -> dict:
+    json_txt = raw_txt
+    if "```json" in raw_txt:
+        json_txt = raw_txt.split("```json")[1].split("```")[0].strip()
+    elif "```" in raw_txt:
+        json_txt = raw_txt.split("```")[0].strip()
+    data = json_loads(json_txt)
+    if not isinstance(data, dict):
+        raise ValueError(f"LLM output is not an object: {type(data).__name__}")
+    return data
+
+
+# --- streaming ---
+# GF_STREAM=true のとき応答をストリームで受け、type / cardIndices と
+# フェーズ上必要なフィールドが揃った時点で返す。reason の続きは裏で読み切って trace に書く。
+STREAM_ENABLED = os.getenv("GF_STREAM", "true").lower() == "true"
+EARLY_REASON = "(reason still streaming; see trace)"
+
+# target を付けうるカード（天国草・吸収系）。target は reason の後に来るので、
+# これらを選んだときは早期確定せず最後まで読む。
+def targetable_cards(index: CardIndex) -> frozenset:
+    return frozenset(
+        name for name, rec in index.records.items()
+        if name == "天国草" or "吸収" in (rec.info.get("description") or ""))
+
+
+TARGETABLE_CARDS = targetable_cards(CARD_INDEX)
+
+
+def early_action_ready(fields: dict, hand: list[Card]) -> bool:
+    atype = fields.get("type")
+    if not isinstance(atype, str):
+        return False
+    if atype in ("buy_choice", "buy-choice"):
+        return "buy" in fields
+    indices = fields.get("cardIndices")
+    if not isinstance(indices, list):
+        return False
+    if atype == "exchange" and "exchange" not in fields and EXCHANGE_SOLVER != "local":
+        return False
+    if "target" not in fields:
+        names = {c.index: c.name for c in hand}
+        if any(names.get(i) in TARGETABLE_CARDS for i in indices):
+            return False
+    return True
+
+
+def _absorb_chunk(chunk, parser: IncrementalJSONObject) -> tuple[bool, Any]:
+    """(本文が来たか, usage) を返す。"""
+    got = False
+    if getattr(chunk, "choices", None):
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parser.feed(delta)
+            got = True
+    return got, getattr(chunk, "usage", None)
+
+
+_BACKGROUND: set = set()
+
+
+def spawn(coro) -> asyncio.Task:
+    # 参照を持っておかないと途中で GC される
+    task = asyncio.create_task(coro)
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+    return task
+
+
+async def _drain_stream(key: str, stream, it, parser: IncrementalJSONObject,
+                        t_start: float, ttft: Optional[float], on_finish):
+    usage = None
+    try:
+        async for chunk in it:
+            _, u = _absorb_chunk(chunk, parser)
+            usage = u or usage
+    except Exception as e:
+        print(f"[GF STREAM] {key}: drain failed: {e}")
+    finally:
+        await stream.close()
+    counts = usage_counts(usage)
+    USAGE.record(key, counts, time.perf_counter() - t_start, ttft=ttft,
+                 prefix=PROMPTS.fingerprint(key), prefix_tokens=PROMPTS.prefix_tokens(key))
+    if on_finish:
+        on_finish(parser.buf.strip(), parser.fields, counts)
+
+
+async def _complete_streaming(key: str, messages: list, hand: list[Card], on_finish) -> tuple:
+    t = time.perf_counter()
+    stream = await llm_create(messages, stream=True)
+    it = stream.__aiter__()
+    parser = IncrementalJSONObject()
+    ttft = None
+    usage = None
+    early = False
+    try:
+        async for chunk in it:
+            got, u = _absorb_chunk(chunk, parser)
+            usage = u or usage
+            if got and ttft is None:
+                ttft = time.perf_counter() - t
+                STAGE_SECONDS.observe(ttft, "ttft")
+            if got and early_action_ready(parser.fields, hand):
+                early = not parser.closed
+                break
+    except BaseException:
+        await stream.close()
+        raise
+    latency = time.perf_counter() - t
+    LLM_LATENCY.record(key, latency)
+    if early:
+        data = dict(parser.fields)
+        data.setdefault("reason", EARLY_REASON)
+        spawn(_drain_stream(key, stream, it, parser, t, ttft, on_finish))
+        return parser.buf.strip(), data, None
+    await stream.close()
+    raw_txt = parser.buf.strip()
+    try:
+        data = parse_llm_json(raw_txt)
+    except ValueError:
+        if not isinstance(parser.fields.get("type"), str):
+            raise
+        data = dict(parser.fields)
+    counts = usage_counts(usage)
+    USAGE.record(key, counts, latency, ttft=ttft, prefix=PROMPTS.fingerprint(key),
+                 prefix_tokens=PROMPTS.prefix_tokens(key))
+    return raw_txt, data, counts
+
+
+async def _complete_once(key: str, messages: list, hand: Optional[list] = None,
+                         on_finish=None) -> tuple:
+    if STREAM_ENABLED and hand is not None:
+        return await _complete_streaming(key, messages, hand, on_finish)
+    t = time.perf_counter()
+    resp = await llm_create(messages, stream=False)
+    latency = time.perf_counter() - t
+    usage = usage_counts(getattr(resp, "usage", None))
+    USAGE.record(key, usage, latency, prefix=PROMPTS.fingerprint(key),
+                 prefix_tokens=PROMPTS.prefix_tokens(key))
+    raw_txt = resp.choices[0].message.content.strip()
+    data = parse_llm_json(raw_txt)  # パースできない応答は「無効」として扱う
+    LLM_LATENCY.record(key, latency)
+    return raw_txt, data, usage
+
+
+async def hedged_completion(key: str, messages: list, budget: float,
+                            hand: Optional[list] = None, on_finish=None) -> tuple:
+    """(raw_txt, data, usage) を返す。budget 内に有効な応答が無ければ TimeoutError。"""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + budget
+    pending = {asyncio.ensure_future(_complete_once(key, messages, hand, on_finish))}
+    hedge_at = None
+    if HEDGE_ENABLED:
+        p = LLM_LATENCY.quantile(key, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+        if p is not None and p < budget:
+            hedge_at = loop.time() + p
+    last_error: Optional[BaseException] = None
+    try:
+        while pending:
+            wake = min(end, hedge_at) if hedge_at else end
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, wake - loop.time()),
+                return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    return fut.result()
+                last_error = fut.exception()
+            if hedge_at and loop.time() >= hedge_at:
+                hedge_at = None
+                LLM_LATENCY.hedged += 1
+                print(f"[GF HEDGE] {key}: first call slower than p{int(HEDGE_QUANTILE * 100)}, sending backup")
+                pending.add(asyncio.ensure_future(_complete_once(key, messages, hand, on_finish)))
+            elif not done and loop.time() >= end:
+                raise asyncio.TimeoutError()
+        raise last_error or RuntimeError("no LLM response")
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def update_history(session: GameSession, new_state: GFState):
+    last_state = session.last_state
+    last_action = session.last_action
+    session.opponent.observe(last_state, new_state, last_action)
+    if last_state is None:
+        session.last_state = new_state
         return
-    _TURN_COUNTER += 1
-    act_type = _LAST_ACTION.type if _LAST_ACTION else "none"
-    act_cards = _LAST_ACTION.cardIndices if _LAST_ACTION else []
-    dmg_me = max(0, _LAST_STATE.me.hp - new_state.me.hp)
-    dmg_en = max(0, _LAST_STATE.enemy.hp - new_state.enemy.hp)
-
-    GAME_HISTORY.append({
-        "turn": _TURN_COUNTER,
-        "phase": _LAST_STATE.phase,
+    session.turn_counter += 1
+    act_type = last_action.type if last_action else "none"
+    act_cards = last_action.cardIndices if last_action else []
+    dmg_me = max(0, last_state.me.hp - new_state.me.hp)
+    dmg_en = max(0, last_state.enemy.hp - new_state.enemy.hp)
+
+    session.history.append({
+        "turn": session.turn_counter,
+        "phase": last_state.phase,
         "action": act_type,
         "damage_to_me": dmg_me,
         "damage_to_enemy": dmg_en,
         "card_indices": act_cards
     })
-    _LAST_STATE = new_state
+    session.last_state = new_state
 
 
-def get_history_rounds(max_rounds: int = 6):
-    return GAME_HISTORY[-max_rounds:]
+def get_history_rounds(session: GameSession, max_rounds: int = 6):
+    h = session.history
+    return list(islice(h, max(0, len(h) - max_rounds), None))
 
 
-def build_llm_state(state: GFState) -> dict:
-    s = state.dict()
-    s["history_rounds"] = get_history_rounds()
+def build_llm_state(state: GFState, session: GameSession) -> dict:
+    s = state.dict(exclude={"sessionId"})
+    s["history_rounds"] = get_history_rounds(session)
+    if OPPONENT_MODEL:
+        s["opponent"] = session.opponent.features()
 
     # hand: DB付与 & overlay誤読除去
     for c in s.get("hand", []):
@@ -650,43 +1475,373 @@ def build_llm_state(state: GFState) -> dict:
         # ※ 単体不可コンボの usable 強制 True は
         # ここでやらず sanitize側で扱う方が安全
 
+    if ATTACK_CANDIDATES > 0 and phase_key(state.phase) == "attack":
+        s["attack_candidates"] = [
+            {**o.as_dict(), **out.as_dict()} if out else o.as_dict()
+            for o, out in ranked_attack_options(state, ATTACK_CANDIDATES)]
+
+    if EXCHANGE_SOLVER != "off" and phase_key(state.phase) == "attack" \
+            and any(c.name == "両替" and c.usable is not False for c in state.hand):
+        s["exchange_plan"] = exchange_target(state).as_dict()
+
+    if DEFENSE_CANDIDATES > 0 and phase_key(state.phase) == "defense" and state.incomingCards:
+        atk = incoming_attack(state.incomingCards, CARD_INDEX)
+        threat = opponent_threat(state)
+        s["defense_plan"] = {
+            "incoming": {"damage": atk.damage, "hit_rate": atk.hit_rate, "element": atk.element},
+            "options": [{**o.as_dict(), "below_threat": True} if below_threat(o, state.me.hp, threat)
+                        else o.as_dict() for o in defense_options_for(state, DEFENSE_CANDIDATES)],
+        }
+
     # incomingCards もDBと概算攻撃を付与（必要なら）
-    for c in s.get("incomingCards", []):
-        info = lookup_card_db(c["name"]) or None
-        c["db"] = info
-        idx = c.get("index", 0)
-        real_c = next((x for x in state.incomingCards if x.index == idx), None)
-        c["approx_attack"] = approx_incoming_attack(real_c) if real_c else 0
+    # s["incomingCards"] は state.incomingCards と同じ順に並んでいる
+    for c, real_c in zip(s.get("incomingCards", []), state.incomingCards):
+        c["db"] = lookup_card_db(c["name"]) or None
+        c["approx_attack"] = approx_incoming_attack(real_c)
 
     return mask_enemy_if_me_is_kiri(s)
 
 
-def decide_with_llm(state: GFState) -> Action:
-    llm_input = build_llm_state(state)
-    key = phase_key(state.phase)
-    phase_prompt = PHASE_PROMPTS.get(key, "")
+# --- compact state encoding ---
+# GF_STATE_ENCODING=compact のとき、カードの静的情報(db)は毎回 state に展開せず、
+# その state に出てくるカードだけの表(cards)を添えて短いIDで参照する。判断に効かない空フィールドも落とす。
+# 表を全カード分 system に載せると、プロンプトキャッシュが外れた回は full より多く送ることになる。
+STATE_ENCODING = os.getenv("GF_STATE_ENCODING", "full").lower()
+
+CARD_TABLE_PROMPT = (
+    "# カード表\n"
+    "state.cards は、この state に出てくるカードの静的情報の表 (TSV) である。"
+    "各カードの db はこの表の id を指す文字列で、db.element / db.defense などは表の該当列を参照すること。"
+    "db が null のカードは表に無いので overlay と raw_text から推定すること。"
+)
+
+def _compact_card(c: dict) -> dict:
+    out = {"index": c["index"], "name": c["name"]}
+    if c.get("overlay"):
+        out["overlay"] = c["overlay"]
+    if c.get("usable") is not None:
+        out["usable"] = c["usable"]
+    rec = CARD_INDEX.lookup(c["name"])
+    out["db"] = rec.cid if rec else None
+    if rec is None and c.get("raw_text"):
+        out["raw_text"] = c["raw_text"]
+    if "approx_attack" in c:
+        out["approx_attack"] = c["approx_attack"]
+    return out
+
+
+def _compact_player(p: dict) -> dict:
+    out = {k: p[k] for k in ("name", "hp", "mp", "gold") if k in p}
+    # 状態異常の raw_text は残りターン等を含みうるのでそのまま送る
+    if p.get("statuses"):
+        out["statuses"] = p["statuses"]
+    if p.get("info_hidden"):
+        out["info_hidden"] = True
+    return out
+
+
+def compact_llm_state(s: dict) -> dict:
+    out = {
+        "phase": s["phase"],
+        "me": _compact_player(s["me"]),
+        "enemy": _compact_player(s["enemy"]),
+        "hand": [_compact_card(c) for c in s.get("hand") or []],
+    }
+    if s.get("incomingCards"):
+        out["incomingCards"] = [_compact_card(c) for c in s["incomingCards"]]
+    if s.get("buyCandidate"):
+        out["buyCandidate"] = _compact_card(s["buyCandidate"])
+    if s.get("gf"):
+        out["gf"] = s["gf"]
+    sm = s.get("seenMiracles")
+    if sm and (sm.get("me") or sm.get("enemy")):
+        # UI 由来で重複が混ざることがあるので順序を保って重複除去
+        out["seenMiracles"] = {k: list(dict.fromkeys(v)) for k, v in sm.items()}
+    for k in ("attack_candidates", "defense_plan", "exchange_plan", "opponent"):
+        if s.get(k):
+            out[k] = s[k]
+    if s.get("history_rounds"):
+        out["history_rounds"] = s["history_rounds"]
+    cards = list(s.get("hand") or []) + list(s.get("incomingCards") or [])
+    if s.get("buyCandidate"):
+        cards.append(s["buyCandidate"])
+    recs = [r for r in (CARD_INDEX.lookup(c["name"]) for c in cards) if r]
+    if recs:
+        out["cards"] = CARD_INDEX.card_table(recs)
+    return out
+
+
+def encode_llm_state(state: GFState, session: GameSession) -> tuple[str, dict]:
+    s = build_llm_state(state, session)
+    if STATE_ENCODING == "compact":
+        s = compact_llm_state(s)
+    data = json_dumpb(s)
+    text = data.decode("utf-8")
+    state_tokens = approx_tokens(text)
+    # 実際に送るのは静的 prefix + state なので、両方を数える
+    prefix_tokens = PROMPTS.prefix_tokens(phase_key(state.phase))
+    size = {
+        "encoding": STATE_ENCODING,
+        "bytes": len(data),
+        "approx_tokens": state_tokens,
+        "prefix_tokens": prefix_tokens,
+        "total_tokens": prefix_tokens + state_tokens,
+    }
+    return text, size
+
+
+# --- prompt assembly ---
+# フェーズごとの静的 prefix は起動時に固定し、可変な state は最後の user メッセージだけに置く。
+def build_prompts(core: str, phases: Dict[str, str], card_table: str) -> PromptAssembler:
+    return PromptAssembler(core, phases,
+                           card_table=card_table if STATE_ENCODING == "compact" else None)
+
+
+PROMPTS = build_prompts(SYSTEM_CORE, PHASE_PROMPTS, CARD_TABLE_PROMPT)
+USAGE = UsageStats()
+
+
+# --- hot reload ---
+# godfield_cards.json と prompts/ の mtime を GF_RELOAD_INTERVAL 秒ごとに確認し、変わっていれば
+# 読み直す。読み込みと派生物の構築はスレッドで行い、差し替えはイベントループ上で await を挟まずに
+# まとめて行うので、判断の途中で古い DB と新しいプロンプトが混ざることはない。
+# 書きかけのファイルを掴まないよう、最終更新から GF_RELOAD_SETTLE 秒経つまでは待ち、
+# 読んでいる間に mtime/size が変わったら次の周回でやり直す。壊れた JSON は古い版を使い続ける。
+RELOAD_INTERVAL = float(os.getenv("GF_RELOAD_INTERVAL", "2"))
+RELOAD_SETTLE = float(os.getenv("GF_RELOAD_SETTLE", "0.5"))
+WARMUP = os.getenv("GF_WARMUP", "true").lower() == "true"
+RELOADS = METRICS.counter("gf_reloads_total", "Hot reload attempts", ["target", "result"])
+RELOAD_SECONDS = METRICS.histogram("gf_reload_seconds", "Time to rebuild and swap a reloaded target", ["target"])
+
+
+def file_stamp(paths: List[Path]) -> tuple:
+    out = []
+    for p in paths:
+        try:
+            st = p.stat()
+            out.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+
+class Watched:
+    """mtime が変わったファイル群を読み直す。build はスレッドで、apply はループ上で呼ぶ。"""
+
+    def __init__(self, name: str, paths: List[Path], build, apply):
+        self.name = name
+        self.paths = paths
+        self.build = build
+        self.apply = apply
+        self.stamp = file_stamp(paths)
+        self.reloads = 0
+        self.errors = 0
+        self.last_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def check(self, force: bool = False) -> Optional[str]:
+        stamp = file_stamp(self.paths)
+        if stamp == self.stamp and not force:
+            return None
+        newest = max((st[0] for st in stamp if st), default=0) / 1e9
+        if not force and time.time() - newest < RELOAD_SETTLE:
+            return "settling"
+        t = time.perf_counter()
+        try:
+            value = await asyncio.to_thread(self.build)
+        except Exception as e:
+            # 壊れたファイルは直されるまで読み直さない
+            self.stamp = stamp
+            self.errors += 1
+            self.last_error = repr(e)
+            RELOADS.inc(self.name, "error")
+            print(f"[GF RELOAD] {self.name}: keeping previous version ({e!r})")
+            return "error"
+        if file_stamp(self.paths) != stamp:
+            RELOADS.inc(self.name, "retry")
+            return "retry"
+        self.apply(value)
+        self.stamp = stamp
+        self.reloads += 1
+        self.last_ms = (time.perf_counter() - t) * 1000
+        self.last_error = None
+        RELOADS.inc(self.name, "ok")
+        RELOAD_SECONDS.observe(self.last_ms / 1000, self.name)
+        print(f"[GF RELOAD] {self.name} reloaded in {self.last_ms:.1f} ms")
+        return "ok"
+
+    def stats(self) -> dict:
+        return {"reloads": self.reloads, "errors": self.errors,
+                "last_ms": None if self.last_ms is None else round(self.last_ms, 2),
+                "last_error": self.last_error}
+
+
+def _build_cards() -> dict:
+    index = CardIndex.load(CARD_DB_PATH, strict=True)
+    return {
+        "index": index,
+        "targetable": targetable_cards(index),
+        # 既に使われていたときだけ作り直す（まだなら次の get_mc で作られる）
+        "mc": build_mc(index) if MC is not None else None,
+    }
+
+
+def _apply_cards(v: dict):
+    global CARD_INDEX, CARD_DB, TARGETABLE_CARDS, MC
+    CARD_INDEX = v["index"]
+    CARD_DB = CARD_INDEX.raw
+    TARGETABLE_CARDS = v["targetable"]
+    MC = v["mc"]
+    DECISION_CACHE.clear()
+
+
+def _apply_policy(v):
+    global POLICY
+    POLICY = v
+
+
+def _apply_prompts(v: tuple):
+    global SYSTEM_CORE, PHASE_PROMPTS, PROMPTS
+    SYSTEM_CORE, PHASE_PROMPTS = v
+    PROMPTS = build_prompts(SYSTEM_CORE, PHASE_PROMPTS, CARD_TABLE_PROMPT)
+    DECISION_CACHE.clear()
+
+
+WATCHED = [
+    Watched("cards", [CARD_DB_PATH], _build_cards, _apply_cards),
+    Watched("prompts", [PROMPT_DIR / f for f in PROMPT_FILES.values()], reload_prompts, _apply_prompts),
+    Watched("policy", [POLICY_PATH], load_local_policy, _apply_policy),
+]
+
+
+async def reload_all(force: bool = False) -> dict:
+    return {w.name: await w.check(force) for w in WATCHED}
+
+
+async def reload_loop():
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        try:
+            await reload_all()
+        except Exception as e:
+            print("[GF RELOAD] error:", repr(e))
+
+
+def warmup():
+    t = time.perf_counter()
+    get_mc()
+    try:
+        backend = get_backend()
+        if hasattr(backend, "client"):
+            backend.client()
+    except Exception as e:
+        print("[GF AI] LLM client not ready:", e)
+    print(f"[GF AI] warmup done in {(time.perf_counter() - t) * 1000:.0f} ms")
 
+
+async def decide_with_llm(state: GFState, session: GameSession, sig: Optional[str] = None,
+                          speculative: bool = False,
+                          deadline_at: Optional[float] = None) -> Optional[Action]:
+    """
+    speculative=True は先読み用: LLM が答えられなかったら（フォールバックなら）None を返す。
+    先読みはブレーカーを開け閉めしない（裏の仮定の失敗で本番の要求を止めない）。
+    deadline_at は要求全体の期限（perf_counter の時刻）。先読みの待ちなどで使った分は差し引く。
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    if speculative and BREAKER.state != CircuitBreaker.CLOSED:
+        return None
+    deadline = phase_deadline(state.phase)
+    if deadline_at is not None:
+        deadline = min(deadline, deadline_at - t0)
+    if deadline <= 0:
+        # 先読みを待つ間に期限を使い切った: LLM もブレーカーの試行枠も使わずにローカルの判断を返す
+        local = decide_rule_based(state)
+        FALLBACKS.inc("deadline")
+        trace_decision(state, session, {"rules": time.perf_counter() - t0}, action=local,
+                       speculative=speculative, error="deadline spent")
+        return None if speculative else local
+    if not BREAKER.allow():
+        # 障害中は失敗する呼び出しを待たずにローカルの判断を返す
+        local = decide_rule_based(state)
+        FALLBACKS.inc("breaker_open")
+        trace_decision(state, session, {"rules": time.perf_counter() - t0},
+                       action=local, error="circuit open")
+        return local
+    llm_input, payload_size = encode_llm_state(state, session)
+    key = phase_key(state.phase)
+    timings["build"] = time.perf_counter() - t0
+    print(f"[GF PAYLOAD] {payload_size['encoding']} "
+          f"{payload_size['bytes']}B ~{payload_size['approx_tokens']}tok "
+          f"(+prefix ~{payload_size['prefix_tokens']}tok = ~{payload_size['total_tokens']}tok)")
+
+    # ルール/ソルバーの答えを先に用意しておき、LLM が期限内に有効な応答を
+    # 返せなければそれを即返す
+    local = decide_rule_based(state)
+    decision_id = uuid.uuid4().hex[:12]
+    early = {}  # reason を待たずに返した Action（reason が届いたらキャッシュに入れる）
+
+    def on_reason(full_txt: str, fields: dict, counts: dict):
+        # 早期確定したあと、ストリームの残り(reason)を読み切った時点で追記する
+        if sig is not None and "action" in early and isinstance(fields.get("reason"), str):
+            DECISION_CACHE.put(sig, early["action"].model_copy(update={"reason": fields["reason"]}))
+        TRACE.write({
+            "kind": "reason",
+            "id": decision_id,
+            "ts": time.time(),
+            "session": session.session_id,
+            "turn": session.turn_counter,
+            "llm_raw": full_txt,
+            "reason": fields.get("reason"),
+            "usage": counts,
+        })
+
+    raw_txt = None
+    usage = None
+    budget = max(0.0, deadline - (time.perf_counter() - t0))
+    if budget <= 0:
+        # 期限を使い切っている（呼んでも必ずタイムアウトする）ので LLM を呼ばない
+        BREAKER.release()
+        FALLBACKS.inc("deadline")
+        trace_decision(state, session, timings, decision_id=decision_id,
+                       payload=payload_size, action=local, speculative=speculative,
+                       error="deadline spent")
+        return None if speculative else local
+    t_llm = time.perf_counter()
     try:
-        resp = client.chat.completions.create(
-            model=os.getenv("GF_MODEL", "gpt-5.1"),
-            messages=[
-                {"role": "system", "content": SYSTEM_CORE},
-                {"role": "system", "content": phase_prompt},
-                {"role": "user", "content": json.dumps(
-                    llm_input, ensure_ascii=False)},
-            ],
-            # temperature=0.0
-        )
-        raw_txt = resp.choices[0].message.content.strip()
-        json_txt = raw_txt
-        if "```json" in raw_txt:
-            json_txt = raw_txt.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_txt:
-            json_txt = raw_txt.split("```")[0].strip()
-        data = json.loads(json_txt)
+        raw_txt, data, usage = await hedged_completion(
+            key, PROMPTS.messages(key, llm_input), budget,
+            hand=state.hand, on_finish=on_reason)
+    except asyncio.TimeoutError:
+        print(f"[GF LLM TIMEOUT] {key}: no answer within {deadline:.1f}s")
+        timings["llm"] = time.perf_counter() - t_llm
+        if not speculative:
+            BREAKER.failure()
+        LLM_ERRORS.inc("timeout")
+        FALLBACKS.inc("timeout")
+        trace_decision(state, session, timings, decision_id=decision_id,
+                       payload=payload_size, action=local, speculative=speculative,
+                       error=f"timeout after {deadline:.1f}s")
+        return None if speculative else local
     except Exception as e:
         print(f"[GF LLM ERROR] {e}")
-        return decide_rule_based(state)
+        timings["llm"] = time.perf_counter() - t_llm
+        # 応答が JSON として読めないだけなら LLM 自体は生きている
+        if not speculative:
+            if isinstance(e, ValueError):
+                BREAKER.success()
+            else:
+                BREAKER.failure()
+        LLM_ERRORS.inc(type(e).__name__)
+        FALLBACKS.inc("llm_error")
+        trace_decision(state, session, timings, decision_id=decision_id,
+                       payload=payload_size, usage=usage, speculative=speculative,
+                       raw_txt=raw_txt, action=local, error=repr(e))
+        return None if speculative else local
+    timings["llm"] = time.perf_counter() - t_llm
+    if not speculative:
+        BREAKER.success()
+    t_rules = time.perf_counter()
 
     atype = data.get("type", "none")
     raw_indices = data.get("cardIndices", [])
@@ -709,8 +1864,12 @@ def decide_with_llm(state: GFState) -> Action:
     valid_indices = adjust_sell_for_lethal(atype, valid_indices, state)
 
     # ルール適用
+    t_sanitize = time.perf_counter()
     final_type, final_indices, correction_logs = sanitize_strict_rules(
         atype, valid_indices, state)
+    timings["sanitize"] = time.perf_counter() - t_sanitize
+    if correction_logs:
+        CORRECTIONS.inc(key, n=len(correction_logs))
 
     fallback_msg = ""
     if atype == "attack" and not final_indices:
@@ -718,27 +1877,28 @@ def decide_with_llm(state: GFState) -> Action:
         if fallback:
             final_type, final_indices = "attack", fallback
             fallback_msg = "【FALLBACK】攻撃案無効化 -> 最強武器自動選択"
+            FALLBACKS.inc("attack_weapon")
         else:
             final_type = "attack-pass"
             fallback_msg = "【FALLBACK】攻撃案無効化 -> パス"
+            FALLBACKS.inc("attack_pass")
 
     if atype == "defend" and not final_indices:
         final_type = "defense-pass"
         fallback_msg = "【FALLBACK】防御案無効化 -> パス"
+        FALLBACKS.inc("defense_pass")
 
-    # ex_obj 生成（ログより先に）
-    ex_obj = None
-    if exchange and (final_type == "exchange" or any(c.name == "両替" for c in state.hand if c.index in final_indices)):
-        try:
-            raw_plan = ExchangePlan(**exchange)
-            ex_obj = normalize_exchange_plan(raw_plan, state.me)
-        except:
-            pass
+    if final_type in ("defend", "defense-pass") and state.incomingCards:
+        checked = verify_defense(final_indices, state, correction_logs)
+        if checked != final_indices:
+            FALLBACKS.inc("defense_solver")
+            final_type = "defend" if checked else "defense-pass"
+            final_indices = checked
 
-    # 両替なのにプランがない場合のフォールバック
-    if ex_obj is None and (final_type == "exchange" or any(c.name == "両替" for c in state.hand if c.index in final_indices)):
-        ex_obj = ExchangePlan(
-            hp=state.me.hp, mp=state.me.mp, gold=state.me.gold)
+    # ex_obj 生成（ログより先に）。配分はソルバーで検証/補完する
+    ex_obj = None
+    if final_type == "exchange" or any(c.name == "両替" for c in state.hand if c.index in final_indices):
+        ex_obj = plan_exchange(exchange, state, correction_logs)
 
     buy_val = None
     if final_type == "buy_choice":
@@ -749,45 +1909,7 @@ def decide_with_llm(state: GFState) -> Action:
         if buy_val not in (0, 1):
             buy_val = 0
 
-    # === LOG GENERATION ===
-    raw_names = get_card_name(raw_indices, state.hand)
-    final_names = get_card_name(final_indices, state.hand)
-
-    log_blocks = []
-    log_blocks.append(f"★ PromptKey: {key}")
-    log_blocks.append(
-        f"================ [TURN {_TURN_COUNTER}] Phase: {state.phase} ================")
-    log_blocks.append(format_state_for_log(state, GAME_HISTORY))
-    log_blocks.append("-" * 50)
-    log_blocks.append(f"★ AI Output (Raw):")
-    log_blocks.append(f"   Type: {atype}")
-    log_blocks.append(f"   Cards: {raw_indices} => {raw_names}")
-    log_blocks.append(f"   Reason: {reason}")
-    if exchange:
-        log_blocks.append(f"   Exchange: {exchange}")
-    if buy is not None:
-        log_blocks.append(f"   Buy: {buy}")
-
-    if correction_logs:
-        log_blocks.append(f"\n★ Python Corrections:")
-        for l in correction_logs:
-            log_blocks.append(f"   [FIX] {l}")
-
-    if fallback_msg:
-        log_blocks.append(f"\n★ {fallback_msg}")
-
-    if raw_indices != final_indices or atype != final_type:
-        log_blocks.append(f"\n★ Final Action:")
-        log_blocks.append(f"   Type: {final_type}")
-        log_blocks.append(f"   Cards: {final_indices} => {final_names}")
-        if ex_obj:
-            log_blocks.append(f"   Exchange Plan: {ex_obj}")
-
-    log_blocks.append("\n" + "="*60 + "\n")
-    write_debug_log("\n".join(log_blocks))
-    # =======================
-
-    return Action(
+    action = Action(
         type=final_type,
         cardIndices=final_indices,
         reason=reason,
@@ -795,23 +1917,359 @@ def decide_with_llm(state: GFState) -> Action:
         exchange=ex_obj,
         target=target,
     )
+    timings["rules"] = time.perf_counter() - t_rules
+    timings["total"] = time.perf_counter() - t0
+    trace_decision(state, session, timings, decision_id=decision_id,
+                   payload=payload_size, usage=usage, raw_txt=raw_txt, llm=data,
+                   corrections=correction_logs, fallback=fallback_msg, action=action,
+                   speculative=speculative)
+
+    # フォールバック(タイムアウト/エラー)は次回LLMに再挑戦させたいので、成功時だけ保存。
+    # reason がまだ流れている途中なら、仮の reason のまま保存せず on_reason で入れる
+    if action.reason == EARLY_REASON:
+        early["action"] = action
+    elif sig is not None:
+        DECISION_CACHE.put(sig, action)
+    return action
 
 
-@app.post("/decide", response_model=Action)
-def decide(state: GFState):
-    global _LAST_ACTION
-    update_history(state)
-    print(f"[GF REQ] Phase: {state.phase}")
+VALID_PHASES = ("attack", "defense", "buy-choice", "buy_choice")
+
+
+def open_decision(state: GFState) -> GameSession:
+    """セッションを引いて履歴/相手モデルを進める。届いた順に同期で呼ぶこと。"""
+    t0 = time.perf_counter()
+    session = SESSIONS.get(state.sessionId)
+    update_history(session, state)
+    STAGE_SECONDS.observe(time.perf_counter() - t0, "update_history")
+    print(f"[GF REQ] {session.session_id} Phase: {state.phase}")
+    return session
+
 
-    valid_phases = ["attack", "defense", "buy-choice", "buy_choice"]
-    if state.phase not in valid_phases:
+def decision_flight(state: GFState, session: GameSession, sig: str,
+                    deadline_at: Optional[float] = None):
+    return DECISION_FLIGHTS.do((session.session_id, sig),
+                               lambda: decide_with_llm(state, session, sig, deadline_at=deadline_at))
+
+
+async def decide_for(state: GFState, session: GameSession, t0: float) -> Action:
+    if state.phase not in VALID_PHASES:
+        DECISIONS.inc("ignored")
+        maybe_speculate(state, session)
         return Action(type="none", reason="Ignored phase")
 
-    if os.getenv("USE_LLM", "true").lower() == "true":
-        action = decide_with_llm(state)
+    lethal = find_lethal(state)
+    local = None
+    if lethal is None:
+        local = decide_local_exchange(state) or decide_local_attack(state)
+    if lethal is not None:
+        action = lethal
+        source = "lethal"
+        LETHAL_DECISIONS.inc(lethal.type)
+        trace_decision(state, session, {"lethal": time.perf_counter() - t0}, action=action)
+    elif local is not None:
+        action = local
+        source = "local"
+    elif os.getenv("USE_LLM", "true").lower() == "true":
+        sig = state_signature(state)
+        # 期限は要求ごとに1つ。先読みを待った分は LLM の持ち時間から引く
+        deadline_at = t0 + phase_deadline(state.phase)
+        action = DECISION_CACHE.get(sig)
+        if action is not None:
+            print(f"[GF CACHE] hit {sig[:8]}")
+            source = "cache"
+        else:
+            t_policy = time.perf_counter()
+            action, result = policy_action(state)
+            if result != "skip":
+                POLICY_DECISIONS.inc(result)
+            source = "policy"
+            if action is not None:
+                trace_decision(state, session, {"policy": time.perf_counter() - t_policy}, action=action)
+            else:
+                action = await speculative_answer(state, session, deadline_at)
+                source = "speculative"
+            if action is None:
+                action = await decision_flight(state, session, sig, deadline_at)
+                source = "llm"
     else:
         action = decide_rule_based(state)
+        source = "rule"
 
-    _LAST_ACTION = action
+    session.last_action = action
     print(f"[GF ACT] {action.type} {action.cardIndices}")
+    DECISIONS.inc(source)
+    STAGE_SECONDS.observe(time.perf_counter() - t0, "decide")
     return action
+
+
+@app.post("/decide", response_model=Action)
+async def decide(state: GFState):
+    t0 = time.perf_counter()
+    t_req = _REQUEST_START.get()
+    if t_req is not None:
+        STAGE_SECONDS.observe(t0 - t_req, "parse")
+    return await decide_for(state, open_decision(state), t0)
+
+
+# ================== WebSocket ==================
+# 接続を張りっぱなしにして、クライアントは前回送った state から変わった
+# トップレベルのフィールドだけを送る:
+#   {"seq": n, "base": n-1, "delta": {...}, "act": true}
+# 初回・再接続時・サーバから resync を返された後は {"seq": n, "full": {...}}。
+# サーバは接続ごとに直前の GFState を持ち、変わっていないフィールドは検証済みの
+# モデルをそのまま使い回す。act=true なら {"seq": n, "action": {...}} を返す。
+# act=false（クライアントが演出/奇跡確認中でまだ動けない）でも行動フェーズに
+# 入っていれば、その時点で判断を始めておく（同じ署名の act が来たら合流する）。
+WS_ENABLED = os.getenv("GF_WS", "true").lower() == "true"
+WS_PREFETCH = os.getenv("GF_WS_PREFETCH", "true").lower() == "true"
+WS_MESSAGES = METRICS.counter("gf_ws_messages_total", "WebSocket state messages", ["kind"])
+STATE_FIELDS = tuple(GFState.model_fields)
+
+
+def apply_state_delta(base: Optional[GFState], delta: dict) -> GFState:
+    if base is None:
+        return GFState(**delta)
+    fields = {k: getattr(base, k) for k in STATE_FIELDS if k not in delta}
+    fields.update(delta)
+    return GFState(**fields)
+
+
+def prefetch_decision(state: GFState) -> bool:
+    if (state.phase not in VALID_PHASES or os.getenv("USE_LLM", "true").lower() != "true"
+            or find_lethal(state) is not None or decide_local_attack(state) is not None
+            or policy_action(state)[0] is not None):
+        return False
+    session = SESSIONS.get(state.sessionId)
+    sig = state_signature(state)
+    if (DECISION_CACHE.get(sig) is not None or (session.session_id, sig) in DECISION_FLIGHTS
+            or speculation_key(state) in SPECULATOR):
+        return False
+    spawn(decision_flight(state, session, sig))
+    WS_MESSAGES.inc("prefetch")
+    return True
+
+
+@app.websocket("/ws")
+async def decide_ws(ws: WebSocket):
+    if not WS_ENABLED:
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    base: Optional[GFState] = None
+    base_seq = None
+    send_lock = asyncio.Lock()
+    tasks: set = set()
+
+    async def send(obj: dict):
+        async with send_lock:
+            await ws.send_text(json_dumpb(obj).decode("utf-8"))
+
+    async def answer(seq, state: GFState, session: GameSession, t0: float):
+        try:
+            action = await decide_for(state, session, t0)
+        except Exception as e:
+            print(f"[GF WS ERROR] {e!r}")
+            await send({"seq": seq, "error": repr(e)})
+            return
+        await send({"seq": seq, "action": action.dict()})
+
+    try:
+        while True:
+            text = await ws.receive_text()
+            t0 = time.perf_counter()
+            msg = None
+            try:
+                msg = json_loads(text)
+                seq = msg.get("seq")
+                if "full" in msg:
+                    state = apply_state_delta(None, msg["full"])
+                    kind = "full"
+                elif base is not None and msg.get("base") == base_seq:
+                    state = apply_state_delta(base, msg.get("delta") or {})
+                    kind = "delta"
+                else:
+                    # 基準がずれた（取りこぼし・サーバ再起動）ので全体を送り直してもらう
+                    WS_MESSAGES.inc("resync")
+                    await send({"seq": seq, "resync": True})
+                    continue
+            except (ValueError, TypeError, AttributeError) as e:
+                # pydantic の ValidationError も ValueError
+                WS_MESSAGES.inc("invalid")
+                base = None
+                await send({"seq": msg.get("seq") if isinstance(msg, dict) else None,
+                            "resync": True, "error": str(e)[:200]})
+                continue
+            base, base_seq = state, seq
+            WS_MESSAGES.inc(kind)
+            STAGE_SECONDS.observe(time.perf_counter() - t0, "parse")
+
+            if msg.get("act", True):
+                t_dec = time.perf_counter()
+                session = open_decision(state)
+                task = spawn(answer(seq, state, session, t_dec))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif state.phase not in VALID_PHASES:
+                maybe_speculate(state, SESSIONS.get(state.sessionId))
+            elif WS_PREFETCH:
+                prefetch_decision(state)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 判断そのものは SingleFlight 側で続く（結果はキャッシュに残る）
+        for t in tasks:
+            t.cancel()
+
+
+# ================== Speculation ==================
+# 行動できないフェーズ（相手のターン）の state が来たら、次に来そうな行動フェーズを
+# 仮定して先に LLM に判断させておく:
+#   - 今の手札での攻撃
+#   - 相手が撃ちそうな攻撃（見えている奇跡 / 手札にあると分かっている武器 / 前回の攻撃）ごとの防御
+# 本番の要求は speculation_key（攻撃なら自分/相手/手札、防御なら自分/手札/受ける攻撃の
+# ダメージ・命中率・属性）が一致すれば先読みの答えを使う。仮定の state で作った答えなので、
+# 本物の state で sanitize / 防御検証を通し直して変わらない時だけ採用する。
+SPECULATE = os.getenv("GF_SPECULATE", "false").lower() == "true"
+SPEC_DEFENSE = int(os.getenv("GF_SPEC_DEFENSE", "2"))
+SPEC_COMPLETION_TOKENS = 200  # 1件あたりの出力トークンの見積もり
+# 走行中の先読みに合流して待つのは、その要求の期限のこの割合まで（残りは LLM 本番に回す）
+SPEC_WAIT_SHARE = float(os.getenv("GF_SPEC_WAIT_SHARE", "0.5"))
+SPECULATOR = Speculator(
+    tokens_per_min=float(os.getenv("GF_SPEC_TOKENS_PER_MIN", "200000")),
+    max_inflight=int(os.getenv("GF_SPEC_MAX_INFLIGHT", "2")),
+    ttl=float(os.getenv("GF_SPEC_TTL", "120")),
+    enabled=SPECULATE,
+)
+SESSIONS.on_evict = SPECULATOR.cancel
+SPECULATIONS = METRICS.counter("gf_speculations_total", "Speculative decisions", ["result"])
+
+
+def _status_names(p: Player) -> list:
+    return sorted(st.name for st in p.statuses)
+
+
+def speculation_key(state: GFState) -> Optional[str]:
+    key = phase_key(state.phase)
+    me = state.me
+    canon = [key, [me.hp, me.mp, me.gold, _status_names(me)],
+             [[c.index, c.name, c.overlay] for c in state.hand]]
+    if key == "attack":
+        e = state.enemy
+        canon.append([e.hp, e.mp, e.gold, _status_names(e)])
+    elif key == "defense":
+        atk = incoming_attack(state.incomingCards, CARD_INDEX)
+        if atk.damage <= 0:
+            return None  # 攻撃以外（呪い・交換など）は仮定しない
+        canon.append([atk.damage, atk.hit_rate, atk.element])
+    else:
+        return None
+    return key[0] + hashlib.blake2b(json_dumpb(canon), digest_size=16).hexdigest()
+
+
+def speculative_states(state: GFState, session: GameSession) -> list[GFState]:
+    # 相手ターン中の usable は当てにならないので外す（本番で sanitize し直す）
+    common = {"hand": [c.model_copy(update={"usable": None}) for c in state.hand],
+              "incomingCards": [], "buyCandidate": None}
+    out = []
+    attack = apply_state_delta(state, {**common, "phase": "attack"})
+    if (find_lethal(attack) is None and decide_local_attack(attack) is None
+            and policy_action(attack)[0] is None):
+        out.append(attack)
+    if OPPONENT_MODEL:
+        for names in session.opponent.likely_attacks(SPEC_DEFENSE):
+            incoming = [IncomingCard(index=i, name=n, raw_text="") for i, n in enumerate(names)]
+            defense = apply_state_delta(state, {**common, "phase": "defense", "incomingCards": incoming})
+            if policy_action(defense)[0] is None:
+                out.append(defense)
+    return out
+
+
+def maybe_speculate(state: GFState, session: GameSession) -> int:
+    if (not SPECULATOR.enabled or not state.hand or state.phase in VALID_PHASES
+            or os.getenv("USE_LLM", "true").lower() != "true"
+            or BREAKER.state != CircuitBreaker.CLOSED):
+        return 0
+    # 手札・HP などが変わったら、前の仮定で走っている先読みは捨てる
+    base = state_signature(apply_state_delta(state, {"phase": "other"}))
+
+    def jobs():
+        for hyp in speculative_states(state, session):
+            key = speculation_key(hyp)
+            if key is None or key in SPECULATOR:
+                continue
+            # 毎回送る静的 prefix（共通ルール・フェーズ指示）も含めて見積もる
+            _, size = encode_llm_state(hyp, session)
+            yield (key, size["total_tokens"] + SPEC_COMPLETION_TOKENS,
+                   lambda h=hyp: decide_with_llm(h, session, speculative=True))
+
+    n = SPECULATOR.schedule(session.session_id, base, jobs())
+    if n:
+        SPECULATIONS.inc("scheduled", n=n)
+        print(f"[GF SPEC] {session.session_id} started {n}")
+    return n
+
+
+async def speculative_answer(state: GFState, session: GameSession,
+                             deadline_at: float) -> Optional[Action]:
+    if not SPECULATOR.enabled:
+        return None
+    key = speculation_key(state)
+    # 本番の state と違う仮定の先読みはもう要らない
+    SPECULATOR.cancel(session.session_id, keep=key)
+    if key is None:
+        return None
+    wait = min(phase_deadline(state.phase) * SPEC_WAIT_SHARE, deadline_at - time.perf_counter())
+    spec = await SPECULATOR.lookup(key, max(0.0, wait))
+    if spec is None:
+        return None
+    t, idx, logs = sanitize_strict_rules(spec.type, list(spec.cardIndices), state)
+    if t in ("defend", "defense-pass") and state.incomingCards:
+        idx = verify_defense(idx, state, logs)
+    if t != spec.type or idx != spec.cardIndices:
+        SPECULATIONS.inc("rejected")
+        print(f"[GF SPEC] rejected {spec.type} {spec.cardIndices} -> {t} {idx}")
+        return None
+    SPECULATIONS.inc("hit")
+    print(f"[GF SPEC] hit {key[:9]}")
+    return spec
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = DECISION_CACHE.stats()
+    stats["inflight"] = len(DECISION_FLIGHTS)
+    stats["coalesced"] = DECISION_FLIGHTS.coalesced
+    stats["hedged"] = LLM_LATENCY.hedged
+    stats["speculation"] = SPECULATOR.stats()
+    return stats
+
+
+@app.get("/usage")
+def usage_stats():
+    return USAGE.snapshot()
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    return {"backend": LLM_BACKEND, "model": LLM_MODEL, "retries": RETRY.retries,
+            "breaker": BREAKER.stats()}
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/reload")
+def reload_stats():
+    return {"startup_ms": round(STARTUP_SEC * 1000, 1), **{w.name: w.stats() for w in WATCHED}}
+
+
+@app.post("/reload")
+async def reload_now():
+    return {"result": await reload_all(force=True), **reload_stats()}
+
+
+STARTUP_SEC = time.perf_counter() - _T_START
+print(f"[GF AI] server module loaded in {STARTUP_SEC * 1000:.0f} ms")
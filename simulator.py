@@ -0,0 +1,672 @@
+"""
+godfield_cards.json だけで回るヘッドレス対戦シミュレータ。
+
+プロンプトやルールの変更を、ブラウザで実戦を回さずに方策同士の勝率で比べるためのもの。
+方策は「/decide の JSON を受け取って Action 相当の dict を返す callable」で、
+組み込みの random / greedy / rule（server.decide_rule_based）か "module:func" で指定する。
+
+  python simulator.py --a rule --b greedy --games 2000 --workers 4 --out sim.json
+
+実ゲームからの簡略化:
+  - 山札は DB の武器/防具/奇跡/回復/取引(+太陽のお守り)から一様に引く。指輪と大半の「その他」は出ない
+  - 状態異常は 霧（相手ステータスが見えない。マスクは server 側）と、
+    風邪/熱病/地獄病/天国病 の毎ターン定数ダメージだけ効果を持つ。ほかは付与されるだけ
+  - 奇跡は使っても手札に残り（MPだけ消費）、武器・防具・回復・取引は使うと無くなる
+  - 売る: 相手は価格を gold → MP → HP の順で払い、カードは相手の手札へ。スーパーミラーではね返せる
+  - 買う: 相手の手札からランダムな1枚を提示し、買うなら価格を相手に払って受け取る
+  - 効果を模していない奇跡（オーラ・蜃気楼・乱気流・解放）は usable:false
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+import argparse
+import contextlib
+import importlib
+import json
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+from card_index import CardIndex, CardRecord
+from solvers import (armor_blocks, attack_options, card_attack, classify_attack_card,
+                     combine_elements, defense_options)
+
+BASE_DIR = Path(__file__).resolve().parent
+CARD_DB_PATH = BASE_DIR / "godfield_cards.json"
+
+START_HP, START_MP, START_GOLD = 40, 10, 20
+START_HAND = 8
+HAND_MAX = 16
+STAT_MAX = 99
+MAX_TURNS = 150
+STATUS_TURNS = 5
+FOG_TURNS = 3
+# 毎ターン開始時のダメージ（近似）
+STATUS_DOT = {"風邪": 1, "熱病": 2, "地獄病": 3, "天国病": 2}
+MINOR_CURE = ("風邪", "熱病", "霧", "閃光")
+INERT_MIRACLES = ("オーラ", "蜃気楼", "乱気流", "解放")
+EXTRA_DECK = ("太陽のお守り",)
+
+_grant_re = re.compile(r"(\S+?)を付与")
+_on_damage_re = re.compile(r"ダメージで(\S+?)(?:$|[、。])")
+_hp_plus_re = re.compile(r"\+HP(\d+)")
+_mp_plus_re = re.compile(r"\+MP(\d+)")
+_gold_re = re.compile(r"(\d+)円得る")
+
+
+class CardView(NamedTuple):
+    """solvers に渡す手札1枚（server の Card と同じ属性名）。"""
+    index: int
+    name: str
+    overlay: str
+    raw_text: str
+    usable: Optional[bool]
+
+
+def overlay_for(rec: CardRecord) -> str:
+    """クライアントが DOM から読むのと同じ形の短い表示。"""
+    if rec.attack > 0 and rec.category in ("weapon", "miracle"):
+        if rec.attack_class == "plus":
+            return f"+攻{rec.attack}"
+        if rec.hit_rate < 1.0:
+            return f"{int(rec.hit_rate * 100)}%攻{rec.attack}"
+        return f"攻{rec.attack}"
+    if rec.defense > 0:
+        return f"守{rec.defense}"
+    return ""
+
+
+def _desc(rec: CardRecord) -> str:
+    return rec.info.get("description") or ""
+
+
+_TEXT: Dict[str, tuple] = {}
+
+
+def _card_text(rec: CardRecord) -> tuple:
+    """(overlay, raw_text)。state を作るたびに正規表現や整形をしないようカード名でメモする。"""
+    t = _TEXT.get(rec.name)
+    if t is None:
+        t = _TEXT[rec.name] = (overlay_for(rec), _desc(rec) or rec.name)
+    return t
+
+
+# ================== 盤面 ==================
+
+class SimPlayer:
+    __slots__ = ("hp", "mp", "gold", "hand", "statuses", "seen_miracles")
+
+    def __init__(self):
+        self.hp, self.mp, self.gold = START_HP, START_MP, START_GOLD
+        self.hand: List[CardRecord] = []
+        self.statuses: Dict[str, int] = {}   # 名前 -> 残りターン
+        self.seen_miracles: List[str] = []
+
+    def public(self, name: str) -> dict:
+        return {
+            "name": name, "hp": self.hp, "mp": self.mp, "gold": self.gold,
+            "statuses": [{"name": k, "raw_text": f"{k}({v})"} for k, v in self.statuses.items()],
+        }
+
+
+def _clamp(v: int) -> int:
+    return max(0, min(STAT_MAX, v))
+
+
+class Game:
+    def __init__(self, deck: Sequence[CardRecord], rng: random.Random):
+        self.deck = deck
+        self.rng = rng
+        self.players = (SimPlayer(), SimPlayer())
+        self.invalid = [0, 0]
+        for p in self.players:
+            for _ in range(START_HAND):
+                self.draw(p)
+
+    def draw(self, p: SimPlayer):
+        if len(p.hand) < HAND_MAX:
+            p.hand.append(self.rng.choice(self.deck))
+
+    # ---------- policy に見せる state ----------
+
+    def _usable_attack(self, p: SimPlayer, rec: CardRecord) -> Optional[bool]:
+        cat = rec.category
+        if cat in ("heal", "trade"):
+            return True
+        if cat == "miracle":
+            if rec.name in INERT_MIRACLES or rec.name == "壁":
+                return False
+            return rec.mp_cost <= p.mp
+        if cat == "weapon" and rec.attack_class != "other":
+            return not rec.single_forbidden and rec.mp_cost <= p.mp
+        return False
+
+    def _usable_defense(self, p: SimPlayer, rec: CardRecord, element: str, hostile: str) -> bool:
+        if rec.mp_cost > p.mp:
+            return False
+        if rec.name == "スーパーミラー":
+            return True
+        if hostile != "attack":
+            return False  # 売る・状態異常は防具では止まらない
+        if rec.name in ("虹のカーテン", "壁"):
+            return True
+        return rec.defense > 0 and armor_blocks(element, rec.element)
+
+    def state(self, seat: int, phase: str, game_id: str, incoming: Sequence[CardRecord] = (),
+              element: str = "無", hostile: str = "attack",
+              buy: Optional[CardRecord] = None) -> dict:
+        me, enemy = self.players[seat], self.players[1 - seat]
+        hand = []
+        for i, rec in enumerate(me.hand):
+            if phase == "attack":
+                usable = self._usable_attack(me, rec)
+            elif phase == "defense":
+                usable = self._usable_defense(me, rec, element, hostile)
+            else:
+                usable = None
+            overlay, raw_text = _card_text(rec)
+            hand.append({"index": i, "name": rec.name, "overlay": overlay,
+                         "raw_text": raw_text, "usable": usable})
+        s = {
+            "phase": phase,
+            "sessionId": f"{game_id}-{seat}",
+            "me": me.public("me"),
+            "enemy": enemy.public("enemy"),
+            "hand": hand,
+            "incomingCards": [{"index": i, "name": r.name, "overlay": _card_text(r)[0],
+                               "raw_text": _card_text(r)[1]} for i, r in enumerate(incoming)],
+            "seenMiracles": {"me": list(me.seen_miracles), "enemy": list(enemy.seen_miracles)},
+        }
+        if buy is not None:
+            s["buyCandidate"] = {"index": 0, "name": buy.name, "overlay": _card_text(buy)[0],
+                                 "raw_text": _card_text(buy)[1]}
+        return s
+
+    # ---------- 解決 ----------
+
+    def _pick(self, p: SimPlayer, indices) -> Optional[List[int]]:
+        if not isinstance(indices, list):
+            return None
+        out = []
+        for i in indices:
+            if not isinstance(i, int) or not 0 <= i < len(p.hand) or i in out:
+                return None
+            out.append(i)
+        return out
+
+    def _discard(self, p: SimPlayer, indices: Sequence[int], keep_miracles: bool = True):
+        for i in sorted(indices, reverse=True):
+            if keep_miracles and p.hand[i].category == "miracle":
+                continue
+            del p.hand[i]
+
+    def _pay(self, p: SimPlayer, amount: int) -> int:
+        # 支払いは gold → MP → HP の順（売り殺しの条件 price >= hp+mp+gold と一致）
+        paid = min(p.gold, amount)
+        p.gold -= paid
+        rest = amount - paid
+        take = min(p.mp, rest)
+        p.mp -= take
+        p.hp -= rest - take
+        return paid
+
+    def _grant(self, p: SimPlayer, status: str):
+        p.statuses[status] = FOG_TURNS if status == "霧" else STATUS_TURNS
+
+    def _cure(self, p: SimPlayer, desc: str):
+        if "すべての災い" in desc:
+            p.statuses.clear()
+        elif "を払う" in desc:
+            for k in MINOR_CURE:
+                p.statuses.pop(k, None)
+
+    def start_turn(self, seat: int):
+        p = self.players[seat]
+        for name in list(p.statuses):
+            p.hp -= STATUS_DOT.get(name, 0)
+            p.statuses[name] -= 1
+            if p.statuses[name] <= 0:
+                del p.statuses[name]
+        self.draw(p)
+
+    def defend(self, seat: int, action: dict, incoming: List[CardRecord], element: str,
+               hostile: str) -> tuple[int, bool, bool]:
+        """(防御力, ミラー, 壁で止めた)。不正な防御はパス扱い。"""
+        p = self.players[seat]
+        if action.get("type") not in ("defend", "defense"):
+            return 0, False, False
+        idx = self._pick(p, action.get("cardIndices") or [])
+        if not idx:
+            return 0, False, False
+        recs = [p.hand[i] for i in idx]
+        rainbow = recs[0].name == "虹のカーテン"
+        elem = "無" if rainbow else element
+        cost = sum(r.mp_cost for r in recs)
+        ok = cost <= p.mp
+        for r in recs:
+            if r.name in ("虹のカーテン", "スーパーミラー", "壁"):
+                ok = ok and (r.name == "スーパーミラー" or hostile == "attack")
+            elif not (hostile == "attack" and r.defense > 0
+                      and (rainbow or armor_blocks(elem, r.element))):
+                ok = False
+        if not ok:
+            self.invalid[seat] += 1
+            return 0, False, False
+        p.mp -= cost
+        self._discard(p, idx)
+        mirror = any(r.name == "スーパーミラー" for r in recs)
+        wall = any(r.name == "壁" for r in recs) and elem == "無"
+        return sum(r.defense for r in recs if r.name != "虹のカーテン"), mirror, wall
+
+    def _valid_attack(self, p: SimPlayer, recs: List[CardRecord]) -> bool:
+        if any(r.category not in ("weapon", "miracle") or r.attack_class == "other" for r in recs):
+            return False
+        if all(r.single_forbidden for r in recs):
+            return False
+        if len(recs) > 1 and any(r.solo_only for r in recs):
+            return False
+        kinds = [classify_attack_card(_card_text(r)[0], r) for r in recs]
+        if sum(k != "plus" for k in kinds) > 1 or ("prob" in kinds and len(recs) > 1):
+            return False
+        forced = {r.forced_element for r in recs if r.forced_element}
+        return len(forced) <= 1 and sum(r.mp_cost for r in recs) <= p.mp
+
+
+def play_game(policies: Sequence[Callable[[dict], Any]], deck: Sequence[CardRecord],
+              seed: int, first: int = 0, game_id: str = "sim",
+              timings: Optional[Sequence[list]] = None) -> dict:
+    """1ゲーム回して {"winner": 0/1/None, "turns": n, "invalid": [..]} を返す。"""
+    rng = random.Random(seed)
+    g = Game(deck, rng)
+    times = timings or ([], [])
+
+    def ask(seat: int, state: dict) -> dict:
+        t = time.perf_counter()
+        out = policies[seat](state)
+        times[seat].append(time.perf_counter() - t)
+        if hasattr(out, "dict"):
+            out = out.dict()
+        return out if isinstance(out, dict) else {}
+
+    seat = first
+    turn = 0
+    while turn < MAX_TURNS:
+        turn += 1
+        g.start_turn(seat)
+        winner = _winner(g, seat)
+        if winner is not False:
+            return {"winner": winner, "turns": turn, "invalid": g.invalid}
+        _attack_phase(g, seat, ask(seat, g.state(seat, "attack", game_id)), ask, game_id)
+        winner = _winner(g, seat)
+        if winner is not False:
+            return {"winner": winner, "turns": turn, "invalid": g.invalid}
+        seat = 1 - seat
+    return {"winner": None, "turns": turn, "invalid": g.invalid}
+
+
+def _winner(g: Game, seat: int):
+    """決着していれば勝者の seat（相打ちは None）、続行なら False。"""
+    alive = []
+    for p in g.players:
+        if p.hp <= 0 and "太陽のお守り" in [r.name for r in p.hand]:
+            p.hand.remove(next(r for r in p.hand if r.name == "太陽のお守り"))
+            p.hp = 10
+        alive.append(p.hp > 0)
+    if all(alive):
+        return False
+    if not any(alive):
+        return None
+    return 0 if alive[0] else 1
+
+
+def _attack_phase(g: Game, seat: int, action: dict, ask, game_id: str):
+    me, enemy = g.players[seat], g.players[1 - seat]
+    atype = action.get("type")
+    if atype in (None, "none", "attack-pass"):
+        return
+    idx = g._pick(me, action.get("cardIndices") or [])
+    if not idx:
+        g.invalid[seat] += 1
+        return
+    recs = [me.hand[i] for i in idx]
+    names = [r.name for r in recs]
+
+    if "売る" in names:
+        if len(recs) != 2 or names[0] != "売る":
+            g.invalid[seat] += 1
+            return
+        target = recs[1]
+        d = _ask_defense(g, 1 - seat, recs, "無", "sell", ask, game_id)
+        g._discard(me, idx, keep_miracles=False)
+        payer, payee = (me, enemy) if d[1] else (enemy, me)
+        payee.gold = _clamp(payee.gold + g._pay(payer, target.price or 0))
+        if len(payer.hand) < HAND_MAX:
+            payer.hand.append(target)
+        return
+
+    if names == ["買う"]:
+        g._discard(me, idx, keep_miracles=False)
+        if not enemy.hand:
+            return
+        cand_i = g.rng.randrange(len(enemy.hand))
+        cand = enemy.hand[cand_i]
+        choice = ask(seat, g.state(seat, "buy_choice", game_id, buy=cand))
+        price = cand.price or 0
+        if choice.get("buy") == 1 and me.gold >= price and len(me.hand) < HAND_MAX:
+            me.gold -= price
+            enemy.gold = _clamp(enemy.gold + price)
+            me.hand.append(enemy.hand.pop(cand_i))
+        return
+
+    if names == ["両替"]:
+        plan = action.get("exchange") or {}
+        vals = [plan.get(k) for k in ("hp", "mp", "gold")]
+        total = me.hp + me.mp + me.gold
+        if (all(isinstance(v, int) and 0 <= v <= STAT_MAX for v in vals)
+                and vals[0] >= 1 and sum(vals) == total):
+            me.hp, me.mp, me.gold = vals
+            g._discard(me, idx, keep_miracles=False)
+        else:
+            g.invalid[seat] += 1
+        return
+
+    # 回復・自分向けの奇跡（単独 or 回復同士）
+    if all(r.category == "heal" for r in recs) or (len(recs) == 1 and recs[0].category == "miracle"
+                                                   and recs[0].attack == 0):
+        _use_support(g, seat, recs, idx, action.get("target"), ask, game_id)
+        return
+
+    if not g._valid_attack(me, recs):
+        g.invalid[seat] += 1
+        return
+    views = [CardView(i, r.name, _card_text(r)[0], "", True) for i, r in zip(idx, recs)]
+    damage, hit, elems, forced, risk, cost = 0, 1.0, [], "", 0.0, 0
+    for v, r in zip(views, recs):
+        atk, h = card_attack(v, r, me.mp)
+        damage += atk
+        hit = min(hit, h)
+        elems.append(r.element)
+        forced = r.forced_element or forced
+        risk = max(risk, r.self_risk)
+        cost += me.mp if r.solo_only and r.attack == 0 else r.mp_cost
+    element = combine_elements(elems, forced)
+    me.mp -= cost
+    for r in recs:
+        if r.category == "miracle" and r.name not in me.seen_miracles:
+            me.seen_miracles.append(r.name)
+    g._discard(me, idx)
+
+    shield, mirror, wall = _ask_defense(g, 1 - seat, recs, element, "attack", ask, game_id)
+    if wall or g.rng.random() >= hit:
+        return
+    target = me if mirror or (0 < risk < 1.0 and g.rng.random() < risk) else enemy
+    loss = max(0, damage - (0 if mirror else shield))
+    if element == "闇" and loss > 0:
+        loss = max(loss, target.hp)
+    target.hp -= loss
+    if loss <= 0:
+        return
+    if risk >= 1.0 and target is enemy:
+        me.hp -= loss  # 邪神の大剣
+    for r in recs:
+        desc = _desc(r)
+        if "吸収" in desc and target is enemy:
+            me.hp = _clamp(me.hp + loss)
+        m = _on_damage_re.search(desc)
+        if m:
+            g._grant(target, m.group(1))
+
+
+def _use_support(g: Game, seat: int, recs, idx, target_side, ask, game_id: str):
+    me, enemy = g.players[seat], g.players[1 - seat]
+    if any(r.category == "miracle" for r in recs):
+        r = recs[0]
+        if r.name in INERT_MIRACLES or r.name == "壁" or r.mp_cost > me.mp:
+            g.invalid[seat] += 1
+            return
+        me.mp -= r.mp_cost
+        if r.name not in me.seen_miracles:
+            me.seen_miracles.append(r.name)
+    g._discard(me, idx)
+    for r in recs:
+        desc = _desc(r)
+        grant = _grant_re.search(desc)
+        if grant and r.category == "miracle":
+            # 相手に付与する奇跡はミラーではね返されうる
+            _, mirror, _ = _ask_defense(g, 1 - seat, [r], "特殊", "status", ask, game_id)
+            g._grant(me if mirror else enemy, grant.group(1))
+            continue
+        who = enemy if (target_side == "enemy" and r.name == "天国草") else me
+        m = _hp_plus_re.search(desc)
+        if m:
+            who.hp = _clamp(who.hp + int(m.group(1)))
+        m = _mp_plus_re.search(desc)
+        if m:
+            who.mp = _clamp(who.mp + int(m.group(1)))
+        m = _gold_re.search(desc)
+        if m:
+            who.gold = _clamp(who.gold + int(m.group(1)))
+        if "天国病" in desc:
+            g._grant(who, "天国病")
+        g._cure(who, desc)
+
+
+def _ask_defense(g: Game, seat: int, incoming, element: str, hostile: str, ask, game_id: str):
+    state = g.state(seat, "defense", game_id, incoming=incoming, element=element, hostile=hostile)
+    return g.defend(seat, ask(seat, state), list(incoming), element, hostile)
+
+
+# ================== 方策 ==================
+
+_INDEX: Optional[CardIndex] = None
+POLICY_RNG = random.Random(0)
+
+
+def card_index() -> CardIndex:
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = CardIndex.load(CARD_DB_PATH)
+    return _INDEX
+
+
+def card_views(cards: Sequence[dict]) -> List[CardView]:
+    return [CardView(c["index"], c["name"], c.get("overlay") or "", c.get("raw_text") or "",
+                     c.get("usable")) for c in cards]
+
+
+def random_policy(state: dict) -> dict:
+    """合法手から一様に選ぶ（下限の基準用）。"""
+    index = card_index()
+    hand = card_views(state["hand"])
+    if state["phase"] == "attack":
+        opts = attack_options(hand, state["me"]["mp"], index)
+        pick = POLICY_RNG.randrange(len(opts) + 1)
+        if pick == len(opts):
+            return {"type": "attack-pass", "cardIndices": []}
+        return {"type": "attack", "cardIndices": list(opts[pick].indices)}
+    if state["phase"] == "defense":
+        opts = defense_options(hand, card_views(state["incomingCards"]), state["me"]["hp"],
+                               state["me"]["mp"], index)
+        o = POLICY_RNG.choice(opts)
+        return {"type": "defend" if o.indices else "defense-pass", "cardIndices": list(o.indices)}
+    return {"type": "buy_choice", "buy": POLICY_RNG.randrange(2)}
+
+
+def greedy_policy(state: dict) -> dict:
+    """ソルバーの最善案 + 単純な回復・売り殺し・買う。"""
+    index = card_index()
+    me, enemy = state["me"], state["enemy"]
+    hand = card_views(state["hand"])
+    if state["phase"] == "defense":
+        opts = defense_options(hand, card_views(state["incomingCards"]), me["hp"], me["mp"], index, 1)
+        o = opts[0]
+        return {"type": "defend" if o.indices else "defense-pass", "cardIndices": list(o.indices)}
+    if state["phase"] == "buy_choice":
+        rec = index.lookup(state["buyCandidate"]["name"])
+        price = rec.price if rec and rec.price is not None else 0
+        return {"type": "buy_choice", "buy": 1 if me["gold"] >= price + 5 else 0}
+
+    by_name = {}
+    for c in hand:
+        by_name.setdefault(c.name, c.index)
+    if "売る" in by_name:
+        total = enemy["hp"] + enemy["mp"] + enemy["gold"]
+        for c in hand:
+            rec = index.lookup(c.name)
+            if c.name != "売る" and rec and rec.price is not None and rec.price >= total:
+                return {"type": "sell", "cardIndices": [by_name["売る"], c.index]}
+    if me["hp"] < 15:
+        for c in hand:
+            rec = index.lookup(c.name)
+            if rec and rec.category == "heal" and "+HP" in (rec.info.get("description") or ""):
+                return {"type": "attack", "cardIndices": [c.index]}
+    opts = attack_options(hand, me["mp"], index, 1)
+    if opts and opts[0].score > 0:
+        return {"type": "attack", "cardIndices": list(opts[0].indices)}
+    if "買う" in by_name and me["gold"] >= 10:
+        return {"type": "buy", "cardIndices": [by_name["買う"]]}
+    return {"type": "attack-pass", "cardIndices": []}
+
+
+def _rule_policy() -> Callable[[dict], dict]:
+    import server
+
+    def rule(state: dict) -> dict:
+        return server.decide_rule_based(server.GFState(**state)).dict()
+    return rule
+
+
+BUILTIN_POLICIES = {"random": lambda: random_policy, "greedy": lambda: greedy_policy,
+                    "rule": _rule_policy}
+
+
+def load_policy(spec: str) -> Callable[[dict], Any]:
+    """"random" / "greedy" / "rule" / "module:func"（state dict -> Action 相当）。"""
+    if spec in BUILTIN_POLICIES:
+        return BUILTIN_POLICIES[spec]()
+    mod, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"unknown policy {spec!r} (use random/greedy/rule or module:func)")
+    return getattr(importlib.import_module(mod), attr)
+
+
+def build_deck(index: CardIndex) -> List[CardRecord]:
+    return [r for r in index.records.values()
+            if r.category in ("weapon", "armor", "miracle", "heal", "trade") or r.name in EXTRA_DECK]
+
+
+# ================== 並列実行 ==================
+
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(specs: Sequence[str], quiet: bool):
+    if quiet:
+        sys.stdout = open(os.devnull, "w")  # server 側の print を黙らせる
+    _WORKER["policies"] = [load_policy(s) for s in specs]
+    _WORKER["deck"] = build_deck(card_index())
+
+
+def _play_chunk(args) -> dict:
+    start, count, seed = args
+    policies, deck = _WORKER["policies"], _WORKER["deck"]
+    out = {"wins": [0, 0, 0], "turns": [], "times": ([], []), "invalid": [0, 0]}
+    for n in range(start, start + count):
+        game_seed = seed * 1_000_003 + n
+        POLICY_RNG.seed(game_seed)
+        # 先攻は交互。seat 0 が常に方策 A
+        r = play_game(policies, deck, game_seed, first=n % 2, game_id=f"sim{n}",
+                      timings=out["times"])
+        out["wins"][2 if r["winner"] is None else r["winner"]] += 1
+        out["turns"].append(r["turns"])
+        out["invalid"][0] += r["invalid"][0]
+        out["invalid"][1] += r["invalid"][1]
+    return out
+
+
+def _timing_summary(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    xs = sorted(samples)
+
+    def pct(q):
+        return round(xs[min(len(xs) - 1, max(0, math.ceil(q * len(xs)) - 1))] * 1e6, 1)
+
+    return {"count": len(xs), "mean_us": round(statistics.fmean(xs) * 1e6, 1),
+            "p50_us": pct(0.50), "p95_us": pct(0.95), "p99_us": pct(0.99)}
+
+
+def run_match(a: str, b: str, games: int, workers: int = 1, seed: int = 0,
+              quiet: bool = True) -> dict:
+    workers = max(1, workers)
+    chunk = max(1, min(200, math.ceil(games / (workers * 4))))
+    tasks = [(s, min(chunk, games - s), seed) for s in range(0, games, chunk)]
+    t0 = time.perf_counter()
+    if workers == 1:
+        sink = open(os.devnull, "w") if quiet else None
+        with contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext():
+            _init_worker((a, b), quiet=False)
+            parts = [_play_chunk(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=((a, b), quiet)) as ex:
+            parts = list(ex.map(_play_chunk, tasks))
+    wall = time.perf_counter() - t0
+
+    wins, turns, times, invalid = [0, 0, 0], [], ([], []), [0, 0]
+    for p in parts:
+        for i in range(3):
+            wins[i] += p["wins"][i]
+        turns.extend(p["turns"])
+        times[0].extend(p["times"][0])
+        times[1].extend(p["times"][1])
+        invalid[0] += p["invalid"][0]
+        invalid[1] += p["invalid"][1]
+    n = max(1, games)
+    return {
+        "policies": {"a": a, "b": b},
+        "games": games,
+        "workers": workers,
+        "seed": seed,
+        "wall_sec": round(wall, 3),
+        "games_per_sec": round(games / wall, 1) if wall > 0 else None,
+        "win_rate": {"a": round(wins[0] / n, 4), "b": round(wins[1] / n, 4),
+                     "draw": round(wins[2] / n, 4)},
+        "avg_turns": round(statistics.fmean(turns), 2) if turns else 0,
+        "decisions": {"a": _timing_summary(times[0]), "b": _timing_summary(times[1])},
+        "invalid_actions": {"a": invalid[0], "b": invalid[1]},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--a", default="rule", help="方策A: random / greedy / rule / module:func")
+    ap.add_argument("--b", default="greedy", help="方策B")
+    ap.add_argument("--games", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=None, help="結果 JSON の保存先")
+    ap.add_argument("--verbose", action="store_true", help="方策側の print を抑制しない")
+    args = ap.parse_args(argv)
+
+    r = run_match(args.a, args.b, args.games, args.workers, args.seed, quiet=not args.verbose)
+    print(f"[GF SIM] {r['policies']['a']} vs {r['policies']['b']}: {r['games']} games in "
+          f"{r['wall_sec']}s ({r['games_per_sec']}/s, {r['workers']} workers), avg {r['avg_turns']} turns")
+    print(f"  win rate  a {r['win_rate']['a']:.1%}  b {r['win_rate']['b']:.1%}  draw {r['win_rate']['draw']:.1%}")
+    for side in ("a", "b"):
+        d = r["decisions"][side]
+        if d["count"]:
+            print(f"  {side} decisions n={d['count']} p50 {d['p50_us']}us p95 {d['p95_us']}us "
+                  f"p99 {d['p99_us']}us, invalid {r['invalid_actions'][side]}")
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(r, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[GF SIM] saved {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
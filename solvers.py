@@ -0,0 +1,437 @@
+"""
+手札のローカル探索ソルバー。
+
+手札は高々十数枚なので、ルール上合法な組み合わせを全列挙して評価できる。
+server の pydantic モデルには依存せず、index / name / overlay / raw_text / usable
+を持つオブジェクトなら何でも受け付ける（シミュレータやベンチからも使うため）。
+"""
+from typing import NamedTuple, Optional, Sequence
+import re
+
+from card_index import CardIndex, CardRecord, UNKNOWN_CARD
+
+_main_atk_re = re.compile(r"^攻(\d+)")
+_prob_atk_re = re.compile(r"(\d+)%攻(\d+)")
+_plus_atk_re = re.compile(r"^\+攻|攻\+")
+_any_atk_re = re.compile(r"攻\+?(\d+)")
+
+# ================== 属性 ==================
+
+ELEMENTS = ("無", "火", "水", "木", "土", "光", "闇", "特殊")
+_ELEMENT_BIT = {e: 1 << i for i, e in enumerate(ELEMENTS)}
+_BASIC4 = ("火", "水", "木", "土")
+
+# 攻撃属性 → その攻撃を防げる防具属性（system_core.txt A-2 準拠）
+_BLOCKABLE_BY = {
+    "無": frozenset(ELEMENTS),
+    "闇": frozenset(ELEMENTS),
+    "火": frozenset(("水", "光")),
+    "水": frozenset(("火", "光")),
+    "木": frozenset(("土", "光")),
+    "土": frozenset(("木", "光")),
+    "光": frozenset(),
+    "特殊": frozenset(),
+}
+
+# 期待ダメージに掛ける「通りやすさ」の重み。光は防具で止まらず、闇は1点で即死。
+ELEMENT_WEIGHT = {"闇": 1.5, "光": 1.3, "火": 1.1, "水": 1.1, "木": 1.1, "土": 1.1,
+                  "無": 1.0, "特殊": 1.0}
+
+
+def combine_elements(elements: Sequence[str], forced: str = "") -> str:
+    """同時使用した神器の最終攻撃属性。"""
+    if forced:
+        return forced
+    s = set(elements)
+    if len(s) == 1:
+        return next(iter(s))
+    if "光" in s:
+        rest = s - {"光"}
+        if len(rest) == 1 and next(iter(rest)) in _BASIC4:
+            return next(iter(rest))
+    return "無"
+
+
+# 属性ビット集合 → 最終属性 の表（列挙中に毎回 set を作らないため）
+_COMBINED = [
+    combine_elements([e for e in ELEMENTS if m & _ELEMENT_BIT[e]]) if m else "無"
+    for m in range(1 << len(ELEMENTS))
+]
+
+
+def armor_blocks(attack_element: str, armor_element: str) -> bool:
+    return armor_element in _BLOCKABLE_BY.get(attack_element, frozenset())
+
+
+# ================== 攻撃 ==================
+
+def classify_attack_card(overlay: str, rec: CardRecord) -> str:
+    """
+    攻撃カードの種類判定 (DB優先版)
+    ★DBが武器/奇跡でなければ強制的にother（攻撃不可）扱いにする
+    """
+    # other / plus / prob は DB だけで決まる（CardIndex で事前計算済み）
+    if rec.attack_class != "main":
+        return rec.attack_class
+
+    if not overlay:
+        return "main"
+    if _prob_atk_re.search(overlay):
+        return "prob"
+    if _plus_atk_re.search(overlay):
+        return "plus"
+    if _main_atk_re.search(overlay):
+        return "main"
+
+    return "main"
+
+
+def card_attack(card, rec: CardRecord, mp: int) -> tuple[int, float]:
+    """(命中時の攻撃力, 命中率)。overlay の現在値を優先し、無ければ DB 値。"""
+    overlay = card.overlay or ""
+    m = _prob_atk_re.search(overlay)
+    if m:
+        return int(m.group(2)), int(m.group(1)) / 100
+    if rec.solo_only and rec.attack == 0:
+        return mp * 2, rec.hit_rate  # マジカルステッキ: MPをすべて消費して2倍
+    m = _any_atk_re.search(overlay)
+    if m:
+        return int(m.group(1)), rec.hit_rate
+    return rec.attack, rec.hit_rate
+
+
+class AttackOption(NamedTuple):
+    indices: tuple
+    damage: int          # 命中時の合計ダメージ
+    hit_rate: float
+    expected: float      # 相手への期待ダメージ
+    self_damage: float   # 自分への期待ダメージ（キネ / 邪神の大剣）
+    element: str
+    mp_cost: int
+    score: float
+
+    def as_dict(self) -> dict:
+        return {
+            "cardIndices": list(self.indices),
+            "damage": self.damage,
+            "hit_rate": self.hit_rate,
+            "expected_damage": round(self.expected, 2),
+            "element": self.element,
+            "mp_cost": self.mp_cost,
+        }
+
+
+def _option(indices, damage, hit, risk, elem, cost) -> AttackOption:
+    # risk<1 はダメージの行き先が確率で自分になる（キネ）、risk=1 は反動（邪神の大剣）
+    enemy_share = 1.0 - risk if risk < 1.0 else 1.0
+    expected = damage * hit * enemy_share
+    self_damage = damage * hit * risk
+    score = expected * ELEMENT_WEIGHT.get(elem, 1.0) - self_damage
+    return AttackOption(indices, damage, hit, expected, self_damage, elem, cost, score)
+
+
+def attack_options(hand: Sequence, mp: int, index: CardIndex,
+                   top_k: Optional[int] = None) -> list[AttackOption]:
+    """
+    攻撃フェーズの合法コンボを全列挙して score 降順で返す。
+    ルールは sanitize_strict_rules と同じ:
+      - メイン/確率武器は高々1枚、確率武器には +攻 を足せない
+      - 単体不可は単体不可以外のカードと一緒のときだけ（usable:false でも可）
+      - MP 合計が手持ち以内、単体専用カードは単独のみ
+      - あぶないウス所持中はあぶないキネを使わない
+    """
+    has_usu = any(c.name == "あぶないウス" for c in hand)
+    mains, pluses, options = [], [], []
+    for c in hand:
+        rec = index.lookup(c.name) or UNKNOWN_CARD
+        kind = classify_attack_card(c.overlay or "", rec)
+        if kind == "other":
+            continue
+        if c.usable is False and not rec.single_forbidden:
+            continue
+        if has_usu and c.name == "あぶないキネ":
+            continue
+        atk, hit = card_attack(c, rec, mp)
+        if atk <= 0:
+            continue
+        if rec.solo_only:
+            if c.usable is not False:
+                options.append(_option((c.index,), atk, hit, rec.self_risk, rec.element, mp))
+            continue
+        item = (c.index, atk, hit, rec.element, rec.mp_cost, rec)
+        (pluses if kind == "plus" else mains).append((kind, item))
+
+    # +攻 部分集合の累積値をビットDPで一度だけ作る
+    P = len(pluses)
+    n_masks = 1 << P
+    p_idx = [()] * n_masks
+    p_atk = [0] * n_masks
+    p_cost = [0] * n_masks
+    p_elem = [0] * n_masks
+    p_forced = [""] * n_masks
+    p_standalone = [False] * n_masks
+    p_risk = [0.0] * n_masks
+    p_ok = [True] * n_masks
+    for m in range(1, n_masks):
+        low = m & -m
+        b = low.bit_length() - 1
+        rest = m ^ low
+        _, (idx, atk, hit, elem, cost, rec) = pluses[b]
+        p_idx[m] = p_idx[rest] + (idx,)
+        p_atk[m] = p_atk[rest] + atk
+        p_cost[m] = p_cost[rest] + cost
+        p_elem[m] = p_elem[rest] | _ELEMENT_BIT.get(elem, 1)
+        p_standalone[m] = p_standalone[rest] or not rec.single_forbidden
+        p_risk[m] = max(p_risk[rest], rec.self_risk)
+        forced = p_forced[rest]
+        if rec.forced_element:
+            # 発火のワンドと魔水のワンドは同時に使わない
+            p_ok[m] = p_ok[rest] and not (forced and forced != rec.forced_element)
+            forced = rec.forced_element
+        else:
+            p_ok[m] = p_ok[rest]
+        p_forced[m] = forced
+
+    main_choices = [None] + mains
+    for main in main_choices:
+        if main is None:
+            m_atk, m_hit, m_elem, m_cost, m_sa, m_risk, m_idx = 0, 1.0, 0, 0, False, 0.0, ()
+            masks = range(1, n_masks)
+        else:
+            kind, (idx, atk, hit, elem, cost, rec) = main
+            m_atk, m_hit, m_cost = atk, hit, cost
+            m_elem = _ELEMENT_BIT.get(elem, 1)
+            m_sa, m_risk, m_idx = not rec.single_forbidden, rec.self_risk, (idx,)
+            masks = range(1) if kind == "prob" else range(n_masks)
+        for m in masks:
+            cost = m_cost + p_cost[m]
+            if cost > mp or not p_ok[m]:
+                continue
+            if not (m_sa or p_standalone[m]):
+                continue
+            elem = p_forced[m] or _COMBINED[m_elem | p_elem[m]]
+            options.append(_option(m_idx + p_idx[m], m_atk + p_atk[m], m_hit,
+                                   max(m_risk, p_risk[m]), elem, cost))
+
+    options.sort(key=lambda o: (-o.score, o.mp_cost, len(o.indices)))
+    return options[:top_k] if top_k else options
+
+
+def dominant_option(options: Sequence[AttackOption], ratio: float = 2.0) -> Optional[AttackOption]:
+    """1位が2位を ratio 倍以上引き離していれば返す（LLM を省略してよい目安）。"""
+    if not options or options[0].score <= 0:
+        return None
+    if len(options) == 1 or options[0].score >= ratio * max(options[1].score, 0.0):
+        return options[0]
+    return None
+
+
+# ================== 防御 ==================
+
+_shield_re = re.compile(r"守(\d+)")
+
+
+class IncomingAttack(NamedTuple):
+    damage: int
+    hit_rate: float
+    element: str
+
+
+def incoming_attack(cards: Sequence, index: CardIndex) -> IncomingAttack:
+    """相手が出したカード群を1回の攻撃としてまとめる。"""
+    damage, hit, elems, forced = 0, 1.0, [], ""
+    for c in cards:
+        rec = index.lookup(c.name) or UNKNOWN_CARD
+        atk, h = card_attack(c, rec, 0)
+        if atk <= 0:
+            continue
+        damage += atk
+        hit = min(hit, h)
+        elems.append(rec.element)
+        forced = rec.forced_element or forced
+    return IncomingAttack(damage, hit, combine_elements(elems, forced) if elems else "無")
+
+
+class DefenseOption(NamedTuple):
+    indices: tuple
+    shield: int
+    loss: int             # 命中したときのHP減少
+    expected_loss: float
+    lethal_prob: float
+    mp_cost: int
+
+    def as_dict(self) -> dict:
+        return {
+            "cardIndices": list(self.indices),
+            "shield": self.shield,
+            "expected_hp_loss": round(self.expected_loss, 2),
+            "lethal_prob": round(self.lethal_prob, 3),
+            "mp_cost": self.mp_cost,
+        }
+
+
+def card_shield(card, rec: CardRecord) -> int:
+    m = _shield_re.search(card.overlay or "")
+    return int(m.group(1)) if m else rec.defense
+
+
+def defense_options(hand: Sequence, incoming: Sequence, hp: int, mp: int, index: CardIndex,
+                    top_k: Optional[int] = None) -> list[DefenseOption]:
+    """
+    受ける攻撃に対する防御カード集合を全列挙し、被害の少ない順に返す。
+      - usable:true の防具は相性○（クライアント側で判定済み）
+      - 虹のカーテンを1枚目に使うと攻撃が無属性になり、usable:false の防具も有効
+      - スーパーミラーは無条件ではね返す、壁は無属性攻撃を止める
+      - 闇属性は1点でも通れば即死
+    空集合（defense-pass）も必ず候補に含む。
+    """
+    atk = incoming_attack(incoming, index)
+    cands = []  # (index, shield, cost, usable, tag)
+    for c in hand:
+        rec = index.lookup(c.name) or UNKNOWN_CARD
+        if c.name == "虹のカーテン":
+            tag = "rainbow"
+        elif c.name == "スーパーミラー":
+            tag = "mirror"
+        elif c.name == "壁":
+            tag = "wall"
+        elif rec.category in ("armor", "weapon") and card_shield(c, rec) > 0:
+            tag = ""
+        else:
+            continue
+        if tag and c.usable is False:
+            continue
+        cands.append((c.index, card_shield(c, rec) if not tag else 0, rec.mp_cost,
+                      c.usable is not False, tag))
+
+    def outcome(shield: int, elem: str, blocked: bool) -> tuple[int, float, float]:
+        if blocked or atk.damage <= 0:
+            return 0, 0.0, 0.0
+        loss = max(0, atk.damage - shield)
+        if elem == "闇" and loss > 0:
+            loss = max(loss, hp)
+        lethal = atk.hit_rate if loss >= hp else 0.0
+        return loss, loss * atk.hit_rate, lethal
+
+    # 部分集合ごとの合計をビットDPで作る（flags: 1=虹, 2=ミラー, 4=壁, 8=usable:false を含む）
+    _FLAG = {"rainbow": 1, "mirror": 2, "wall": 4}
+    n = len(cands)
+    n_masks = 1 << n
+    d_idx = [()] * n_masks
+    d_shield = [0] * n_masks
+    d_cost = [0] * n_masks
+    d_flags = [0] * n_masks
+    for m in range(1, n_masks):
+        low = m & -m
+        rest = m ^ low
+        idx, shield, cost, usable, tag = cands[low.bit_length() - 1]
+        # 虹のカーテンは1枚目
+        d_idx[m] = (idx,) + d_idx[rest] if tag == "rainbow" else d_idx[rest] + (idx,)
+        d_shield[m] = d_shield[rest] + shield
+        d_cost[m] = d_cost[rest] + cost
+        d_flags[m] = d_flags[rest] | _FLAG.get(tag, 0) | (0 if usable else 8)
+
+    options = []
+    for m in range(n_masks):
+        cost = d_cost[m]
+        if cost > mp:
+            continue
+        flags = d_flags[m]
+        rainbow = flags & 1
+        if flags & 8 and not rainbow:
+            continue
+        if rainbow and m & (m - 1) == 0:
+            continue  # 虹単体では何も防げない
+        elem = "無" if rainbow else atk.element
+        blocked = bool(flags & 2) or (bool(flags & 4) and elem == "無")
+        loss, expected, lethal = outcome(d_shield[m], elem, blocked)
+        options.append(DefenseOption(d_idx[m], d_shield[m], loss, expected, lethal, cost))
+
+    # 死なない > 期待被害が小さい > 使う枚数・防御力・MP が少ない（良い防具を温存）
+    options.sort(key=lambda o: (o.lethal_prob, o.expected_loss, len(o.indices), o.shield, o.mp_cost))
+    return options[:top_k] if top_k else options
+
+
+def evaluate_defense(indices: Sequence[int], options: Sequence[DefenseOption]) -> Optional[DefenseOption]:
+    """LLM の防御案を列挙結果と突き合わせる（合法でなければ None）。"""
+    key = set(indices)
+    for o in options:
+        if set(o.indices) == key:
+            return o
+    return None
+
+
+# ================== 両替 ==================
+# 両替は (hp + mp + gold) の合計を保ったまま配分し直す。優先順位は user_attack.txt B-3 準拠:
+#   1. HP の下限（最低15、次の相手ターンの脅威より上）
+#   2. 手札で一番重い MP コストのカードを撃てるだけの MP
+#   3. HP を目安(50)まで
+#   4. 「買う」があれば gold を少し（10 まで）、無ければ 0
+#   5. 余りは MP → HP の順（gold には振らない）
+
+STAT_MAX = 99
+EXCHANGE_HP_MIN = 15
+EXCHANGE_HP_HARD_MIN = 11
+EXCHANGE_HP_TARGET = 50
+EXCHANGE_GOLD_MAX = 10
+
+
+class ExchangeTarget(NamedTuple):
+    hp: int
+    mp: int
+    gold: int
+    hp_min: int      # 満たせるなら必ず満たす HP
+    mp_need: int
+    gold_need: int
+
+    def as_dict(self) -> dict:
+        return {"hp": self.hp, "mp": self.mp, "gold": self.gold,
+                "hp_min": self.hp_min, "mp_need": self.mp_need}
+
+
+def exchange_needs(hand: Sequence, index: CardIndex) -> tuple[int, int]:
+    """(手札で必要な MP, 残したい gold)。両替自身は数えない。"""
+    mp_need, gold_need = 0, 0
+    for c in hand:
+        if c.name == "両替":
+            continue
+        rec = index.lookup(c.name) or UNKNOWN_CARD
+        mp_need = max(mp_need, rec.mp_cost)
+        if c.name == "買う":
+            gold_need = EXCHANGE_GOLD_MAX
+    return min(mp_need, STAT_MAX), gold_need
+
+
+def best_exchange(hp: int, mp: int, gold: int, hand: Sequence, index: CardIndex,
+                  threat: int = 0) -> ExchangeTarget:
+    """現在値・手札・脅威の目安から両替後の hp/mp/gold を決める（同じ入力なら同じ答え）。"""
+    left = max(0, hp) + max(0, mp) + max(0, gold)
+    mp_need, gold_need = exchange_needs(hand, index)
+    hp_min = max(EXCHANGE_HP_MIN, threat + 1)
+
+    def give(cur: int, want: int) -> int:
+        nonlocal left
+        add = max(0, min(STAT_MAX - cur, want - cur, left))
+        left -= add
+        return cur + add
+
+    h = give(0, hp_min)
+    m = give(0, mp_need)
+    h = give(h, max(EXCHANGE_HP_TARGET, hp_min))
+    g = give(0, gold_need)
+    m = give(m, STAT_MAX)
+    h = give(h, STAT_MAX)
+    g = give(g, STAT_MAX)
+    return ExchangeTarget(h, m, g, hp_min, mp_need, gold_need)
+
+
+def exchange_problems(hp: int, mp: int, gold: int, target: ExchangeTarget) -> list[str]:
+    """合計を合わせ済みの両替案が、best_exchange の制約のどれを破っているか。"""
+    out = []
+    if hp < min(target.hp_min, target.hp):
+        out.append(f"HP {hp} < {min(target.hp_min, target.hp)}")
+    if mp < min(target.mp_need, target.mp):
+        out.append(f"MP {mp} < {min(target.mp_need, target.mp)}")
+    if gold > max(EXCHANGE_GOLD_MAX, target.gold):
+        out.append(f"gold {gold} > {EXCHANGE_GOLD_MAX}")
+    return out
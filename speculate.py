@@ -0,0 +1,151 @@
+"""
+相手ターン中の先読み（投機的な判断）。
+
+行動できないフェーズの state が届いたら、次に来そうな行動フェーズの state を仮定して
+裏で判断を走らせておき、本番の要求はキーが一致すれば結果を引くだけにする。
+  - キーは呼び出し側が決める（判断に効くフィールドだけのハッシュ）
+  - base が変わった（手札や HP が動いた）セッションの先読みは捨ててキャンセルする
+  - 同時実行数と、トークンの使用量（1分あたり）で上限をかける
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import asyncio
+import time
+
+
+class TokenBucket:
+    """per_min トークン/分で補充され、最大 burst まで貯まるバケツ。"""
+
+    def __init__(self, per_min: float, burst: Optional[float] = None):
+        self.rate = per_min / 60.0
+        self.capacity = burst if burst is not None else per_min
+        self.tokens = self.capacity
+        self._t = time.monotonic()
+
+    def take(self, n: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+        if n > self.tokens:
+            return False
+        self.tokens -= n
+        return True
+
+
+Job = Tuple[str, float, Callable[[], Awaitable[Any]]]   # (key, 見積もりトークン, factory)
+
+
+class Speculator:
+    def __init__(self, tokens_per_min: float = 20000, max_inflight: int = 2,
+                 max_results: int = 256, ttl: float = 120.0, enabled: bool = True):
+        self.enabled = enabled
+        self.bucket = TokenBucket(tokens_per_min)
+        self.max_inflight = max(1, max_inflight)
+        self.max_results = max(1, max_results)
+        self.ttl = ttl
+        self._results: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, tuple[str, asyncio.Future]] = {}   # key -> (session, task)
+        self._base: Dict[str, Any] = {}
+        self.counts = dict.fromkeys(
+            ("scheduled", "done", "failed", "cancelled", "over_budget", "busy", "hits", "joined",
+             "misses"), 0)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def __contains__(self, key) -> bool:
+        return key in self._inflight or self._fresh(key) is not None
+
+    def schedule(self, session_id: str, base: Any, jobs: Iterable[Job]) -> int:
+        """base が前回と違えばそのセッションの先読みを捨ててから jobs を順に投入する。"""
+        if not self.enabled:
+            return 0
+        if self._base.get(session_id) != base:
+            self.cancel(session_id)
+            self._base[session_id] = base
+        started = 0
+        for key, cost, factory in jobs:
+            if key in self._inflight or self._fresh(key) is not None:
+                continue
+            if len(self._inflight) >= self.max_inflight:
+                self.counts["busy"] += 1
+                break
+            if not self.bucket.take(cost):
+                self.counts["over_budget"] += 1
+                break
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = (session_id, task)
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+            self.counts["scheduled"] += 1
+            started += 1
+        return started
+
+    def _finish(self, key: str, task: asyncio.Future):
+        item = self._inflight.get(key)
+        if item is not None and item[1] is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.counts["failed"] += 1
+            return
+        value = task.result()
+        if value is None:
+            self.counts["failed"] += 1
+            return
+        self.counts["done"] += 1
+        self._results[key] = (time.monotonic(), value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def _fresh(self, key: str) -> Optional[Any]:
+        item = self._results.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.ttl:
+            del self._results[key]
+            return None
+        return item[1]
+
+    def cancel(self, session_id: str, keep: Optional[str] = None) -> int:
+        """
+        そのセッションの走行中の先読みを止める（keep のキーだけ残す）。
+        base も忘れる（セッションが消えたときにも呼ばれるので、ここで消さないと溜まり続ける）。
+        """
+        self._base.pop(session_id, None)
+        n = 0
+        for key, (sid, task) in list(self._inflight.items()):
+            if sid == session_id and key != keep:
+                task.cancel()
+                self._inflight.pop(key, None)
+                n += 1
+        self.counts["cancelled"] += n
+        return n
+
+    async def lookup(self, key: str, timeout: float) -> Optional[Any]:
+        """先読み済みなら即返す。走行中なら timeout まで待って合流する。"""
+        value = self._fresh(key)
+        if value is not None:
+            self.counts["hits"] += 1
+            return value
+        item = self._inflight.get(key)
+        if item is None:
+            self.counts["misses"] += 1
+            return None
+        task = item[1]
+        try:
+            value = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise  # 待っている側がキャンセルされた
+            value = None
+        except Exception:
+            value = None  # タイムアウト / 先読みの失敗は普通に判断し直す
+        self.counts["joined" if value is not None else "misses"] += 1
+        return value
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "inflight": len(self._inflight),
+                "results": len(self._results), "tokens_left": int(self.bucket.tokens),
+                **self.counts}
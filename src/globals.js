@@ -30,4 +30,8 @@
   lastProgressAt: 0,
   forgiveLastSeenAt: 0,
   lastHoverEl: null, // last element we hovered for detail panel
+  // サーバ側の対戦セッションID（タブごとに1つ）
+  sessionId: `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`,
+  // ★ WebSocket で差分だけ送る（つながらなければ HTTP /decide）
+  useWebSocket: true,
 };
@@ -36,6 +36,7 @@ const pollingLoop = createPollingLoop({
   readState: stateReader.readState,
   shouldActNow: phaseGuards.shouldActNow,
   sendStateToServer: serverClient.sendStateToServer,
+  observeState: serverClient.observeState,
   maybeCheckMiracles: phaseGuards.maybeCheckMiracles,
   escapeDefensePass: () => actions.useCardIndices([], "defense"),
 });
@@ -4,6 +4,7 @@
   readState,
   shouldActNow,
   sendStateToServer,
+  observeState, // ★追加（任意）：行動しない tick の状態変化を送る
   maybeCheckMiracles,
   escapeDefensePass, // ★追加（任意）
 }) {
@@ -29,7 +30,8 @@
 
       const now = Date.now();
       const sig = stateSig(state);
-      if (sig !== globals.lastStateSig) {
+      const changed = sig !== globals.lastStateSig;
+      if (changed) {
         globals.lastStateSig = sig;
         globals.lastProgressAt = now;
       }
@@ -74,6 +76,8 @@
       // 通常処理
       if (shouldActNow(state)) {
         sendStateToServer(state);
+      } else if (changed && observeState) {
+        observeState(state);
       }
       maybeCheckMiracles(state);
 
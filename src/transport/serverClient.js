@@ -1,5 +1,10 @@
 ﻿import { globals } from "../globals.js";
 import * as logger from "../utils/logger.js";
+import { createWsClient } from "./wsClient.js";
+
+const SERVER_HTTP = "http://127.0.0.1:8000";
+const SERVER_WS = "ws://127.0.0.1:8000/ws";
+
 function stateSigForDefer(state) {
   if (!state) return "";
   if (state.phase === "buy_choice") {
@@ -19,6 +24,7 @@ function createServerClient({ rememberLastAttackSig, actions }) {
   function buildServerState(state) {
     return {
       phase: state.phase,
+      sessionId: globals.sessionId,
       me: state.me,
       enemy: state.enemy,
       hand: (state.hand || []).map((c) => ({
@@ -91,44 +97,48 @@ function createServerClient({ rememberLastAttackSig, actions }) {
     };
   }
 
-  function sendStateToServer(state) {
+  // サーバの返答を実行する（HTTP / WebSocket 共通）
+  function handleServerAction(ai, state) {
+    if (globals.isCheckingMiracles || globals.isDoingAction) {
+      const sig = stateSigForDefer(state);
+      globals.deferredAction = {
+        ai,
+        sig,
+        stateSnapshot: state,
+        createdAt: Date.now(),
+      };
+      logger.log("[GF AI] deferred server response", sig);
+      return;
+    }
+    logger.log("[GF AI SERVER RESPONSE]", ai);
+    const type = ai.type;
+    const indices = ai.cardIndices || [];
+    const target = ai.target || undefined;
+    if (type === "attack") {
+      rememberLastAttackSig(indices, state.hand);
+    }
+    if (type === "buy_choice") actions.handleBuyChoice(ai);
+    else if (type === "exchange")
+      actions.performRyougae(indices, state, ai.exchange);
+    else if (type === "sell") actions.performUru(indices, state);
+    else if (type === "buy") actions.performKau(indices, state);
+    else if (type === "attack" || type === "defend" || type === "shield")
+      actions.useCardIndices(indices, state.phase, target);
+    else if (type === "attack-pass" || type === "defense-pass")
+      actions.useCardIndices([], state.phase, target);
+  }
+
+  function sendHttp(state) {
     const payload = buildServerState(state);
     GM_xmlhttpRequest({
       method: "POST",
-      url: "http://127.0.0.1:8000/decide",
+      url: `${SERVER_HTTP}/decide`,
       headers: { "Content-Type": "application/json" },
       data: JSON.stringify(payload),
       onload: (response) => {
         try {
           const ai = JSON.parse(response.responseText);
-          // onload の try { const ai = ... } の直後あたりに追加
-          if (globals.isCheckingMiracles || globals.isDoingAction) {
-            const sig = stateSigForDefer(state);
-            globals.deferredAction = {
-              ai,
-              sig,
-              stateSnapshot: state,
-              createdAt: Date.now(),
-            };
-            logger.log("[GF AI] deferred server response", sig);
-            return;
-          }
-          logger.log("[GF AI SERVER RESPONSE]", ai);
-          const type = ai.type;
-          const indices = ai.cardIndices || [];
-          const target = ai.target || undefined;
-          if (type === "attack") {
-            rememberLastAttackSig(indices, state.hand);
-          }
-          if (type === "buy_choice") actions.handleBuyChoice(ai);
-          else if (type === "exchange")
-            actions.performRyougae(indices, state, ai.exchange);
-          else if (type === "sell") actions.performUru(indices, state);
-          else if (type === "buy") actions.performKau(indices, state);
-          else if (type === "attack" || type === "defend" || type === "shield")
-            actions.useCardIndices(indices, state.phase, target);
-          else if (type === "attack-pass" || type === "defense-pass")
-            actions.useCardIndices([], state.phase, target);
+          handleServerAction(ai, state);
         } catch (e) {
           logger.error("[GF AI CLIENT ERROR]", e);
         }
@@ -139,7 +149,47 @@ function createServerClient({ rememberLastAttackSig, actions }) {
     });
   }
 
-  return { sendStateToServer };
+  // ★ WebSocket: 返答待ちの state（seq -> state）。古いものは捨てる
+  const wsPending = new Map();
+  const WS_PENDING_MAX = 8;
+
+  function onWsMessage(msg) {
+    const state = wsPending.get(msg.seq);
+    if (!state) return;
+    wsPending.delete(msg.seq);
+    if (msg.action) {
+      handleServerAction(msg.action, state);
+    } else if (msg.resync && !msg.error) {
+      // 差分の基準がずれただけなので全体を送り直す
+      sendStateToServer(state);
+    } else {
+      logger.error("[GF AI WS SERVER ERROR]", msg.error);
+      sendHttp(state);
+    }
+  }
+
+  const wsClient = createWsClient({ url: SERVER_WS, onMessage: onWsMessage });
+
+  function sendStateToServer(state) {
+    if (globals.useWebSocket) {
+      const seq = wsClient.send(buildServerState(state), true);
+      if (seq !== null) {
+        wsPending.set(seq, state);
+        if (wsPending.size > WS_PENDING_MAX)
+          wsPending.delete(wsPending.keys().next().value);
+        return;
+      }
+    }
+    sendHttp(state);
+  }
+
+  // 行動しない tick でも状態が変わったら送っておく（サーバが先に考え始められる）。
+  // HTTP では送らない
+  function observeState(state) {
+    if (globals.useWebSocket) wsClient.send(buildServerState(state), false);
+  }
+
+  return { sendStateToServer, observeState };
 }
 
 export { createServerClient };
@@ -0,0 +1,102 @@
+﻿import * as logger from "../utils/logger.js";
+
+// ★ サーバとの常時接続。前回送った state から変わったトップレベルのフィールドだけを送る。
+//   初回・再接続後・サーバから resync を返された後は全体（full）を送る。
+//   つながっていない間は send() が null を返すので、呼び出し側は HTTP に切り替える。
+function createWsClient({ url, onMessage }) {
+  let ws = null;
+  let open = false;
+  let seq = 0;
+  let baseSeq = null;
+  let lastSent = null; // key -> JSON 文字列
+  let retryMs = 1000;
+  let retryAt = 0;
+
+  function connect() {
+    if (ws || Date.now() < retryAt) return;
+    try {
+      ws = new WebSocket(url);
+    } catch (e) {
+      // CSP などで張れない環境ではしばらく HTTP だけにする
+      logger.error("[GF AI WS] connect failed", e);
+      ws = null;
+      retryAt = Date.now() + 30000;
+      return;
+    }
+    ws.onopen = () => {
+      open = true;
+      retryMs = 1000;
+      resync();
+      logger.log("[GF AI WS] connected", url);
+    };
+    ws.onmessage = (ev) => {
+      let msg;
+      try {
+        msg = JSON.parse(ev.data);
+      } catch (e) {
+        logger.error("[GF AI WS] bad message", e);
+        return;
+      }
+      if (msg.resync) resync();
+      onMessage(msg);
+    };
+    ws.onclose = () => {
+      if (open) logger.log("[GF AI WS] closed");
+      ws = null;
+      open = false;
+      resync();
+      retryAt = Date.now() + retryMs;
+      retryMs = Math.min(retryMs * 2, 30000);
+    };
+    ws.onerror = () => {
+      // onclose が続けて呼ばれるのでそちらで片付ける
+    };
+  }
+
+  function resync() {
+    baseSeq = null;
+    lastSent = null;
+  }
+
+  function isOpen() {
+    connect();
+    return open;
+  }
+
+  // 送れたら seq、つながっていなければ null
+  function send(payload, act) {
+    if (!isOpen()) return null;
+    const cur = {};
+    for (const k of Object.keys(payload)) cur[k] = JSON.stringify(payload[k]);
+
+    seq += 1;
+    const msg = { seq, act };
+    if (lastSent === null || baseSeq === null) {
+      msg.full = payload;
+    } else {
+      const delta = {};
+      for (const k of Object.keys(cur)) {
+        if (cur[k] !== lastSent[k]) delta[k] = payload[k];
+      }
+      for (const k of Object.keys(lastSent)) {
+        if (!(k in cur)) delta[k] = null;
+      }
+      msg.base = baseSeq;
+      msg.delta = delta;
+    }
+    try {
+      ws.send(JSON.stringify(msg));
+    } catch (e) {
+      logger.error("[GF AI WS] send failed", e);
+      resync();
+      return null;
+    }
+    baseSeq = seq;
+    lastSent = cur;
+    return seq;
+  }
+
+  return { send, isOpen };
+}
+
+export { createWsClient };
@@ -0,0 +1,66 @@
+"""
+ストリーミング中の LLM 出力から、トップレベルの JSON フィールドを確定した順に取り出す。
+
+`{"type": "attack", "cardIndices": [1, 2], "reason": "...` の時点で
+type と cardIndices は確定しているので、reason の生成を待たずに使える。
+前後の ```json フェンスや前置きのテキストは読み飛ばす。
+"""
+from typing import Any, Dict
+import json
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+class IncrementalJSONObject:
+    def __init__(self):
+        self.buf = ""
+        self.fields: Dict[str, Any] = {}
+        self.closed = False  # 閉じ括弧まで読んだ
+        self._pos = -1       # 次に読むトップレベル位置（-1 は "{" 未発見）
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        self.buf += text
+        if not self.closed:
+            self._advance()
+        return self.fields
+
+    def _skip(self, pos: int, chars: str) -> int:
+        buf = self.buf
+        while pos < len(buf) and buf[pos] in chars:
+            pos += 1
+        return pos
+
+    def _advance(self):
+        buf = self.buf
+        if self._pos < 0:
+            start = buf.find("{")
+            if start < 0:
+                return
+            self._pos = start + 1
+        while True:
+            pos = self._skip(self._pos, _WS + ",")
+            if pos >= len(buf):
+                return
+            if buf[pos] == "}":
+                self.closed = True
+                return
+            try:
+                key, pos = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                return  # キー文字列がまだ途中
+            pos = self._skip(pos, _WS)
+            if pos >= len(buf) or buf[pos] != ":":
+                return
+            pos = self._skip(pos + 1, _WS)
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                return  # 値がまだ途中
+            # 数値は続きの桁("1" -> "12", "-1" -> "-1.5")が来うるので区切りを見るまで待つ
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if end >= len(buf) or buf[end] not in _WS + ",}":
+                    return
+            if isinstance(key, str):
+                self.fields[key] = value
+            self._pos = end
@@ -0,0 +1,41 @@
+"""
+trace_log の読み書き: ローテーションで増えた trace.jsonl.N / trace.jsonl.N.gz も読み戻せること。
+
+  python -m pytest -q test_trace_log.py
+"""
+import json
+
+import pytest
+
+from trace_log import TraceWriter, iter_records
+
+
+def _write(path, compress: bool, n: int = 40) -> list:
+    writer = TraceWriter(path, max_bytes=300, backups=50, compress=compress)
+    records = [{"kind": "decision", "i": i, "pad": "x" * 40} for i in range(n)]
+    for rec in records:
+        writer.write(rec)
+    writer.close()
+    return records
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_rotated_traces_read_back(tmp_path, compress):
+    path = tmp_path / "ai_trace.jsonl"
+    records = _write(path, compress)
+    rotated = sorted(p.name for p in tmp_path.iterdir() if p != path)
+    assert rotated, "max_bytes=300 なら必ずローテーションされる"
+    suffix = ".gz" if compress else ""
+    assert all(name.endswith(suffix) and name.split(".")[2].isdigit() for name in rotated)
+
+    got = [rec for f in tmp_path.iterdir() for rec in iter_records(f)]
+    assert sorted(r["i"] for r in got) == [r["i"] for r in records]
+
+
+def test_plain_json_files(tmp_path):
+    one = tmp_path / "state.json"
+    one.write_text(json.dumps({"phase": "attack"}), encoding="utf-8")
+    many = tmp_path / "states.json"
+    many.write_text(json.dumps([{"phase": "attack"}, {"phase": "defense"}]), encoding="utf-8")
+    assert list(iter_records(one)) == [{"phase": "attack"}]
+    assert [r["phase"] for r in iter_records(many)] == ["attack", "defense"]
@@ -0,0 +1,162 @@
+"""
+判断トレースの非同期 JSONL ライター。
+
+リクエスト側は record を queue に積むだけで、書き込み・ローテーション・圧縮は
+バックグラウンドスレッドが行う。キューが溢れたら record は捨ててカウントする
+（判断を遅らせるよりログを落とす方がマシ）。
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional
+import atexit
+import gzip
+import json
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+
+class TraceWriter:
+    def __init__(self, path: Path, max_bytes: int = 20 * 1024 * 1024,
+                 rotate_sec: float = 0, backups: int = 10, compress: bool = False,
+                 queue_size: int = 10000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.rotate_sec = rotate_sec
+        self.backups = backups
+        self.compress = compress
+        self.written = 0
+        self.dropped = 0
+        self._q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._fh = None
+        self._opened_at = 0.0
+
+    # ---------- request side ----------
+
+    def write(self, record: Dict[str, Any]):
+        if self._thread is None:
+            self._start()
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 2.0):
+        if self._thread is None:
+            return
+        try:
+            self._q.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="gf-trace-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # ---------- writer thread ----------
+
+    def _run(self):
+        while True:
+            rec = self._q.get()
+            if rec is None:
+                break
+            try:
+                line = json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+                self._maybe_rotate(len(line.encode("utf-8")))
+                self._fh.write(line)
+                self.written += 1
+                # 連続して積まれている間はまとめて flush する
+                if self._q.empty():
+                    self._fh.flush()
+            except Exception as e:
+                print(f"[LOG ERROR] {e}")
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _maybe_rotate(self, incoming: int):
+        if self._fh is None:
+            self._open()
+        too_big = self.max_bytes > 0 and self._fh.tell() + incoming > self.max_bytes
+        too_old = self.rotate_sec > 0 and time.time() - self._opened_at > self.rotate_sec
+        if (too_big or too_old) and self._fh.tell() > 0:
+            self._fh.close()
+            self._rotate_files()
+            self._open()
+
+    def _rotated_name(self, n: int) -> Path:
+        suffix = f".{n}.gz" if self.compress else f".{n}"
+        return self.path.with_name(self.path.name + suffix)
+
+    def _rotate_files(self):
+        # trace.jsonl -> trace.jsonl.1(.gz) -> trace.jsonl.2(.gz) ...
+        oldest = self._rotated_name(self.backups)
+        if oldest.exists():
+            oldest.unlink()
+        for n in range(self.backups - 1, 0, -1):
+            src = self._rotated_name(n)
+            if src.exists():
+                src.rename(self._rotated_name(n + 1))
+        if self.backups <= 0:
+            self.path.unlink()
+            return
+        if self.compress:
+            with open(self.path, "rb") as src, gzip.open(self._rotated_name(1), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            self.path.unlink()
+        else:
+            self.path.rename(self._rotated_name(1))
+
+
+def read_trace(path: Path):
+    """trace ファイル(.gz 可)から record を順に返す。オフライン解析用。"""
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# trace.jsonl / ローテーション済みの trace.jsonl.1 / trace.jsonl.1.gz
+_TRACE_NAME = re.compile(r"\.jsonl(\.\d+)?(\.gz)?$")
+
+
+def iter_records(path: Path):
+    """trace(.jsonl / .jsonl.N / .gz) なら1行ずつ、それ以外は JSON の配列/オブジェクトとして record を返す。"""
+    path = Path(path)
+    if _TRACE_NAME.search(path.name) or path.suffix == ".gz":
+        yield from read_trace(path)
+        return
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, list):
+        yield from data
+    else:
+        yield data
+
+
+def git_rev() -> Optional[str]:
+    """ベンチ/学習結果に残すコミット（git が無ければ None）。"""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=Path(__file__).parent, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None